@@ -0,0 +1,123 @@
+"""
+Benchmark for the Smart Selection comparison log representation.
+It compares the previous dict-per-comparison log (uuid, ISO timestamp and two model_dump() copies per entry)
+with the array-backed ComparisonLog on synthetic inputs, measuring peak memory while logging and
+serialization time on export.
+
+Usage:
+    python benchmarks/bench_comparison_log.py --cases 1000 --comparisons 10000 --output results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "selection"))
+
+from comparison_log import ComparisonLog
+
+
+# Create synthetic test cases in the model_dump() shape
+def make_cases(count, seed=0):
+    """ Returns `count` synthetic test case dictionaries. """
+    rng = random.Random(seed)
+    words = ["login", "session", "password", "upload", "report", "filter", "export", "task", "timeout", "invalid"]
+    return [
+        {
+            "ScenarioID": f"Process_Test_Scenario_{i // 10 + 1}",
+            "TestCaseID": f"TestCase_{i % 10 + 1}",
+            "Title": " ".join(rng.choices(words, k=5)).title(),
+            "Description": " ".join(rng.choices(words, k=60)),
+            "Objective": " ".join(rng.choices(words, k=12)),
+        }
+        for i in range(count)
+    ]
+
+
+# Create the (case, matched case, verdict) triples which are logged
+def make_comparisons(case_count, comparison_count, seed=0):
+    """ Returns random comparison triples between the synthetic cases. """
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(case_count), rng.randrange(case_count), rng.random() < 0.2)
+        for _ in range(comparison_count)
+    ]
+
+
+# Log the comparisons in the previous dict-per-comparison format
+def legacy_log(cases, comparisons):
+    logs = []
+    for step, (i, j, verdict) in enumerate(comparisons, start=1):
+        logs.append({
+            "Step": step,
+            "ProcessName": str(uuid.uuid4()),
+            "Timestamp": datetime.now().isoformat(),
+            "Case1": dict(cases[i]),
+            "Case2": dict(cases[j]),
+            "is_same": verdict,
+        })
+    return logs
+
+
+# Log the comparisons in the array-backed format
+def compact_log(cases, comparisons):
+    log = ComparisonLog(cases)
+    for i, j, verdict in comparisons:
+        log.append(i, j, verdict, latency=0.0)
+    return log
+
+
+# Measure the peak memory while logging and the time to serialize the log
+def measure(build, export, cases, comparisons):
+    tracemalloc.start()
+    started = time.perf_counter()
+    log = build(cases, comparisons)
+    build_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    payload = json.dumps(export(log))
+    serialize_seconds = time.perf_counter() - started
+
+    return {
+        "build_seconds": round(build_seconds, 4),
+        "peak_memory_bytes": peak,
+        "serialize_seconds": round(serialize_seconds, 4),
+        "serialized_bytes": len(payload),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the comparison log representations.")
+    parser.add_argument("--cases", type=int, default=1000, help="Number of synthetic test cases.")
+    parser.add_argument("--comparisons", type=int, default=10000, help="Number of logged comparisons.")
+    parser.add_argument("--output", help="Write the JSON results to this file.")
+    args = parser.parse_args()
+
+    cases = make_cases(args.cases)
+    comparisons = make_comparisons(args.cases, args.comparisons)
+
+    results = {
+        "benchmark": "comparison_log",
+        "cases": args.cases,
+        "comparisons": args.comparisons,
+        "legacy": measure(legacy_log, lambda log: log, cases, comparisons),
+        "compact": measure(compact_log, lambda log: log.to_dicts(), cases, comparisons),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Cold-start import benchmark for the generation and selection apps.
+Streamlit runs the app scripts in a fresh process, so every module the script imports at the top is loaded before the
+first page is drawn. This benchmark reads the top-level imports of each app script, imports them in a fresh interpreter
+with python -X importtime (without running the script itself) and parses the output into a report:
+- the total import time and the slowest modules by cumulative and self time
+- the time per top-level package
+- modules which must be loaded lazily (llama_index, docx, ...) but were imported at startup
+
+The run fails with exit code 1 if an app exceeds --budget-ms, imports a forbidden module or, with --compare, is more
+than --tolerance slower than the baseline.
+
+Usage:
+    python benchmarks/bench_import_time.py --budget-ms 2500 --output baseline.json
+    python benchmarks/bench_import_time.py --budget-ms 2500 --compare baseline.json
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+GENERATION_DIR = os.path.join(ROOT_DIR, "generation")
+SELECTION_DIR = os.path.join(ROOT_DIR, "selection")
+
+# App scripts and the directories their imports are resolved from
+APPS = {
+    "generation": (os.path.join(GENERATION_DIR, "app.py"), [GENERATION_DIR]),
+    "selection": (os.path.join(SELECTION_DIR, "smart_selection.py"), [SELECTION_DIR, GENERATION_DIR]),
+}
+
+# Packages which are only needed by some actions and must be imported at their first use
+FORBIDDEN_AT_STARTUP = ["llama_index", "ollama", "docx", "streamlit_mermaid"]
+
+# Line of the -X importtime output: "import time:  self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+# Top-level imports of a script
+def script_imports(path):
+    """ Returns the module names the script imports at its top level, in order. """
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+# Parse the output of python -X importtime
+def parse_importtime(stderr):
+    """
+    Returns one entry per imported module in the order they finished loading: module, self_us, cumulative_us and depth
+    (0 for the modules imported by the script itself). Lines which are not import times are ignored.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append({
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": max(0, (len(indent) - 1) // 2),
+            })
+    return entries
+
+
+# Build the report of one import run
+def build_report(entries, forbidden=FORBIDDEN_AT_STARTUP, top=15):
+    """ Returns the total time, the slowest modules, the time per top-level package and the forbidden imports. """
+    packages = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + entry["self_us"]
+    return {
+        "total_ms": round(sum(entry["self_us"] for entry in entries) / 1000, 1),
+        "modules": len(entries),
+        "slowest_cumulative": [
+            {"module": entry["module"], "ms": round(entry["cumulative_us"] / 1000, 1)}
+            for entry in sorted(entries, key=lambda entry: entry["cumulative_us"], reverse=True)[:top]
+        ],
+        "slowest_self": [
+            {"module": entry["module"], "ms": round(entry["self_us"] / 1000, 1)}
+            for entry in sorted(entries, key=lambda entry: entry["self_us"], reverse=True)[:top]
+        ],
+        "packages": {
+            package: round(us / 1000, 1)
+            for package, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+        "forbidden": sorted({
+            entry["module"].split(".")[0] for entry in entries if entry["module"].split(".")[0] in forbidden
+        }),
+    }
+
+
+# Import the modules of an app in a fresh interpreter
+def measure(app, python=sys.executable):
+    """ Runs python -X importtime on the top-level imports of the app script and returns the parsed entries. """
+    path, directories = APPS[app]
+    code = "import sys\n" + "".join(f"sys.path.insert(0, {directory!r})\n" for directory in reversed(directories))
+    code += "".join(f"import {module}\n" for module in script_imports(path))
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", code], cwd=directories[0], capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()
+        raise RuntimeError(f"Importing the {app} app failed: {error[-1] if error else completed.returncode}")
+    return parse_importtime(completed.stderr)
+
+
+# Git commit of the tree, if available
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Check the reports against the budget and the baseline
+def check(reports, budget_ms=None, baseline_path=None, tolerance=0.2):
+    """ Prints the checks and returns the list of failures, empty if every app is within its budget. """
+    failures = []
+    baseline = {}
+    if baseline_path:
+        with open(baseline_path) as file:
+            baseline = json.load(file)["results"]
+        print(f"\nCompared with {baseline_path}:")
+    for app, report in reports.items():
+        if budget_ms is not None and report["total_ms"] > budget_ms:
+            failures.append(f"{app}: {report['total_ms']} ms is over the budget of {budget_ms} ms")
+        if report["forbidden"]:
+            failures.append(f"{app}: imports {', '.join(report['forbidden'])} at startup")
+        previous = baseline.get(app)
+        if previous:
+            ratio = report["total_ms"] / previous["total_ms"] if previous["total_ms"] else float("nan")
+            print(f"  {app:<10}: {previous['total_ms']} ms -> {report['total_ms']} ms (x{ratio:.2f})")
+            if ratio > 1 + tolerance:
+                failures.append(f"{app}: {ratio:.2f}x slower than the baseline (tolerance {tolerance:.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of the generation and selection apps.")
+    parser.add_argument("--apps", default=",".join(APPS), help="Comma separated apps: generation, selection.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per app, the fastest run is reported.")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the total import time of an app is above this.")
+    parser.add_argument("--forbid", default=",".join(FORBIDDEN_AT_STARTUP), help="Comma separated packages which must not be imported at startup.")
+    parser.add_argument("--top", type=int, default=15, help="Modules and packages listed in the report.")
+    parser.add_argument("--output", help="Write the reports to this JSON file.")
+    parser.add_argument("--compare", help="Baseline JSON file to compare the total import times with.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline.")
+    args = parser.parse_args()
+
+    forbidden = [package for package in args.forbid.split(",") if package]
+    reports = {}
+    for app in args.apps.split(","):
+        # The first run also compiles the bytecode, the fastest of the runs is the cold start of a deployed container
+        runs = [build_report(measure(app), forbidden, args.top) for _ in range(max(1, args.repeat))]
+        report = min(runs, key=lambda run: run["total_ms"])
+        reports[app] = report
+
+        print(f"\n{app}: {report['total_ms']} ms for {report['modules']} modules")
+        print("  Slowest packages (self time):")
+        for package, ms in report["packages"].items():
+            print(f"    {ms:>8.1f} ms  {package}")
+        print("  Slowest modules (cumulative):")
+        for entry in report["slowest_cumulative"]:
+            print(f"    {entry['ms']:>8.1f} ms  {entry['module']}")
+        if report["forbidden"]:
+            print(f"  Imported at startup but should be lazy: {', '.join(report['forbidden'])}")
+
+    output = {
+        "meta": {
+            "benchmark": "import_time",
+            "commit": _commit(),
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "results": reports,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(output, file, indent=2)
+
+    failures = check(reports, args.budget_ms, args.compare, args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+End-to-end throughput benchmark for the generation pipeline.
+It drives the stages in the order app.py runs them (session initialization, generate_prompt, run_model_on_prompt,
+the checkpointed test case run of test_case_run.py and the session writes) for N synthetic documents with M scenarios
+each, against the local mock Ollama server (mock_ollama.py) and a local MongoDB.
+
+It reports p50/p95/p99 latencies per stage, the end-to-end throughput, the MongoDB round-trips per document and the
+bytes written per session. Every MongoDB command is counted with a pymongo command listener.
+The benchmark sessions are prefixed with "bench_" and deleted at the end unless --keep is given.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_pipeline.py --documents 20 --scenarios 5 --concurrency 4 --output pipeline.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import bson
+from pymongo import monitoring
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATION_DIR = os.path.join(BENCHMARKS_DIR, "..", "generation")
+sys.path.append(GENERATION_DIR)
+
+from mock_ollama import start_mock_server, WORDS
+
+# MongoDB commands which write data
+WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify"}
+
+# Stages reported by the benchmark
+STAGES = ("initialize_session", "generate_prompt", "run_model_on_prompt", "generate_test_case", "save_results", "document")
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """ Counts the MongoDB round-trips and written bytes per benchmark document. """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.round_trips = {}
+        self.bytes_written = {}
+
+    def started(self, event):
+        document = getattr(self.local, "document", None)
+        if document is None:
+            return
+        size = len(bson.encode(event.command)) if event.command_name in WRITE_COMMANDS else 0
+        with self.lock:
+            self.round_trips[document] = self.round_trips.get(document, 0) + 1
+            self.bytes_written[document] = self.bytes_written.get(document, 0) + size
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Nearest-rank percentile
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+# Latency summary of a stage
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 0.50), 4),
+        "p95": round(percentile(values, 0.95), 4),
+        "p99": round(percentile(values, 0.99), 4),
+        "mean": round(sum(values) / len(values), 4) if values else 0.0,
+    }
+
+
+# Create a synthetic requirements document
+def make_document(index, requirements=15, seed=0):
+    rng = random.Random(seed * 100003 + index)
+    lines = [f"Requirements Document {index}", ""]
+    for number in range(1, requirements + 1):
+        lines.append(f"{number}. The system shall {' '.join(rng.choices(WORDS, k=12))}.")
+    return "\n".join(lines)
+
+
+class PipelineBenchmark:
+    """ Runs the pipeline for the benchmark documents and collects the stage latencies. """
+
+    def __init__(self, default_prompt, model, counter, seed=0):
+        self.default_prompt = default_prompt
+        self.model = model
+        self.counter = counter
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.latencies = {stage: [] for stage in STAGES}
+        self.sessions = []
+        self.failures = 0
+        self.test_cases = 0
+
+    def _timed(self, stage, function, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.latencies[stage].append(time.perf_counter() - started)
+
+    def run_document(self, index):
+        """ Runs the stages of app.py for one document in its own session. """
+        # The generation modules are imported after main has pointed them at the mock server
+        from database import get_db, initialize_session, save_generated_prompt
+        from session_buffer import SessionWriteBuffer
+        from prompt_generate import generate_prompt
+        from run_model import run_model_on_prompt, save_model_output_to_db
+        from test_case_run import start_test_case_run, run_test_cases, open_scenarios
+        from duplicate_index import index_test_cases, iter_test_cases, INDEX_VERSION
+        from llm_client import llm_context
+        from llm_scheduler import INTERACTIVE
+
+        session_id = f"bench_{uuid.uuid4().hex[:12]}"
+        self.counter.local.document = session_id
+        with self.lock:
+            self.sessions.append(session_id)
+        db = get_db()
+        default_prompt = self.default_prompt
+        test_name = default_prompt["test_name"]
+        process_title = f"Bench_{index}"
+        started = time.perf_counter()
+        try:
+            with llm_context(session_id, INTERACTIVE):
+                self._timed("initialize_session", initialize_session, session_id)
+                session_buffer = SessionWriteBuffer(session_id)
+                session_buffer.set({"process_title": process_title, "document_type": "Requirements Document"})
+                session_buffer.flush()
+                session_buffer.set({"selected_category": "Functional", "selected_test_type": test_name})
+                session_buffer.flush()
+
+                instruction_elements = default_prompt.get("test_instruction_elements_and_prompts", {})
+                scoring_elements = default_prompt.get("test_scoring_elements_and_prompts", {})
+                combined_prompt = self._timed(
+                    "generate_prompt", generate_prompt,
+                    process_title, "Requirements Document", default_prompt["test_prompt"], make_document(index, seed=self.seed),
+                    test_name, {name: True for name in instruction_elements}, instruction_elements,
+                    {name: True for name in scoring_elements}, scoring_elements
+                )
+                save_generated_prompt(session_id, combined_prompt)
+
+                model_output = self._timed("run_model_on_prompt", run_model_on_prompt, self.model, combined_prompt)
+                if not model_output:
+                    raise RuntimeError("Model output validation failed.")
+                save_model_output_to_db(session_id, {"TestScenarios": model_output["TestScenarios"]}, db)
+
+                # The test case run checkpoints every scenario into the session, like "Create Test Case" in app.py
+                test_case_run = start_test_case_run(
+                    db, session_id, model_output["TestScenarios"], self.model,
+                    default_prompt.get("test_case_main_prompt", ""), default_prompt.get("test_case_create_prompts", {})
+                )
+                scenario_started = [time.perf_counter()]
+
+                # Time every scenario from the previous checkpoint to its own
+                def on_test_case_result(scenario_index, entry):
+                    now = time.perf_counter()
+                    with self.lock:
+                        self.latencies["generate_test_case"].append(now - scenario_started[0])
+                    scenario_started[0] = now
+
+                generated_test_cases = run_test_cases(db, session_id, test_case_run, on_result=on_test_case_result)
+                with self.lock:
+                    self.test_cases += sum(1 for _ in iter_test_cases(generated_test_cases))
+                if open_scenarios(generated_test_cases):
+                    raise RuntimeError(f"{len(open_scenarios(generated_test_cases))} scenarios failed.")
+
+                def save_results():
+                    index_test_cases(db, session_id, process_title, generated_test_cases)
+                    session_buffer.set({"duplicate_index_version": INDEX_VERSION})
+                    session_buffer.flush()
+                self._timed("save_results", save_results)
+        except Exception as e:
+            print(f"Document {index} failed: {e}")
+            with self.lock:
+                self.failures += 1
+        finally:
+            with self.lock:
+                self.latencies["document"].append(time.perf_counter() - started)
+            self.counter.local.document = None
+
+
+# Git commit of the tree, if available
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Default prompt of the benchmark test type
+def load_default_prompt(db, test_name):
+    """ Reads the default prompt from MongoDB and seeds the collection from data/default_prompts.json if it is empty. """
+    collection = db["default_prompts"]
+    if collection.count_documents({}) == 0:
+        with open(os.path.join(GENERATION_DIR, "data", "default_prompts.json")) as file:
+            prompts = json.load(file)
+        for prompt in prompts:
+            prompt.pop("_id", None)
+        collection.insert_many(prompts)
+    default_prompt = collection.find_one({"test_name": test_name}) if test_name else collection.find_one()
+    if not default_prompt:
+        raise ValueError(f"No default prompt found for test type: {test_name}")
+    return default_prompt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline end to end against a mock LLM and a local MongoDB.")
+    parser.add_argument("--documents", type=int, default=20, help="Number of synthetic documents (N).")
+    parser.add_argument("--scenarios", type=int, default=5, help="Scenarios per document (M).")
+    parser.add_argument("--test-cases", type=int, default=3, help="Test cases per scenario.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Documents processed in parallel, like concurrent sessions.")
+    parser.add_argument("--test-name", help="Test type of the default prompt, the first one if not given.")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--latency", default="lognormal:-2.5,0.5", help="Latency distribution of the mock server.")
+    parser.add_argument("--tokens-per-sec", type=float, default=400.0, help="Decoding speed of the mock server.")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Parallel requests of the mock server.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 answers of the mock server.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark sessions in MongoDB.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    # The mock server and the command listener have to exist before the generation modules create their clients
+    server, base_url = start_mock_server({
+        "latency": args.latency, "tokens_per_sec": args.tokens_per_sec, "concurrency": args.llm_concurrency,
+        "error_rate": args.error_rate, "scenarios": args.scenarios, "test_cases": args.test_cases, "seed": args.seed,
+    })
+    os.environ["OLLAMA_HOSTS"] = base_url
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.llm_concurrency))
+    counter = MongoCommandCounter()
+    monitoring.register(counter)
+
+    from database import get_db
+    db = get_db()
+    benchmark = PipelineBenchmark(load_default_prompt(db, args.test_name), args.model, counter, seed=args.seed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(benchmark.run_document, range(args.documents)))
+    elapsed = time.perf_counter() - started
+
+    session_bytes = [
+        len(bson.encode(session)) for session in db["sessions"].find({"session_id": {"$in": benchmark.sessions}})
+    ]
+    round_trips = [counter.round_trips.get(session_id, 0) for session_id in benchmark.sessions]
+    bytes_written = [counter.bytes_written.get(session_id, 0) for session_id in benchmark.sessions]
+    if not args.keep:
+        db["sessions"].delete_many({"session_id": {"$in": benchmark.sessions}})
+        db["test_case_index"].delete_many({"session_id": {"$in": benchmark.sessions}})
+    mock_stats = server.state.stats
+    server.shutdown()
+
+    done = args.documents - benchmark.failures
+    results = {
+        "documents": args.documents,
+        "scenarios": args.scenarios,
+        "concurrency": args.concurrency,
+        "failed": benchmark.failures,
+        "wall_seconds": round(elapsed, 3),
+        "documents_per_minute": round(done / elapsed * 60, 3) if elapsed else 0.0,
+        "test_cases": benchmark.test_cases,
+        "test_cases_per_minute": round(benchmark.test_cases / elapsed * 60, 3) if elapsed else 0.0,
+        "stages": {stage: summarize(values) for stage, values in benchmark.latencies.items()},
+        "mongo_round_trips_per_document": round(sum(round_trips) / len(round_trips), 2) if round_trips else 0.0,
+        "mongo_bytes_written_per_session": round(sum(bytes_written) / len(bytes_written)) if bytes_written else 0,
+        "session_document_bytes": round(sum(session_bytes) / len(session_bytes)) if session_bytes else 0,
+        "llm_requests": mock_stats["requests"],
+    }
+
+    print(f"{done}/{args.documents} documents in {results['wall_seconds']}s, {results['documents_per_minute']} docs/min")
+    print(f"  {results['test_cases']} test cases, {results['test_cases_per_minute']} test cases/min")
+    for stage, summary in results["stages"].items():
+        print(f"  {stage:<20} p50 {summary['p50']:.3f}s  p95 {summary['p95']:.3f}s  p99 {summary['p99']:.3f}s  (n={summary['count']})")
+    print(f"  MongoDB round-trips per document: {results['mongo_round_trips_per_document']}")
+    print(f"  Bytes written per session: {results['mongo_bytes_written_per_session']} (session document {results['session_document_bytes']} bytes)")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "meta": {
+                    "benchmark": "pipeline",
+                    "commit": _commit(),
+                    "created_at": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "args": vars(args),
+                },
+                "results": results,
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
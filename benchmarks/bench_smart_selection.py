@@ -0,0 +1,293 @@
+"""
+Scaling benchmark for Smart Selection (TestCaseList.smart_select and cluster_select).
+It generates synthetic test case sets with a controlled share of duplicates and runs the selection against a judge:
+- stub: an in-process judge which answers from the ground truth (optionally with noise and a simulated latency)
+- mock: the real LLM path through llm_client against the local mock Ollama server (mock_ollama.py)
+
+For every (cases, duplicate ratio, mode, blocking) combination it records the LLM call count, wall time,
+peak traced memory and the precision/recall of the flagged duplicates against the ground truth.
+Results are written as JSON and can be compared with the results of another commit.
+
+Usage:
+    python benchmarks/bench_smart_selection.py --sizes 100,500,1000,5000 --duplicate-ratios 0.1,0.3 --output results.json
+    python benchmarks/bench_smart_selection.py --sizes 100,500 --judge mock --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARKS_DIR, "..", "selection"))
+# smart_selection imports the shared modules of the generation app
+sys.path.append(os.path.join(BENCHMARKS_DIR, "..", "generation"))
+
+# Words used to build the synthetic test cases
+WORDS = [
+    "login", "session", "password", "upload", "report", "filter", "export", "task", "timeout", "invalid",
+    "permission", "profile", "search", "payment", "notification", "audit", "dashboard", "import", "status", "archive",
+    "account", "invoice", "schedule", "backup", "token", "language", "attachment", "comment", "history", "quota",
+]
+
+# Test cases per synthetic scenario
+CASES_PER_SCENARIO = 10
+
+
+# Rewrite a title so it differs in case and punctuation but has the same words
+def _variant_title(title, rng):
+    words = title.split()
+    words = [word.upper() if rng.random() < 0.3 else word.lower() for word in words]
+    return " ".join(words) + rng.choice(["", ".", "!", " -"])
+
+
+# Swap a few words of a text
+def _perturb(text, rng, swaps=3):
+    words = text.split()
+    for _ in range(min(swaps, len(words))):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+# Create a synthetic test case set
+def make_cases(count, duplicate_ratio, cross_scenario_share=0.3, seed=0):
+    """
+    Returns (cases, groups): test case dictionaries and the ground-truth group of every case.
+    round(count * (1 - duplicate_ratio)) groups get an original case, the remaining cases are near-duplicates of a
+    random group. Duplicates stay in the scenario of their original unless they are cross-scenario duplicates.
+    """
+    rng = random.Random(seed)
+    unique_count = max(1, round(count * (1 - duplicate_ratio)))
+    scenario_count = max(1, unique_count // CASES_PER_SCENARIO)
+
+    originals = []
+    for group in range(unique_count):
+        originals.append({
+            "Title": f"{' '.join(rng.sample(WORDS, 4)).title()} {group}",
+            "Description": " ".join(rng.choices(WORDS, k=40)),
+            "Objective": " ".join(rng.choices(WORDS, k=10)),
+            "Scenario": group % scenario_count,
+        })
+
+    entries = [(group, original["Scenario"], original) for group, original in enumerate(originals)]
+    for _ in range(count - unique_count):
+        group = rng.randrange(unique_count)
+        original = originals[group]
+        scenario = rng.randrange(scenario_count) if rng.random() < cross_scenario_share else original["Scenario"]
+        entries.append((group, scenario, {
+            "Title": _variant_title(original["Title"], rng),
+            "Description": _perturb(original["Description"], rng),
+            "Objective": _perturb(original["Objective"], rng, swaps=1),
+        }))
+    rng.shuffle(entries)
+
+    cases, groups = [], []
+    per_scenario = {}
+    for group, scenario, fields in entries:
+        per_scenario[scenario] = per_scenario.get(scenario, 0) + 1
+        cases.append({
+            "ScenarioID": f"Bench_Test_Scenario_{scenario + 1}",
+            "TestCaseID": f"TestCase_{per_scenario[scenario]}",
+            "Title": fields["Title"],
+            "Description": fields["Description"],
+            "Objective": fields["Objective"],
+            "Category": f"Category_{scenario % 5}",
+        })
+        groups.append(group)
+    return cases, groups
+
+
+class StubJudge:
+    """ In-process similarity judge which answers from the ground truth """
+
+    def __init__(self, groups_by_key, noise=0.0, latency=0.0, seed=0):
+        self.groups_by_key = groups_by_key
+        self.noise = noise
+        self.latency = latency
+        self.rng = random.Random(seed)
+
+    def __call__(self, case1, case2):
+        if self.latency:
+            time.sleep(self.latency)
+        same = self.groups_by_key[(case1.ScenarioID, case1.TestCaseID)] == self.groups_by_key[(case2.ScenarioID, case2.TestCaseID)]
+        return not same if self.noise and self.rng.random() < self.noise else same
+
+
+# Precision and recall of the flagged duplicates
+def score(duplicates, cases, groups):
+    """
+    A flagged duplicate is correct if it was matched with a case of the same ground-truth group.
+    A group of k cases has k - 1 true duplicates, whichever case is kept.
+    Returns precision, recall and F1 of the flagged duplicate cases.
+    """
+    group_of = {(case["ScenarioID"], case["TestCaseID"]): group for case, group in zip(cases, groups)}
+    key = lambda case: (case["ScenarioID"], case["TestCaseID"])
+    correct = sum(1 for d in duplicates if group_of[key(d["DuplicateCase"])] == group_of[key(d["MatchedWith"])])
+    truth = len(cases) - len(set(groups))
+    precision = correct / len(duplicates) if duplicates else 1.0
+    recall = correct / truth if truth else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return round(precision, 4), round(recall, 4), round(f1, 4)
+
+
+# Run one benchmark configuration
+def run_case(smart_selection, cases, groups, mode, blocking_strategy, judge, measure_memory=True):
+    """ Runs the selection once and returns the measurements. """
+    TestCase = smart_selection.TestCase
+    valid_data = [TestCase(**case) for case in cases]
+
+    if judge is not None:
+        class BenchTestCaseList(smart_selection.TestCaseList):
+            _query_llm_similarity = staticmethod(judge)
+        case_list_class = BenchTestCaseList
+    else:
+        case_list_class = smart_selection.TestCaseList
+
+    if measure_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    # The LLM prompt of every comparison is printed by the selection code
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        blocking = None
+        if blocking_strategy != "none":
+            blocking = smart_selection.build_blocking(
+                valid_data, strategy=blocking_strategy,
+                embed=smart_selection.embed_texts if blocking_strategy == "embedding" else None
+            )
+        case_list = case_list_class(test_cases=valid_data)
+        if mode == "clustering":
+            result = case_list.cluster_select(blocking=blocking)
+        else:
+            result = case_list.smart_select(blocking=blocking)
+    wall_seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    if measure_memory:
+        tracemalloc.stop()
+
+    precision, recall, f1 = score(result.duplicates, cases, groups)
+    return {
+        "llm_calls": len(result.comparison_log),
+        # Calls of the greedy mode with the same answers, the clustering mode must not need more
+        "greedy_calls": result.greedy_comparisons if mode == "clustering" else len(result.comparison_log),
+        "wall_seconds": round(wall_seconds, 4),
+        "peak_memory_mb": round(peak / 1e6, 3) if peak is not None else None,
+        "unique_count": len(result.test_cases),
+        "duplicates_flagged": len(result.duplicates),
+        "candidate_pairs": blocking.candidate_pair_count() if blocking is not None else len(cases) * (len(cases) - 1) // 2,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+    }
+
+
+# Git commit of the tree, if available
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Key of a result for comparisons across runs
+def _result_key(result):
+    return (result["cases"], result["duplicate_ratio"], result["mode"], result["blocking"], result["judge"])
+
+
+# Compare the results with a baseline file
+def compare(results, baseline_path):
+    """ Prints the change of LLM calls, wall time and recall per configuration against the baseline. """
+    with open(baseline_path) as file:
+        baseline = {_result_key(result): result for result in json.load(file)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        previous = baseline.get(_result_key(result))
+        if previous is None:
+            continue
+        calls = result["llm_calls"] / previous["llm_calls"] if previous["llm_calls"] else float("nan")
+        wall = result["wall_seconds"] / previous["wall_seconds"] if previous["wall_seconds"] else float("nan")
+        print(
+            f"  {result['cases']:>5} cases, {result['duplicate_ratio']:.0%} dup, {result['mode']:<10} {result['blocking']:<9}: "
+            f"LLM calls x{calls:.2f}, wall time x{wall:.2f}, recall {previous['recall']:.3f} -> {result['recall']:.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Smart Selection scaling on synthetic test cases.")
+    parser.add_argument("--sizes", default="100,500,1000,2000,5000", help="Comma separated numbers of test cases.")
+    parser.add_argument("--duplicate-ratios", default="0.1,0.3", help="Comma separated shares of duplicate cases.")
+    parser.add_argument("--modes", default="greedy,clustering", help="Comma separated modes: greedy, clustering.")
+    parser.add_argument("--blocking", default="none,scenario", help="Comma separated blocking strategies.")
+    parser.add_argument("--cross-scenario-share", type=float, default=0.3, help="Share of duplicates in another scenario.")
+    parser.add_argument("--judge", choices=["stub", "mock"], default="stub", help="Ground-truth stub or the mock Ollama server.")
+    parser.add_argument("--judge-noise", type=float, default=0.0, help="Share of wrong stub answers.")
+    parser.add_argument("--judge-latency", type=float, default=0.0, help="Seconds per stub answer.")
+    parser.add_argument("--no-memory", action="store_true", help="Do not trace memory (tracemalloc slows the run down).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Baseline JSON file to compare the results with.")
+    args = parser.parse_args()
+
+    server = None
+    if args.judge == "mock":
+        # The router reads the servers on import, so the mock server has to be running first
+        from mock_ollama import start_mock_server
+        server, base_url = start_mock_server({"latency": "fixed:0", "tokens_per_sec": 0, "prompt_tokens_per_sec": 0, "concurrency": 4})
+        os.environ["OLLAMA_HOSTS"] = base_url
+    import smart_selection
+
+    results = []
+    for size in [int(value) for value in args.sizes.split(",")]:
+        for ratio in [float(value) for value in args.duplicate_ratios.split(",")]:
+            cases, groups = make_cases(size, ratio, args.cross_scenario_share, seed=args.seed)
+            groups_by_key = {(case["ScenarioID"], case["TestCaseID"]): group for case, group in zip(cases, groups)}
+            for mode in args.modes.split(","):
+                for blocking_strategy in args.blocking.split(","):
+                    judge = StubJudge(groups_by_key, args.judge_noise, args.judge_latency, args.seed) if args.judge == "stub" else None
+                    measurements = run_case(smart_selection, cases, groups, mode, blocking_strategy, judge, not args.no_memory)
+                    result = {
+                        "cases": size,
+                        "duplicate_ratio": ratio,
+                        "mode": mode,
+                        "blocking": blocking_strategy,
+                        "judge": args.judge,
+                        **measurements,
+                    }
+                    results.append(result)
+                    # The peak memory is not measured with --no-memory
+                    memory = "" if result["peak_memory_mb"] is None else f"{result['peak_memory_mb']} MB peak, "
+                    print(
+                        f"{size:>5} cases, {ratio:.0%} dup, {mode:<10} {blocking_strategy:<9}: "
+                        f"{result['llm_calls']:>9} LLM calls, {result['wall_seconds']:>8.2f}s, "
+                        f"{memory}precision {result['precision']:.3f}, recall {result['recall']:.3f}"
+                    )
+    if server is not None:
+        server.shutdown()
+
+    output = {
+        "meta": {
+            "benchmark": "smart_selection",
+            "commit": _commit(),
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(output, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Local stand-in for an Ollama server, used to load-test the generation and selection apps offline.
+It implements the endpoints used by the ollama client and llama_index.llms.ollama (/api/chat, /api/generate, /api/embed,
+/api/ps, /api/tags, /api/version) and answers with canned, schema-valid responses picked from the prompt:
+TestScenarios, TestCases, custom_test_prompt, is_same, judge Controls, single requirement verdicts and the plain text document analysis.
+
+Latency is modelled as a sampled base latency plus prompt processing and decoding time at the configured tokens/sec.
+The number of concurrent requests is limited like OLLAMA_NUM_PARALLEL, and errors can be injected.
+
+Usage:
+    python benchmarks/mock_ollama.py --port 11434 --latency lognormal:-1.0,0.5 --tokens-per-sec 40 --concurrency 2 --error-rate 0.02
+
+Point the apps at it with OLLAMA_HOST=http://localhost:11434 (or OLLAMA_HOSTS for several instances).
+GET /mock/stats returns the request counters.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default configuration of the mock server
+DEFAULT_CONFIG = {
+    "latency": "fixed:0.05",          # base latency per request, see parse_distribution
+    "tokens_per_sec": 200.0,          # decoding speed, 0 disables the decoding time
+    "prompt_tokens_per_sec": 2000.0,  # prompt processing speed, 0 disables the prompt time
+    "load_time": 0.0,                 # seconds to "load" a model on its first request
+    "time_scale": 1.0,                # multiplies every simulated duration
+    "concurrency": 1,                 # requests processed in parallel, the others wait
+    "reject_when_busy": False,        # answer 503 instead of waiting when all slots are busy
+    "error_rate": 0.0,                # share of requests answered with HTTP 500
+    "drop_rate": 0.0,                 # share of requests whose connection is closed without a response
+    "malformed_rate": 0.0,            # share of responses whose content is not valid JSON
+    "scenarios": 5,                   # scenarios per TestScenarios response
+    "test_cases": 3,                  # test cases per TestCases response
+    "embedding_size": 64,
+    "seed": 0,
+}
+
+# Words used to build the canned texts
+WORDS = [
+    "login", "session", "password", "upload", "report", "filter", "export", "task", "timeout", "invalid",
+    "permission", "profile", "search", "payment", "notification", "audit", "dashboard", "import", "status", "archive",
+]
+
+
+# Parse a latency distribution
+def parse_distribution(spec):
+    """
+    Returns a function(rng) -> seconds for a spec of the form:
+    fixed:s, uniform:low,high, normal:mean,stdev, lognormal:mu,sigma or exp:mean. Negative samples are clipped to 0.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    samplers = {
+        "fixed": lambda rng: values[0],
+        "uniform": lambda rng: rng.uniform(values[0], values[1]),
+        "normal": lambda rng: rng.gauss(values[0], values[1]),
+        "lognormal": lambda rng: rng.lognormvariate(values[0], values[1]),
+        "exp": lambda rng: rng.expovariate(1.0 / values[0]) if values[0] else 0.0,
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    sampler = samplers[kind]
+    return lambda rng: max(0.0, sampler(rng))
+
+
+# Rough token count of a text
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+# Deterministic random generator per prompt
+def _prompt_rng(prompt, seed):
+    return random.Random(int.from_bytes(hashlib.blake2b(f"{seed}:{prompt}".encode("utf-8"), digest_size=8).digest(), "big"))
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choices(WORDS, k=words)).capitalize() + "."
+
+
+# Canned responses
+def scenarios_response(prompt, rng, count):
+    """ TestScenarios in the format of prompt_generate.generate_prompt, ScenarioIDs follow the prompt's process title. """
+    match = re.search(r'"ScenarioID":\s*"(.*?)_Test_Scenario_1"', prompt)
+    process_title = match.group(1) if match else "Mock"
+    category = re.search(r'"Category":\s*"([^"<]*)"', prompt)
+    return {"TestScenarios": [
+        {
+            "ScenarioID": f"{process_title}_Test_Scenario_{i + 1}",
+            "Title": _sentence(rng, 4)[:-1].title(),
+            "Description": " ".join(_sentence(rng, 12) for _ in range(3)),
+            "Objective": _sentence(rng, 8),
+            "Category": category.group(1) if category else "Functional Testing",
+            "Comments": "",
+        }
+        for i in range(count)
+    ]}
+
+
+def test_cases_response(prompt, rng, count):
+    """ TestCases in the format of generate_test_case.generate_json_structure for the scenario in the prompt. """
+    match = re.search(r"^ScenarioID:\s*(\S+)", prompt, re.MULTILINE)
+    scenario_id = match.group(1) if match else "Scenario_1"
+    return {"TestCases": [
+        {
+            "ScenarioID": scenario_id,
+            "TestCaseID": f"TestCase_{i + 1}",
+            "Title": _sentence(rng, 4)[:-1].title(),
+            "Description": " ".join(_sentence(rng, 12) for _ in range(3)),
+            "Objective": _sentence(rng, 8),
+            "Category": "Functional Tests",
+            "Comments": "",
+        }
+        for i in range(count)
+    ]}
+
+
+def is_same_response(prompt, rng):
+    """ is_same is true when the two test cases in the prompt have the same normalized title. """
+    titles = re.findall(r'"Title":\s*"(.*?)"', prompt)
+    if len(titles) >= 2:
+        normalize = lambda title: " ".join(re.findall(r"\w+", title.lower()))
+        return {"is_same": normalize(titles[0]) == normalize(titles[1])}
+    return {"is_same": rng.random() < 0.1}
+
+
+def judge_response(prompt, rng):
+    """ One control per requirement line of the prompt, at least one. """
+    requirements = max(1, len(re.findall(r"^\s*\d+\.", prompt, re.MULTILINE)))
+    return {"Controls": [
+        {"ControlID": str(i + 1), "Title": _sentence(rng, 4)[:-1], "Evaluation": rng.random() < 0.8, "Comments": ""}
+        for i in range(min(requirements, 20))
+    ]}
+
+
+def requirement_response(rng):
+    """ Verdict of a single judge element on a single scenario (run_judge_by_requirement). """
+    return {"Title": _sentence(rng, 4)[:-1], "Evaluation": rng.random() < 0.8, "Comments": ""}
+
+
+def analysis_response(rng):
+    """ Plain text document analysis like analyse_document expects. """
+    return "\n\n".join(
+        f"{test_type}\nSuitability: {rng.choice(['High', 'Medium', 'Low'])}\nExplanation: {_sentence(rng, 15)}"
+        for test_type in ("Functional Tests", "Performance Tests", "Usability Tests", "Security Tests")
+    )
+
+
+# Pick the canned response for a prompt
+def canned_content(prompt, json_mode, config):
+    """ Returns the response content for the prompt as a string. """
+    rng = _prompt_rng(prompt, config["seed"])
+    if '"is_same"' in prompt:
+        content = is_same_response(prompt, rng)
+    elif "custom_test_prompt" in prompt:
+        content = {"custom_test_prompt": " ".join(_sentence(rng, 15) for _ in range(4))}
+    elif '"Controls"' in prompt:
+        content = judge_response(prompt, rng)
+    elif '"Evaluation"' in prompt:
+        content = requirement_response(rng)
+    elif '"TestCases"' in prompt:
+        content = test_cases_response(prompt, rng, config["test_cases"])
+    elif '"TestScenarios"' in prompt:
+        content = scenarios_response(prompt, rng, config["scenarios"])
+    elif not json_mode:
+        return analysis_response(rng)
+    else:
+        content = {}
+    return json.dumps(content, ensure_ascii=False)
+
+
+# Deterministic bag-of-words embedding
+def embedding(text, size):
+    vector = [0.0] * size
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "big") % size] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class MockState:
+    """ Configuration, concurrency slots and counters shared by the request handlers. """
+
+    def __init__(self, config):
+        self.config = {**DEFAULT_CONFIG, **config}
+        self.latency = parse_distribution(self.config["latency"])
+        self.slots = threading.BoundedSemaphore(self.config["concurrency"])
+        self.rng = random.Random(self.config["seed"])
+        self.lock = threading.Lock()
+        self.loaded_models = set()
+        self.stats = {"requests": 0, "completed": 0, "errors": 0, "dropped": 0, "malformed": 0, "rejected": 0,
+                      "in_flight": 0, "max_in_flight": 0, "by_path": {}}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def draw(self):
+        """ Returns the injected fault for a request: None, 'error', 'drop' or 'malformed'. """
+        with self.lock:
+            value = self.rng.random()
+            latency = self.latency(self.rng)
+        config = self.config
+        for fault, rate in (("error", config["error_rate"]), ("drop", config["drop_rate"]), ("malformed", config["malformed_rate"])):
+            if value < rate:
+                return fault, latency
+            value -= rate
+        return None, latency
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffered writes, headers and body leave in one segment; unbuffered they are separate writes and Nagle's algorithm
+    # with the client's delayed ACK adds about 40 ms to every response. The streamed chunks are small writes by design,
+    # TCP_NODELAY sends each of them at once
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    state = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def do_GET(self):
+        state = self.state
+        if self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-mock"})
+        elif self.path in ("/api/ps", "/api/tags"):
+            with state.lock:
+                models = sorted(state.loaded_models)
+            self._send_json(200, {"models": [{"name": model, "model": model} for model in models]})
+        elif self.path == "/mock/stats":
+            with state.lock:
+                self._send_json(200, json.loads(json.dumps(state.stats)))
+        elif self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.wfile.flush()
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid JSON body"})
+            return
+        with state.lock:
+            state.stats["requests"] += 1
+            state.stats["by_path"][self.path] = state.stats["by_path"].get(self.path, 0) + 1
+
+        if self.path not in ("/api/chat", "/api/generate", "/api/embed"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        if state.config["reject_when_busy"]:
+            if not state.slots.acquire(blocking=False):
+                state.count("rejected")
+                self._send_json(503, {"error": "server busy, please try again"})
+                return
+        else:
+            state.slots.acquire()
+        state.count("in_flight")
+        try:
+            self._handle(request)
+        finally:
+            state.count("in_flight", -1)
+            state.slots.release()
+
+    def _handle(self, request):
+        state = self.state
+        config = state.config
+        fault, latency = state.draw()
+        model = request.get("model", "mock")
+
+        if fault == "drop":
+            state.count("dropped")
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fault == "error":
+            time.sleep(latency * config["time_scale"])
+            state.count("errors")
+            self._send_json(500, {"error": "injected error"})
+            return
+
+        with state.lock:
+            load_duration = 0.0 if model in state.loaded_models else config["load_time"]
+            state.loaded_models.add(model)
+
+        if self.path == "/api/embed":
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep((latency + load_duration) * config["time_scale"])
+            state.count("completed")
+            self._send_json(200, {"model": model, "embeddings": [embedding(text, config["embedding_size"]) for text in inputs]})
+            return
+
+        if self.path == "/api/chat":
+            prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        else:
+            prompt = request.get("prompt", "")
+        json_mode = bool(request.get("format"))
+        content = canned_content(prompt, json_mode, config)
+        if fault == "malformed":
+            state.count("malformed")
+            content = content[: len(content) // 2] or "{"
+
+        prompt_tokens, eval_tokens = count_tokens(prompt), count_tokens(content)
+        prompt_duration = prompt_tokens / config["prompt_tokens_per_sec"] if config["prompt_tokens_per_sec"] else 0.0
+        eval_duration = eval_tokens / config["tokens_per_sec"] if config["tokens_per_sec"] else 0.0
+        scale = config["time_scale"]
+        time.sleep((latency + load_duration + prompt_duration) * scale)
+
+        final = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((latency + load_duration + prompt_duration + eval_duration) * scale * 1e9),
+            "load_duration": int(load_duration * scale * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_duration * scale * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_duration * scale * 1e9),
+        }
+
+        if request.get("stream", True):
+            self._stream(model, content, final, eval_duration * scale)
+        else:
+            time.sleep(eval_duration * scale)
+            if self.path == "/api/chat":
+                final["message"] = {"role": "assistant", "content": content}
+            else:
+                final["response"] = content
+            self._send_json(200, final)
+        state.count("completed")
+
+    # Stream the content in NDJSON chunks like Ollama does with stream=true
+    def _stream(self, model, content, final, eval_duration):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        delay = eval_duration / len(pieces)
+
+        def write(payload):
+            line = (json.dumps(payload) + "\n").encode("utf-8")
+            # Every chunk is sent when it is produced, the first one together with the headers
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+        for piece in pieces:
+            time.sleep(delay)
+            chunk = {"model": model, "created_at": final["created_at"], "done": False}
+            if self.path == "/api/chat":
+                chunk["message"] = {"role": "assistant", "content": piece}
+            else:
+                chunk["response"] = piece
+            write(chunk)
+        if self.path == "/api/chat":
+            final["message"] = {"role": "assistant", "content": ""}
+        else:
+            final["response"] = ""
+        write(final)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+# Create a mock server
+def make_server(config=None, host="127.0.0.1", port=0):
+    """ Returns a ThreadingHTTPServer with the mock handlers, port 0 picks a free port. """
+    state = MockState(config or {})
+    handler = type("ConfiguredMockOllamaHandler", (MockOllamaHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+# Start a mock server in a background thread
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """ Starts the server in a daemon thread and returns (server, base_url). Stop it with server.shutdown(). """
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", default=DEFAULT_CONFIG["latency"], help="fixed:s, uniform:low,high, normal:mean,stdev, lognormal:mu,sigma or exp:mean")
+    parser.add_argument("--tokens-per-sec", type=float, default=DEFAULT_CONFIG["tokens_per_sec"])
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=DEFAULT_CONFIG["prompt_tokens_per_sec"])
+    parser.add_argument("--load-time", type=float, default=DEFAULT_CONFIG["load_time"])
+    parser.add_argument("--time-scale", type=float, default=DEFAULT_CONFIG["time_scale"])
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONFIG["concurrency"])
+    parser.add_argument("--reject-when-busy", action="store_true")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CONFIG["error_rate"])
+    parser.add_argument("--drop-rate", type=float, default=DEFAULT_CONFIG["drop_rate"])
+    parser.add_argument("--malformed-rate", type=float, default=DEFAULT_CONFIG["malformed_rate"])
+    parser.add_argument("--scenarios", type=int, default=DEFAULT_CONFIG["scenarios"])
+    parser.add_argument("--test-cases", type=int, default=DEFAULT_CONFIG["test_cases"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key in DEFAULT_CONFIG}
+    server = make_server(config, args.host, args.port)
+    print(f"Mock Ollama server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,13 @@ The script uses the llama3.2 model to analyze the document content and return th
 with each test type containing a 'suitability' and 'explanation'. 
 """
 
-from llama_index.llms.ollama import Ollama
-from requests.exceptions import ConnectionError, Timeout
+import llm_client
+from tracing import traced
 
 # Analyze the document content to determine its suitability for different types of testing
 # Input: document content (str)
 # Output: analysis results (str)
+@traced()
 def analyse_document(document):
     """ This function analyzes the document content to determine its suitability for different types"""
 
@@ -73,11 +74,10 @@ def analyse_document(document):
     # Try to connect with the LLM and analyze the document. 
     # If there is a connection problem, it will handle it.
     try:
-        llm = Ollama(model="llama3.2", request_timeout=300.0, json_mode=False)
-        resp = llm.complete(prompt)
+        resp = llm_client.complete("llama3.2", prompt, json_mode=False, site="analyse_document")
         return resp.text
     # If there is a connection error or timeout, return an error message
-    except (ConnectionError, Timeout) as e:
+    except llm_client.transport_errors() as e:
         return (f"Connection error or timeout occurred: {e}")
     # If there is an unexpected error, return an error message
     except Exception as e:
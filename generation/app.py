@@ -2,18 +2,31 @@
 
 import streamlit as st
 from file_reader import read_txt, read_docx, read_xlsx, read_python, read_cpp, read_c, read_xml
-from database import fetch_test_names, fetch_scenario_from_db, update_scenario_in_db, save_generated_prompt, get_db, get_sessions_collection, fetch_model_output_from_db
+from database import fetch_test_names, fetch_scenario_from_db, save_generated_prompt, get_db, get_sessions_collection, fetch_model_output_from_db
 from session_manager import get_session_id
 from prompt_generate import generate_prompt
 from run_model import run_model_on_prompt, save_model_output_to_db
 from analyse_document import analyse_document
-from run_judge import run_judge_on_prompt
+from run_judge import run_judge_by_requirement
 from validate_prompt import validate_combined_prompt
-from llama_index.llms.ollama import Ollama
-from requests.exceptions import ConnectionError, Timeout
-from generate_test_case import generate_json_structure, generate_test_case
+from generate_test_case import generate_json_structure
+from test_case_run import (
+    start_test_case_run, fetch_test_case_run, run_test_cases, open_scenarios, is_resumable, claim_test_case_run,
+    TestCaseRunReplaced, FAILED, RUNNING
+)
+from sharded_generation import generate_sharded_scenarios
 import json
 from create_special_test_prompt import generate_customise_base_prompt
+from session_buffer import get_session_buffer
+from duplicate_index import find_similar_many, index_test_cases, iter_test_cases, INDEX_VERSION
+from task_queue import enqueue
+from worker import enqueue_test_case_generation, resume_background_run, settle_background_run, GENERATE_SCENARIOS, RUN_JUDGE
+from llm_client import set_llm_context, scheduler_stats, endpoint_stats
+from llm_scheduler import INTERACTIVE
+from metrics import start_metrics_server
+from mongo_client import pool_stats, format_pool_stats
+from tracing import start_span
+from rerun_profiler import get_rerun_profiler, render_profile
 
 
 # Adjusted LLM models list based on your terminal output
@@ -29,12 +42,46 @@ llm_models = [
     'llama3.1',
 ]
 
+# Serve the Prometheus metrics of this server process, the sidecar thread is started on the first rerun only
+start_metrics_server()
+
 # Initialize session
 session_id = get_session_id()
 
+# The LLM calls of this rerun are queued fairly against the other sessions as interactive calls
+set_llm_context(session_id, INTERACTIVE)
+
+# Trace this rerun, the stages, LLM calls and database operations below are recorded as its child spans
+rerun_span = start_span("rerun", kind="rerun", session_id=session_id)
+
 # Database connection
 db = get_db()
 
+# Write buffer for the session document, changes are flushed after the button actions and at the end of the rerun
+session_buffer = get_session_buffer(session_id)
+
+# Opt-in profiler which measures the sections of this rerun
+profiler = get_rerun_profiler("generation", session_id)
+profiler.start_rerun()
+
+# LLM queue of this server process, shared by all sessions (rendered before the LLM calls of this rerun start)
+llm_queue = scheduler_stats()
+st.sidebar.caption(
+    f"LLM queue: {llm_queue['in_flight']}/{llm_queue['max_concurrency']} running, {llm_queue['queued']} waiting, "
+    f"interactive wait {llm_queue['priorities']['interactive']['avg_wait']:.1f}s avg / "
+    f"{llm_queue['priorities']['interactive']['p95_wait']:.1f}s p95"
+)
+
+# Ollama servers used by the LLM calls
+endpoints = endpoint_stats()
+st.sidebar.caption(
+    f"Ollama servers: {sum(endpoint['healthy'] for endpoint in endpoints)}/{len(endpoints)} healthy, "
+    + ", ".join(f"{endpoint['base_url']} ({endpoint['in_flight']} running)" for endpoint in endpoints)
+)
+
+# MongoDB connection pool of this server process, shared by all sessions
+st.sidebar.caption(format_pool_stats(pool_stats()))
+
 # Set the title of the app
 st.title('Smart Test')
 
@@ -56,15 +103,13 @@ if st.button("Save Process Title"):
             st.warning("A process with the same title already exists. Please choose a different title.")
         else:
             # Save the process title to the database
-            sessions_collection.update_one(
-                {"session_id": session_id},
-                {"$set": {"process_title": process_title}},
-                upsert=True
-            )
+            session_buffer.set({"process_title": process_title})
+            session_buffer.flush()
             # Show a success message when the process title is saved
             st.success("Process Title saved successfully!")
 
 # File uploader widget
+profiler.begin("upload_parsing")
 uploaded_file = st.file_uploader("Upload file to use in smart test generation process.", type=['txt', 'docx', 'xlsx', 'py', 'cpp', 'c', 'xml'])
 
 # Check if a file has been uploaded
@@ -124,6 +169,7 @@ if uploaded_file is not None:
     else:
         # If the file type is not supported, show an error message
         st.error('Unsupported file type.')
+profiler.end("upload_parsing", size=uploaded_file.size if uploaded_file is not None else 0)
 
 # Document content analyse to choose the correct test type in the session state for saving
 if "analyse_content" not in st.session_state:
@@ -155,15 +201,9 @@ document_type = st.selectbox("Select the Document Type", ["--Please Select a Typ
 if st.button("Save Document Type", key="save_document_type"):
     # Check if a document type has been selected
     if not "--Please Select a Type--" in document_type:
-        # Save the document type to the database
-        # Take the sessions collection
-        sessions_collection = get_sessions_collection()
         # Save the document type to the database for the current session
-        sessions_collection.update_one(
-            {"session_id": session_id},
-            {"$set": {"document_type": document_type}},
-            upsert=True
-            )
+        session_buffer.set({"document_type": document_type})
+        session_buffer.flush()
         # Show a success message when the document type is saved
         st.success("Document Type saved successfully!")
     else:
@@ -244,20 +284,30 @@ if selected_test_name:
         if scenario_data.get("customised_prompt_status", False):
             st.warning("A customised prompt has already been created for this scenario. If you wish to initiate a new testing process, please refresh the page to start a new session.")
 
-        # Save the selected category and test type to the database
-        sessions_collection = get_sessions_collection()
-        sessions_collection.update_one(
-            {"session_id": session_id}, # Find the session with the session_id
+        # The prompt fields which are edited below are already in the database, so unchanged values are not rewritten
+        session_buffer.mark_persisted(
             {
-                "$set": {
-                    "selected_category": selected_category,  # Save the selected category
-                    "selected_test_type": selected_test_name  # Save the selected test type
-                }
+                key: scenario_data[key]
+                for key in (
+                    "test_prompt",
+                    "test_instruction_elements_and_prompts",
+                    "test_scoring_elements_and_prompts",
+                    "test_case_main_prompt",
+                    "test_case_create_prompts",
+                )
+                if key in scenario_data
             },
-            upsert=True  # If the session does not exist, create a new one
+            test_name=selected_test_name
         )
-        # Show a success message when the category and test type are saved
-        st.success("Category and test type saved successfully!")
+
+        # Save the selected category and test type to the database, the write is skipped if nothing changed
+        if session_buffer.set({
+            "selected_category": selected_category,  # Save the selected category
+            "selected_test_type": selected_test_name  # Save the selected test type
+        }):
+            session_buffer.flush()
+            # Show a success message when the category and test type are saved
+            st.success("Category and test type saved successfully!")
 
         # Display the initial prompt
         st.write("### Initial Prompt")
@@ -271,7 +321,8 @@ if selected_test_name:
             if not scenario_data.get("customised_prompt_status", False):
                 customised_prompt = generate_customise_base_prompt(selected_test_name, document_type, document_content, test_prompt)
                 if customised_prompt:
-                    update_scenario_in_db(selected_test_name,{"test_prompt": customised_prompt, "customised_prompt_status": True},session_id=session_id)
+                    session_buffer.set_scenario_fields(selected_test_name, {"test_prompt": customised_prompt, "customised_prompt_status": True})
+                    session_buffer.flush()
             else:
                 customised_prompt = scenario_data.get("customised_prompt", "No customised prompt available.")
                 if customised_prompt != "No customised prompt available.":
@@ -291,7 +342,8 @@ if selected_test_name:
                                 st.session_state["editable_prompt"] = True
                         with col2_prompt:
                             if st.button("Save Customised Prompt", key="save_customised_prompt", disabled=not editable_prompt):
-                                update_scenario_in_db(selected_test_name, {"test_prompt": customised_prompt}, session_id=session_id)
+                                session_buffer.set_scenario_fields(selected_test_name, {"test_prompt": customised_prompt})
+                                session_buffer.flush()
                                 st.success("Customised prompt saved successfully!")
                                 st.session_state["editable_prompt"] = False
 
@@ -307,6 +359,7 @@ if selected_test_name:
         st.subheader(f"Details for {selected_test_name}")
 
         # First Part: Instruction Elements and Prompts - İnstruction Elements
+        profiler.begin("prompt_element_rendering")
         st.write("### Instruction Elements")
         # Get the instruction elements and prompts from the scenario data
         test_instruction_elements = scenario_data.get("test_instruction_elements_and_prompts", {})
@@ -367,12 +420,12 @@ if selected_test_name:
                                 if updated_content:
                                     # Update the instruction element content specified by the name
                                     test_instruction_elements[name] = updated_content
-                                    # Update the instruction elements and prompts in the database
-                                    update_scenario_in_db(
-                                        selected_test_name, 
-                                        {"test_instruction_elements_and_prompts": test_instruction_elements}, 
-                                        session_id=session_id
+                                    # Update only the changed instruction element in the database
+                                    session_buffer.set_scenario_fields(
+                                        selected_test_name,
+                                        {"test_instruction_elements_and_prompts": {name: updated_content}}
                                     )
+                                    session_buffer.flush()
                                     # Show a success message when the instruction element is saved
                                     st.success(f"{name} saved successfully!")
                                     # Inactivate the Save button and activate the Edit button
@@ -437,11 +490,11 @@ if selected_test_name:
                                 # Update content if there is an updated content
                                 if updated_content:
                                     test_scoring_elements[name] = updated_content
-                                    update_scenario_in_db(
-                                        selected_test_name, 
-                                        {"test_scoring_elements_and_prompts": test_scoring_elements}, 
-                                        session_id=session_id
+                                    session_buffer.set_scenario_fields(
+                                        selected_test_name,
+                                        {"test_scoring_elements_and_prompts": {name: updated_content}}
                                     )
+                                    session_buffer.flush()
                                     st.success(f"{name} saved successfully!")
                                     # Inactivate the Save button and activate the Edit button
                                     st.session_state[editable_key] = False
@@ -451,6 +504,7 @@ if selected_test_name:
         else:
             # Show a message if there are no scoring elements available
             st.write("No scoring elements available.")
+        profiler.end("prompt_element_rendering", size=len(test_instruction_elements) + len(test_scoring_elements))
         
         # Display the section title
         st.write("### Select an LLM Model")
@@ -496,6 +550,18 @@ if selected_test_name:
                 
                 # Save the generated prompt to session_state
                 st.session_state["combined_prompt"] = combined_prompt
+                # Save the inputs of the prompt as well, the sharded generation builds the prompts of the sections from them
+                st.session_state["combined_prompt_inputs"] = {
+                    "process_title": process_title,
+                    "document_type": document_type,
+                    "test_prompt": test_prompt,
+                    "document_content": document_content,
+                    "selected_test_name": selected_test_name,
+                    "selected_instruction_elements": selected_instruction_elements,
+                    "test_instruction_elements": test_instruction_elements,
+                    "selected_scoring_elements": selected_scoring_elements,
+                    "test_scoring_elements": test_scoring_elements,
+                }
                 
                 # Save the generated prompt to the database
                 save_generated_prompt(session_id, combined_prompt)
@@ -525,6 +591,11 @@ if selected_test_name:
         #             st.error("Model output validation failed.")
         #     else:
         #         st.warning("Please generate a prompt before running the model.")
+        # Run the scenario generation in the background workers (python worker.py) instead of this session
+        run_scenarios_in_background = st.checkbox("Run in background worker", key="run_scenarios_in_background")
+        # Large documents can be split into sections whose scenarios are generated concurrently and merged
+        shard_scenarios = st.checkbox("Generate per document section (large documents)", key="shard_scenarios")
+
         # Run Model with Generated Prompt button
         if st.button("Run Model on Generated Prompt"):
             # Fetch the current session data
@@ -537,20 +608,47 @@ if selected_test_name:
                 # Check if combined_prompt is available in session_state
                 if "combined_prompt" in st.session_state:
                     combined_prompt = st.session_state["combined_prompt"]
-                    # Take the model output
-                    model_output = run_model_on_prompt(selected_llm_model, combined_prompt)
-                    
-                    # Check if the model output is available
-                    if model_output:
-                        # Show the model output
-                        with st.expander("Model Output", expanded=False):
-                            st.write(model_output)
-                        # Save the model output to the database
-                        save_model_output_to_db(session_id, {"TestScenarios": model_output["TestScenarios"]}, db)
-                        # Show a success message when the model output is saved
-                        st.success("Test scenario created successfully and saved to the database!")
+                    # Prompt parts of the sharded generation, the inputs the combined prompt was generated from
+                    sharded_arguments = st.session_state.get("combined_prompt_inputs")
+                    if shard_scenarios and sharded_arguments is None:
+                        st.warning("Please generate the prompt again before generating per document section.")
+                    elif run_scenarios_in_background:
+                        # The worker saves the scenarios into the session when it finishes the task
+                        scenario_task = {"session_id": session_id, "model": selected_llm_model, "prompt": combined_prompt}
+                        if shard_scenarios:
+                            scenario_task["sharded"] = sharded_arguments
+                        enqueue(db, GENERATE_SCENARIOS, scenario_task)
+                        st.success("Test scenario generation was queued. The scenarios appear in the database when a worker finishes it.")
+                    elif shard_scenarios:
+                        # Generate the scenarios of every section concurrently, merge the near-duplicates and renumber them
+                        model_output, shard_summary = generate_sharded_scenarios(selected_llm_model, **sharded_arguments)
+                        if model_output["TestScenarios"]:
+                            with st.expander("Model Output", expanded=False):
+                                st.write(model_output)
+                            save_model_output_to_db(session_id, model_output, db)
+                            st.success(
+                                f"{shard_summary['scenarios']} test scenarios were created from {shard_summary['sections']} document sections "
+                                f"and saved to the database ({shard_summary['merged']} near-duplicates merged)."
+                            )
+                            if shard_summary["failed_sections"]:
+                                st.warning(f"Generation failed for the sections {', '.join(map(str, shard_summary['failed_sections']))}.")
+                        else:
+                            st.error("Model output validation failed for every document section.")
                     else:
-                        st.error("Model output validation failed.")
+                        # Take the model output
+                        model_output = run_model_on_prompt(selected_llm_model, combined_prompt)
+
+                        # Check if the model output is available
+                        if model_output:
+                            # Show the model output
+                            with st.expander("Model Output", expanded=False):
+                                st.write(model_output)
+                            # Save the model output to the database
+                            save_model_output_to_db(session_id, {"TestScenarios": model_output["TestScenarios"]}, db)
+                            # Show a success message when the model output is saved
+                            st.success("Test scenario created successfully and saved to the database!")
+                        else:
+                            st.error("Model output validation failed.")
                 else:
                     st.warning("Please generate a prompt before running the model.")
 
@@ -633,7 +731,57 @@ if selected_test_name:
         #                     st.error("Judge output validation failed.")
         #         else:
         #             st.warning("Please select at least one judge element to run.")
-        
+
+        # LLM Output Judge, every selected judge element is evaluated on every scenario of the model output
+        llm_output_judges = scenario_data.get("llm_output_judges_and_prompts", {})
+        if llm_output_judges:
+            st.write("### LLM Output Judge Elements")
+            col1, col2 = st.columns(2)
+            selected_llm_judges = {}
+            for i, name in enumerate(llm_output_judges):
+                with col1 if i % 2 == 0 else col2:
+                    selected_llm_judges[name] = st.checkbox(name, key=f"checkbox_llm_judge_{name}")
+            judge_elements = {name: prompt for name, prompt in llm_output_judges.items() if selected_llm_judges.get(name)}
+            run_judge_in_background = st.checkbox("Run in background worker", key="run_judge_in_background")
+
+            # Run Judge button
+            if st.button("Run Judge"):
+                model_output = fetch_model_output_from_db(session_id)
+                if not judge_elements:
+                    st.warning("Please select at least one judge element to run.")
+                elif not model_output or not model_output.get("TestScenarios"):
+                    st.warning("Model output not found in the database. Please run the model first.")
+                elif run_judge_in_background:
+                    # The worker saves the judge output into the test type when it finishes the task
+                    enqueue(db, RUN_JUDGE, {
+                        "session_id": session_id, "test_name": selected_test_name, "judge_elements": judge_elements,
+                        "uploaded_file": document_content, "model": selected_llm_model,
+                    })
+                    st.success("The judge was queued. Its output appears below when a worker finishes it.")
+                else:
+                    # Verdicts of unchanged scenarios and judge elements are reused from the verdict cache
+                    judge_output = run_judge_by_requirement(
+                        judge_elements, model_output["TestScenarios"], document_content, model=selected_llm_model, db=db
+                    )
+                    session_buffer.set_scenario_fields(selected_test_name, {"judge_output": judge_output})
+                    session_buffer.flush()
+                    scenario_data["judge_output"] = judge_output
+                    st.success("Judge has been run and output saved to database.")
+
+            # Judge output of the test type, also the one saved by a background worker
+            judge_output = scenario_data.get("judge_output")
+            if judge_output:
+                summary = judge_output.get("Summary")
+                if summary:
+                    st.write(
+                        f"Judge: {summary['evaluations']} evaluations, {summary['evaluated']} evaluated, "
+                        f"{summary['skipped']} reused from the verdict cache, {summary['failed']} failed."
+                    )
+                for error in judge_output.get("Errors", []):
+                    st.error(f"Judge evaluation failed for {error['ControlID']}: {error['Error']}")
+                with st.expander("Judge Output", expanded=False):
+                    st.write(judge_output.get("Controls", judge_output))
+
         # Test Case Creation Prompt with Editable Structure
         st.write("### Test Case Creation Prompt")
         with st.expander("Test Case Prompt", expanded=False):
@@ -661,11 +809,11 @@ if selected_test_name:
                 # If the Save button is clicked, save the updated test case prompt
                 if st.button("Save Test Case Prompt", key="save_test_case_prompt", disabled=not editable_test_case_prompt):
                     # Get the updated test case prompt
-                    update_scenario_in_db(
-                        selected_test_name, 
-                        {"test_case_main_prompt": updated_test_case_main_prompt}, 
-                        session_id=session_id
+                    session_buffer.set_scenario_fields(
+                        selected_test_name,
+                        {"test_case_main_prompt": updated_test_case_main_prompt}
                     )
+                    session_buffer.flush()
                     # Show a success message when the test case prompt is saved
                     st.success("Test Case Prompt saved successfully!")
                     # Inactivate the Save button and activate the Edit button
@@ -698,8 +846,9 @@ if selected_test_name:
                     if st.button(f"Save {test_case} Prompt"):
                         # Save the updated prompt to the database for the selected test case
                         test_case_prompts[test_case] = editable_prompt
-                        # Update the test case prompt in the database
-                        update_scenario_in_db(selected_test_name, {"test_case_create_prompts": test_case_prompts}, session_id=session_id)
+                        # Update the test case prompts in the database, only the changed prompt is written
+                        session_buffer.set_scenario_fields(selected_test_name, {"test_case_create_prompts": test_case_prompts})
+                        session_buffer.flush()
                         # Show a success message when the prompt is saved
                         st.success(f"{test_case} Prompt updated successfully!")
 
@@ -709,6 +858,38 @@ if selected_test_name:
         # Test Case Generation Model Selection
         test_case_generation_model = st.selectbox("Select an LLM model:", llm_models, key="test_case_generation_model")
         
+        # Run the generation in the background workers (python worker.py) instead of this session
+        run_in_background = st.checkbox("Run in background worker", key="run_test_cases_in_background")
+
+        # An interrupted test case run of this session can be resumed with the inputs it was started with
+        test_case_run = None
+        stored_run = fetch_test_case_run(db, session_id)
+        if stored_run and stored_run[0].get("background") and stored_run[0]["status"] == RUNNING:
+            # The run is finished here if its last task was dead-lettered
+            if settle_background_run(db, session_id, stored_run[0]["run_id"]):
+                stored_run = fetch_test_case_run(db, session_id)
+        if stored_run and open_scenarios(stored_run[2]):
+            stored_test_case_run, _, stored_test_cases = stored_run
+            run_label = "Background test case run" if stored_test_case_run.get("background") else "Test case run"
+            st.info(
+                f"{run_label} {stored_test_case_run['run_id'][:8]} ({stored_test_case_run['status']}, started "
+                f"{stored_test_case_run['started_at']:%Y-%m-%d %H:%M}) has {len(open_scenarios(stored_test_cases))} of "
+                f"{stored_test_case_run['scenario_count']} scenarios pending or failed."
+            )
+            if is_resumable(stored_test_case_run, stored_test_cases) and st.button("Resume Test Case Run"):
+                if stored_test_case_run.get("background"):
+                    # The open scenarios are enqueued again for the background workers
+                    task_ids = resume_background_run(db, session_id, process_title, stored_test_case_run["run_id"])
+                    if task_ids is None:
+                        st.warning("The test case run was resumed or replaced in another tab.")
+                    else:
+                        st.success(f"{len(task_ids)} test case generation tasks were queued again.")
+                else:
+                    # The run is leased to this rerun, another tab can not resume it at the same time
+                    test_case_run = claim_test_case_run(db, session_id, stored_test_case_run["run_id"])
+                    if test_case_run is None:
+                        st.warning("The test case run was resumed or replaced in another tab.")
+
         # Create Test Case Button
         if st.button("Create Test Case"):
             # Check if the model output is available in the database
@@ -804,65 +985,105 @@ if selected_test_name:
             # else:
             #     # Show a warning message if no test cases are generated
             #     st.warning("No test cases were generated. Please select at least one test case type.")
-            # Iterate over the test scenarios and generate test cases
-            for scenario in test_scenarios:
-                # Merge all the details into a single string
-                scenario_details = "\n".join(f"{key}: {value}" for key, value in scenario.items())
-
-                # Combine the selected test case prompts
-                combined_prompts = []
-                for test_case_type, is_selected in selected_test_cases.items():
-                    if is_selected:
-                        specific_prompt = test_case_prompts.get(test_case_type, "")
-                        combined_prompts.append(f"Test Case Type: {test_case_type}\n{specific_prompt}")
-
-                scenario_details_text = f"Scenario Details:\n{scenario_details}"
-                combined_prompts_text = "Combined Test Case Prompts:\n" + "\n\n".join(combined_prompts)
-                test_case_structure_text = str(test_case_json_structure)
-
-                # Merge all prompts into a single combined prompt
-                combined_prompt = (
-                    f"{test_case_main_prompt}\n\n"
-                    f"{scenario_details_text}\n\n"
-                    f"{combined_prompts_text}\n\n"
-                    f"{test_case_structure_text}\n\n"
-                )
-
-                try:
-                    test_case_llm_output_json = generate_test_case(test_case_generation_model, combined_prompt, max_retries=3)
-                except Exception as e:
-                    st.error(f"An error occurred while generating test case from LLM: {e}")
-                    test_case_llm_output_json = {"error": "Failed to generate test case"}
-
-                test_case_data = {
-                    "scenario_id": scenario.get("ScenarioID", "Unknown"),
-                    "combined_prompt": combined_prompt,
-                    "test_case": test_case_llm_output_json,
-                }
-
-                generated_test_cases.append(test_case_data)
-
-            # Save `TestScenarios` and `TestCases` in `model_output`
-            model_output_to_save = {
-                "TestScenarios": test_scenarios,  # Assuming `test_scenarios` contains original scenario details
-                "TestCases": generated_test_cases,  # Assuming `generated_test_cases` contains test case outputs
+            # Selected test case types and their prompts
+            selected_test_case_prompts = {
+                test_case_type: test_case_prompts.get(test_case_type, "")
+                for test_case_type, is_selected in selected_test_cases.items()
+                if is_selected
             }
+            if model_output and run_in_background:
+                # Enqueue one task per scenario, the background workers save the results into the session
+                task_ids = enqueue_test_case_generation(
+                    db, session_id, process_title, test_scenarios, test_case_generation_model,
+                    test_case_main_prompt, selected_test_case_prompts
+                )
+                st.success(
+                    f"{len(task_ids)} test case generation tasks were queued, the test cases of "
+                    f"{len(test_scenarios) - len(task_ids)} unchanged scenarios were reused. "
+                    "Results appear in the database as the workers finish them."
+                )
+            elif model_output:
+                # Every scenario is checkpointed into the session as soon as it finishes, so an interrupted run can be resumed
+                test_case_run = start_test_case_run(
+                    db, session_id, test_scenarios, test_case_generation_model,
+                    test_case_main_prompt, selected_test_case_prompts
+                )
 
-            # Call the updated save function to save in the 'sessions' collection
-            save_model_output_to_db(session_id, model_output_to_save, db)
+        # Generate the open scenarios of a new or resumed run
+        if test_case_run is not None:
+            regenerated = set()
+
+            # Report every scenario as soon as its test cases are checkpointed
+            def on_test_case_result(index, entry):
+                regenerated.add(index)
+                if entry["status"] == FAILED:
+                    st.error(f"An error occurred while generating test case from LLM for {entry['scenario_id']}: {entry['error']}")
+
+            try:
+                generated_test_cases = run_test_cases(db, session_id, test_case_run, on_result=on_test_case_result)
+            except TestCaseRunReplaced as e:
+                # Another tab resumed or restarted the run, its scenarios are generated there
+                st.warning(f"{e} The test cases of the newer run are shown once it finishes.")
+                generated_test_cases = None
+
+        if test_case_run is not None and generated_test_cases is not None:
+            failed_scenarios = open_scenarios(generated_test_cases)
+            # Failed scenarios were also attempted in this rerun, they are neither reused nor open twice
+            reused = [index for index in range(len(generated_test_cases)) if index not in regenerated and index not in failed_scenarios]
+
+            # Look up the generated test cases in the cross-session duplicate index before adding them, with one query
+            # The matches are kept per TestCases entry, the TestCaseIDs repeat across scenarios
+            listed_cases = [
+                (index, case) for index, group in enumerate(generated_test_cases) for _, case in iter_test_cases([group])
+            ]
+            similar_elsewhere = {}
+            for (index, case), matches in zip(
+                listed_cases, find_similar_many(db, [case for _, case in listed_cases], exclude_session_id=session_id)
+            ):
+                similar_elsewhere.setdefault(index, []).append((case.get("TestCaseID"), matches))
+            index_test_cases(db, session_id, process_title, generated_test_cases)
+            session_buffer.set({"duplicate_index_version": INDEX_VERSION})
 
             # Confirmation message
+            profiler.begin("test_case_listing", size=len(generated_test_cases))
             if generated_test_cases:
-                st.success("Test cases created successfully and saved to the database!")
+                st.success(
+                    f"Test cases created successfully and saved to the database! "
+                    f"{len(regenerated)} regenerated, {len(reused)} reused unchanged."
+                )
+                if failed_scenarios:
+                    st.warning(f"{len(failed_scenarios)} scenarios failed. Resume the test case run to retry only these scenarios.")
                 st.write("### Generated Test Cases")
                 for i, test_case in enumerate(generated_test_cases):
-                    with st.expander(f"Test Case {i + 1}: Scenario ID - {test_case['scenario_id']}", expanded=False):
+                    reused_label = " (reused)" if i in reused else ""
+                    with st.expander(f"Test Case {i + 1}: Scenario ID - {test_case['scenario_id']}{reused_label}", expanded=False):
+                        # Flag the test cases which already exist in other sessions
+                        for test_case_id, matches in similar_elsewhere.get(i, []):
+                            if matches:
+                                best = matches[0]
+                                st.warning(
+                                    f"{test_case_id} already exists elsewhere: {best.get('process_title')} / "
+                                    f"{best['scenario_id']} / {best['test_case_id']} ({best['similarity']:.0%} similar)"
+                                )
                         st.json(test_case["test_case"])
             else:
                 st.warning("No test cases were generated. Please select at least one test case type.")
+            profiler.end("test_case_listing")
 
 
 
     else:
         # Show a warning message if the required fields are not provided
-        st.info("Please provide all the required inputs!",icon="ℹ️")
\ No newline at end of file
+        st.info("Please provide all the required inputs!",icon="ℹ️")
+
+# Flush the remaining changes at the end of the rerun
+session_buffer.flush()
+st.sidebar.caption(f"Database writes avoided: {session_buffer.writes_avoided}")
+
+# Store and show the profile of this rerun if profiling is enabled
+if profiler.finish_rerun(db):
+    render_profile(profiler)
+
+# End the trace of this rerun, the time not spent in a child span is the rendering
+rerun_span.end()
+
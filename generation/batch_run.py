@@ -0,0 +1,303 @@
+"""
+This script runs the whole generation pipeline without the Streamlit UI for every document in a directory:
+generate_customise_base_prompt -> generate_prompt -> run_model_on_prompt -> generate_test_case.
+The document analysis of the app only helps a user to choose the test type, the batch config names it instead.
+Documents are processed concurrently with a bounded worker pool. The progress of every document is checkpointed
+per stage in MongoDB, so a rerun skips the finished documents and resumes the unfinished ones from the last stage.
+
+Usage:
+    python batch_run.py <documents_dir> --config batch_config.json --workers 4 --summary summary.json
+
+Example config:
+    {
+        "test_name": "Functional Testing",
+        "category": "Functional",
+        "document_type": "Requirements Document",
+        "scenario_model": "llama3.2",
+        "test_case_model": "llama3.2",
+        "instruction_elements": null,
+        "scoring_elements": null,
+        "test_case_types": null,
+        "process_title_prefix": "Batch"
+    }
+Element and type lists set to null select all the elements of the test type.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from database import get_db, prepare_database, get_default_prompts_collection, save_generated_prompt
+from file_reader import read_txt, read_docx, read_xlsx, read_python, read_cpp, read_c, read_xml
+from create_special_test_prompt import generate_customise_base_prompt
+from prompt_generate import generate_prompt
+from run_model import run_model_on_prompt, save_model_output_to_db
+from generate_test_case import generate_test_case, build_test_case_prompt, test_case_input_hash
+from duplicate_index import index_test_cases, INDEX_VERSION
+from llm_client import llm_context
+from llm_scheduler import BATCH
+from tracing import span
+
+# Collection for the per-document checkpoints
+CHECKPOINT_COLLECTION = "batch_checkpoints"
+
+# File readers per extension
+READERS = {
+    "txt": read_txt,
+    "docx": read_docx,
+    "xlsx": read_xlsx,
+    "py": read_python,
+    "cpp": read_cpp,
+    "c": read_c,
+    "xml": read_xml,
+}
+
+# Default values of the batch config
+DEFAULT_CONFIG = {
+    "test_name": "Functional Testing",
+    "category": "Functional",
+    "document_type": "Requirements Document",
+    "scenario_model": "llama3.2",
+    "test_case_model": "llama3.2",
+    "instruction_elements": None,
+    "scoring_elements": None,
+    "test_case_types": None,
+    "process_title_prefix": "Batch",
+}
+
+
+# Read a document with the reader of its extension
+def read_document(path):
+    """ Returns the text content of the document, Excel files are converted to text. """
+    ext = path.rsplit(".", 1)[-1].lower()
+    with open(path, "rb") as file:
+        content = READERS[ext](file)
+    if hasattr(content, "to_string"):
+        content = content.to_string(index=False)
+    return content
+
+
+# Select the given names from the elements, all of them if names is None
+def select_elements(elements, names):
+    """ Returns a dictionary of element name -> selected. """
+    return {name: names is None or name in names for name in elements}
+
+
+class DocumentJob:
+    """ Runs the pipeline for a single document and checkpoints every finished stage. """
+
+    def __init__(self, db, path, config, default_prompt, force=False):
+        self.db = db
+        self.path = path
+        self.config = config
+        self.default_prompt = default_prompt
+        self.collection = db[CHECKPOINT_COLLECTION]
+
+        with open(path, "rb") as file:
+            content_hash = hashlib.sha1(file.read()).hexdigest()
+        config_hash = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+        # The path is part of the key, copies of the same document are separate sessions and do not share a checkpoint
+        self.key = hashlib.sha1(f"{os.path.abspath(path)}:{content_hash}:{config_hash}".encode("utf-8")).hexdigest()
+        self.session_id = f"batch_{self.key[:16]}"
+
+        if force:
+            self.collection.delete_one({"_id": self.key})
+        self.checkpoint = self.collection.find_one({"_id": self.key}) or {}
+
+    # Run a stage or return its checkpointed result
+    def stage(self, name, function, *args, llm=True):
+        stages = self.checkpoint.setdefault("stages", {})
+        if name in stages:
+            return stages[name]
+
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+
+        # Failed stages (None) are not checkpointed so they are retried on the next run
+        if result is None:
+            return None
+
+        stages[name] = result
+        self.collection.update_one(
+            {"_id": self.key},
+            {
+                "$set": {f"stages.{name}": result, "updated_at": datetime.now()},
+                "$inc": {"llm_seconds": elapsed if llm else 0.0},
+            },
+            upsert=True
+        )
+        self.checkpoint["llm_seconds"] = self.checkpoint.get("llm_seconds", 0.0) + (elapsed if llm else 0.0)
+        return result
+
+    # Set the status of the document
+    def set_status(self, status, **fields):
+        self.checkpoint["status"] = status
+        self.collection.update_one(
+            {"_id": self.key},
+            {"$set": {"status": status, "path": self.path, "session_id": self.session_id, "updated_at": datetime.now(), **fields}},
+            upsert=True
+        )
+
+    def run(self):
+        """ Runs the pipeline and returns a result dictionary for the summary. """
+        if self.checkpoint.get("status") == "done":
+            return {"path": self.path, "status": "skipped", "llm_seconds": 0.0}
+
+        # Batch documents yield to the interactive sessions, each document is its own owner in the fair queue
+        with llm_context(self.session_id, BATCH), span("batch_document", kind="batch", session_id=self.session_id, path=self.path):
+            return self._run()
+
+    def _run(self):
+        self.set_status("running")
+        config = self.config
+        try:
+            document_content = read_document(self.path)
+            process_title = f"{config['process_title_prefix']}_{os.path.splitext(os.path.basename(self.path))[0]}"
+
+            customised_prompt = self.stage(
+                "customised_prompt", generate_customise_base_prompt,
+                config["test_name"], config["document_type"], document_content, self.default_prompt["test_prompt"]
+            )
+
+            instruction_elements = self.default_prompt.get("test_instruction_elements_and_prompts", {})
+            scoring_elements = self.default_prompt.get("test_scoring_elements_and_prompts", {})
+            combined_prompt = self.stage(
+                "prompt", generate_prompt,
+                process_title, config["document_type"], customised_prompt, document_content, config["test_name"],
+                select_elements(instruction_elements, config["instruction_elements"]), instruction_elements,
+                select_elements(scoring_elements, config["scoring_elements"]), scoring_elements,
+                llm=False
+            )
+
+            model_output = self.stage("scenarios", run_model_on_prompt, config["scenario_model"], combined_prompt)
+            if not model_output:
+                raise RuntimeError("Model output validation failed.")
+            test_scenarios = model_output["TestScenarios"]
+
+            test_case_prompts = self.default_prompt.get("test_case_create_prompts", {})
+            selected_test_case_prompts = {
+                name: prompt for name, prompt in test_case_prompts.items()
+                if config["test_case_types"] is None or name in config["test_case_types"]
+            }
+
+            generated_test_cases = []
+            for i, scenario in enumerate(test_scenarios):
+                scenario_prompt = build_test_case_prompt(
+                    self.default_prompt.get("test_case_main_prompt", ""), scenario, selected_test_case_prompts
+                )
+                test_case = self.stage(
+                    f"test_case_{i}", generate_test_case, config["test_case_model"], scenario_prompt
+                )
+                generated_test_cases.append({
+                    "scenario_id": scenario.get("ScenarioID", "Unknown"),
+                    "combined_prompt": scenario_prompt,
+                    "test_case": test_case,
+                    "input_hash": test_case_input_hash(
+                        scenario, self.default_prompt.get("test_case_main_prompt", ""), selected_test_case_prompts,
+                        config["test_case_model"]
+                    ),
+                })
+
+            # Save the results in a session document like the Streamlit app does
+            save_generated_prompt(self.session_id, combined_prompt)
+            save_model_output_to_db(self.session_id, {"TestScenarios": test_scenarios, "TestCases": generated_test_cases}, self.db)
+            index_test_cases(self.db, self.session_id, process_title, generated_test_cases)
+            self.db["sessions"].update_one(
+                {"session_id": self.session_id},
+                {"$set": {
+                    "process_title": process_title,
+                    "document_type": config["document_type"],
+                    "selected_category": config["category"],
+                    "selected_test_type": config["test_name"],
+                    "duplicate_index_version": INDEX_VERSION,
+                }},
+                upsert=True
+            )
+
+            self.set_status("done", scenario_count=len(test_scenarios))
+            return {"path": self.path, "status": "done", "llm_seconds": self.checkpoint.get("llm_seconds", 0.0)}
+
+        except Exception as e:
+            logging.error(f"{self.path}: {e}")
+            self.set_status("failed", error=str(e))
+            return {"path": self.path, "status": "failed", "error": str(e), "llm_seconds": self.checkpoint.get("llm_seconds", 0.0)}
+
+
+# Find the supported documents in a directory
+def find_documents(directory):
+    """ Returns the paths of the supported documents in the directory, sorted by name. """
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, name)) and name.rsplit(".", 1)[-1].lower() in READERS
+    )
+
+
+# Run the pipeline for every document
+def run_batch(directory, config, workers=4, force=False):
+    """ Processes the documents concurrently and returns the throughput summary. """
+    db = get_db()
+    # The indexes and the telemetry writer are in place before the first document
+    prepare_database().join()
+    default_prompt = get_default_prompts_collection().find_one({"test_name": config["test_name"]})
+    if not default_prompt:
+        raise ValueError(f"No default prompt found for test type: {config['test_name']}")
+
+    paths = find_documents(directory)
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(DocumentJob(db, path, config, default_prompt, force=force).run) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            logging.info(f"{result['path']}: {result['status']}")
+            results.append(result)
+    elapsed = time.perf_counter() - started
+
+    processed = [result for result in results if result["status"] != "skipped"]
+    done = [result for result in processed if result["status"] == "done"]
+    return {
+        "documents": len(paths),
+        "done": len(done),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "skipped": sum(1 for result in results if result["status"] == "skipped"),
+        "workers": workers,
+        "wall_seconds": round(elapsed, 2),
+        "docs_per_minute": round(len(done) / elapsed * 60, 3) if elapsed and done else 0.0,
+        "llm_seconds_per_doc": round(sum(result["llm_seconds"] for result in processed) / len(processed), 2) if processed else 0.0,
+        "results": sorted(results, key=lambda result: result["path"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the generation pipeline for every document in a directory.")
+    parser.add_argument("directory", help="Directory with txt/docx/xlsx/py/cpp/c/xml documents.")
+    parser.add_argument("--config", help="JSON file with the test type and model configuration.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of documents processed concurrently.")
+    parser.add_argument("--force", action="store_true", help="Ignore the checkpoints and process every document again.")
+    parser.add_argument("--summary", help="Write the throughput summary to this JSON file.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as file:
+            config.update(json.load(file))
+
+    summary = run_batch(args.directory, config, workers=args.workers, force=args.force)
+    output = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, "w") as file:
+            file.write(output)
+    print(f"{summary['done']} done, {summary['failed']} failed, {summary['skipped']} skipped in {summary['wall_seconds']}s")
+    print(f"Throughput: {summary['docs_per_minute']} docs/min, {summary['llm_seconds_per_doc']} LLM seconds per doc")
+
+
+if __name__ == "__main__":
+    main()
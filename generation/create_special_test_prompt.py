@@ -1,7 +1,8 @@
 """ This module generates a specialized test prompt based on the provided inputs, including a document's type, content, and a selected test name. The generated prompt is customized to align with the selected test name and the document's characteristics, ensuring precise and context-specific test scenario generation. The resulting prompt is designed to guide the creation of high-quality test scenarios that adhere to ISTQB standards and methodologies. The module utilizes the llama3.2 model through the Ollama. """
 
-from llama_index.llms.ollama import Ollama
-from requests.exceptions import ConnectionError, Timeout
+import llm_client
+from metrics import JSON_VALIDATION_FAILURES
+from tracing import traced
 import json
 
 # Function to create a specialized test prompt based on the provided inputs
@@ -63,6 +64,7 @@ def create_customise_test_prompt(selected_test_name, document_type, document_con
 
 
 # Function to generate a specialized test prompt based on the provided inputs
+@traced()
 def generate_customise_base_prompt(selected_test_name, document_type, document_content, test_prompt, max_retries=3):
     """
     This function generates a specialized test prompt based on the provided inputs, including a document's type, content, and a selected test name.
@@ -80,8 +82,7 @@ def generate_customise_base_prompt(selected_test_name, document_type, document_c
     while attempts < max_retries:
         # Attempt to connect to the LLM model and generate a specialized test prompt
         try:
-            llm = Ollama(model="llama3.2", request_timeout=300.0, json_mode=True) # Initialize the LLM model
-            resp = llm.complete(customised_prompt) # Generate a specialized test prompt
+            resp = llm_client.complete("llama3.2", customised_prompt, json_mode=True, site="generate_customise_base_prompt", attempt=attempts + 1) # Generate a specialized test prompt
             
             # Parse the JSON text into a Python dictionary
             generated_customise_prompt = json.loads(resp.text)  # JSON string to dict
@@ -94,11 +95,14 @@ def generate_customise_base_prompt(selected_test_name, document_type, document_c
 
         except (json.JSONDecodeError, KeyError) as e:
             # JSON parsing error or missing key
+            JSON_VALIDATION_FAILURES.inc(
+                site="generate_customise_base_prompt", reason="invalid_json" if isinstance(e, json.JSONDecodeError) else "structure"
+            )
             attempts += 1
             # Retry if attempts are within the limit
             if attempts >= max_retries:
                 raise ValueError(f"Error: All attempts failed. Last error: {e}")
-        except (ConnectionError, Timeout) as e:
+        except llm_client.transport_errors() as e:
             # Connection or timeout error
             attempts += 1
             # Retry if attempts are within the limit
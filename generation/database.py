@@ -3,18 +3,54 @@ This script includes functions to interact with MongoDB and fetch data from it.
 It includes functions to fetch test names, fetch scenarios, update scenarios, initialize session, save generated prompt and fetch model output from MongoDB.
 """
 
-import os
-from pymongo import MongoClient
-
-# MongoDB URI from environment variable
-MONGO_URI = os.getenv("MONGO_URI")
-# MongoDB client and database
-client = MongoClient(MONGO_URI)
-db = client["modular_test_scenario_gen"]  # Database name
+import logging
+import threading
+from pymongo.errors import PyMongoError
+from indexes import ensure_indexes
+from llm_telemetry import configure_telemetry
+from mongo_client import get_client, DATABASE_NAME
+from tracing import configure_tracing
+
+# The MongoDB client shared by every module of this process (mongo_client.py) and the database
+client = get_client()
+db = client[DATABASE_NAME]  # Database name
+
+# The thread which prepares the database, started once per process
+_prepare_thread = None
+_prepare_lock = threading.Lock()
+
+
+# Provision the indexes and start the telemetry and trace writers
+def _prepare(database):
+    try:
+        created = ensure_indexes(database)
+        if created:
+            logging.info(f"Created MongoDB indexes: {', '.join(created)}")
+    except PyMongoError as e:
+        logging.warning(f"Index provisioning failed: {e}")
+    # Write the LLM call telemetry and the trace spans of this process to the database
+    configure_telemetry(database)
+    configure_tracing(database)
+
+
+# Prepare the database once per process
+def prepare_database():
+    """
+    Provisions the indexes and starts writing the telemetry and the trace spans on the first call of the process.
+    The work runs in a background thread, so an unreachable server does not block the import or the first rerun
+    for the server selection timeout. Returns the thread.
+    """
+    global _prepare_thread
+    with _prepare_lock:
+        if _prepare_thread is None:
+            _prepare_thread = threading.Thread(target=_prepare, args=(db,), name="prepare-database", daemon=True)
+            _prepare_thread.start()
+        return _prepare_thread
 
 # getter function for database and collections
 def get_db():
-    """ Returns the database object """
+    """ Returns the database object, the indexes are provisioned on the first call """
+    prepare_database()
     return db
 
 # getter function for collections
@@ -0,0 +1,236 @@
+"""
+This module maintains a global, cross-session similarity index over the generated test cases.
+Every test case is stored once in the test_case_index collection with a MinHash signature and LSH band keys,
+so similar test cases from other sessions can be found with a single indexed query instead of a pairwise scan.
+New test cases are added incrementally as they are generated. Run it as a script with --backfill to index existing sessions.
+"""
+
+import argparse
+import hashlib
+import random
+import re
+from datetime import datetime
+from pymongo import UpdateOne, DeleteMany
+from tracing import traced
+
+# Name of the index collection
+INDEX_COLLECTION = "test_case_index"
+
+# MinHash parameters: NUM_BANDS * ROWS_PER_BAND permutations.
+# 16 bands of 4 rows find pairs with a Jaccard similarity above ~0.5 with high probability.
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+# Test cases whose band keys are looked up with one query
+FIND_BATCH_SIZE = 500
+
+# Version of the signature, stored with every entry so a parameter change can be detected
+INDEX_VERSION = 1
+
+# Fixed permutation coefficients so signatures are comparable across processes
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20250101)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+# Text of a test case used for the similarity
+def case_text(case):
+    """ Returns the normalized Title, Description and Objective of a test case. """
+    text = " ".join(str(case.get(field) or "") for field in ("Title", "Description", "Objective"))
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+# Word shingles of a text
+def _shingles(text):
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+# MinHash signature of a text
+def minhash_signature(text):
+    """ Returns the MinHash signature of the word shingles of the text. """
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for shingle in _shingles(text)
+    ]
+    if not hashes:
+        return [0] * NUM_PERMUTATIONS
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+# LSH band keys of a signature
+def band_keys(signature):
+    """ Returns one key per band, two signatures sharing a key are candidates. """
+    return [
+        f"{band}:" + hashlib.blake2b(
+            ",".join(str(value) for value in signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).encode("utf-8"),
+            digest_size=8
+        ).hexdigest()
+        for band in range(NUM_BANDS)
+    ]
+
+
+# Estimated Jaccard similarity of two signatures
+def estimate_similarity(first, second):
+    """ Returns the share of equal MinHash values. """
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERMUTATIONS
+
+
+# Iterate over the test cases of a model_output.TestCases list
+def iter_test_cases(test_case_groups):
+    """
+    Yields (scenario_id, test_case) pairs from the stored test case groups.
+    The test_case field can be a list or a dictionary with a TestCases list.
+    """
+    for group in test_case_groups or []:
+        scenario_id = group.get("scenario_id", "Unknown Scenario")
+        data = group.get("test_case") or []
+        if isinstance(data, dict):
+            data = data.get("TestCases", [])
+        if not isinstance(data, list):
+            continue
+        for case in data:
+            if isinstance(case, dict) and (case.get("Title") or case.get("Description")):
+                yield scenario_id, case
+
+
+# Add or update test cases in the index
+@traced()
+def index_test_cases(db, session_id, process_title, test_case_groups):
+    """
+    Adds the test cases of a session to the index. Existing entries of the same
+    (session_id, scenario_id, test_case_id) are replaced, so it is safe to call again after a regeneration.
+    Returns the number of indexed test cases.
+    """
+    operations = []
+    indexed_ids = {}
+    for scenario_id, case in iter_test_cases(test_case_groups):
+        text = case_text(case)
+        signature = minhash_signature(text)
+        test_case_id = case.get("TestCaseID", "Unknown")
+        indexed_ids.setdefault(scenario_id, []).append(test_case_id)
+        operations.append(UpdateOne(
+            {"session_id": session_id, "scenario_id": scenario_id, "test_case_id": test_case_id},
+            {"$set": {
+                "process_title": process_title,
+                "title": case.get("Title"),
+                "fingerprint": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                "signature": signature,
+                "bands": band_keys(signature),
+                "version": INDEX_VERSION,
+                "updated_at": datetime.now(),
+            }},
+            upsert=True
+        ))
+    # Test cases which are no longer generated for a scenario are removed from the index
+    for group in test_case_groups or []:
+        scenario_id = group.get("scenario_id", "Unknown Scenario")
+        operations.append(DeleteMany({
+            "session_id": session_id,
+            "scenario_id": scenario_id,
+            "test_case_id": {"$nin": indexed_ids.get(scenario_id, [])}
+        }))
+    if operations:
+        db[INDEX_COLLECTION].bulk_write(operations, ordered=False)
+    return sum(len(ids) for ids in indexed_ids.values())
+
+
+# Find similar test cases from other sessions or processes
+def find_similar(db, case, exclude_session_id=None, exclude_process_title=None, threshold=DEFAULT_THRESHOLD, limit=5):
+    """
+    Returns the indexed test cases which are similar to the given test case, most similar first.
+    Each result contains session_id, process_title, scenario_id, test_case_id, title and similarity.
+    """
+    return find_similar_many(db, [case], exclude_session_id, exclude_process_title, threshold, limit)[0]
+
+
+# Find similar test cases for many test cases at once
+@traced()
+def find_similar_many(db, cases, exclude_session_id=None, exclude_process_title=None, threshold=DEFAULT_THRESHOLD, limit=5):
+    """
+    Returns one list of matches per given test case, in the order of the cases (see find_similar).
+    The band keys of up to FIND_BATCH_SIZE test cases are looked up with a single $in query, instead of one query per test case.
+    """
+    results = []
+    for start in range(0, len(cases), FIND_BATCH_SIZE):
+        results.extend(_find_similar_batch(db, cases[start:start + FIND_BATCH_SIZE], exclude_session_id, exclude_process_title, threshold, limit))
+    return results
+
+
+# Look up one batch of test cases
+def _find_similar_batch(db, cases, exclude_session_id, exclude_process_title, threshold, limit):
+    signatures = []
+    fingerprints = []
+    positions_by_band = {}
+    for position, case in enumerate(cases):
+        text = case_text(case)
+        signature = minhash_signature(text)
+        signatures.append(signature)
+        fingerprints.append(hashlib.sha1(text.encode("utf-8")).hexdigest())
+        for key in band_keys(signature):
+            positions_by_band.setdefault(key, []).append(position)
+
+    matches = [[] for _ in cases]
+    if not cases:
+        return matches
+    query = {"bands": {"$in": list(positions_by_band)}, "version": INDEX_VERSION}
+    if exclude_session_id is not None:
+        query["session_id"] = {"$ne": exclude_session_id}
+    if exclude_process_title is not None:
+        query["process_title"] = {"$ne": exclude_process_title}
+
+    for entry in db[INDEX_COLLECTION].find(query, {"_id": 0, "updated_at": 0}):
+        # The entry is a candidate of every case it shares a band with
+        candidates = {position for key in entry["bands"] for position in positions_by_band.get(key, [])}
+        for position in candidates:
+            if entry["fingerprint"] == fingerprints[position]:
+                similarity = 1.0
+            else:
+                similarity = estimate_similarity(signatures[position], entry["signature"])
+            if similarity >= threshold:
+                match = {key: value for key, value in entry.items() if key not in ("bands", "signature", "fingerprint")}
+                match["similarity"] = round(similarity, 3)
+                matches[position].append(match)
+    for case_matches in matches:
+        case_matches.sort(key=lambda entry: entry["similarity"], reverse=True)
+        del case_matches[limit:]
+    return matches
+
+
+# Index the sessions which are not in the index yet
+def backfill(db):
+    """
+    Indexes the test cases of every session that has not been indexed with the current version.
+    Already indexed sessions are skipped, so the backfill can be interrupted and run again.
+    Returns the number of indexed sessions.
+    """
+    sessions = db["sessions"]
+    count = 0
+    for session in sessions.find(
+        {"model_output.TestCases": {"$exists": True}, "duplicate_index_version": {"$ne": INDEX_VERSION}},
+        {"session_id": 1, "process_title": 1, "model_output.TestCases": 1}
+    ):
+        index_test_cases(db, session.get("session_id"), session.get("process_title"), session["model_output"]["TestCases"])
+        sessions.update_one({"_id": session["_id"]}, {"$set": {"duplicate_index_version": INDEX_VERSION}})
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the cross-session test case duplicate index.")
+    parser.add_argument("--backfill", action="store_true", help="Index the sessions which are not indexed yet.")
+    args = parser.parse_args()
+
+    from database import get_db
+    if args.backfill:
+        print(f"Indexed sessions: {backfill(get_db())}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,36 @@
 """ This module contains functions to read different types of files. """
 
 import io
-import docx
-import pandas as pd
+from tracing import traced
 
 # Function to read a text file
+@traced()
 def read_txt(file):
     """Read the text file."""
     file_content = file.read().decode('utf-8')
     return file_content
 
 # Function to read a docx file
+@traced()
 def read_docx(file):
     """Using python-docx to read the docx file."""
+    # python-docx is imported at the first docx upload so it does not slow down the app start
+    import docx
     doc = docx.Document(io.BytesIO(file.read()))
     doc_content = "\n".join([para.text for para in doc.paragraphs])
     return doc_content
 
 # Function to read an xlsx file
+@traced()
 def read_xlsx(file):
     """Using pandas to read the excel file."""
+    # pandas is imported at the first excel upload so it does not slow down the app start
+    import pandas as pd
     df = pd.read_excel(io.BytesIO(file.read()))
     return df
 
 # Function to read a csv file
+@traced()
 def read_python(file):
     """Read the Python (.py) file."""
     file_content = file.read().decode('utf-8')
@@ -31,6 +38,7 @@ def read_python(file):
 
 
 # Function to read a cpp file
+@traced()
 def read_cpp(file):
     """Read the C++ (.cpp) file."""
     file_content = file.read().decode('utf-8')
@@ -38,12 +46,14 @@ def read_cpp(file):
 
 
 # Function to read a c file
+@traced()
 def read_c(file):
     """Read the C (.c) file."""
     file_content = file.read().decode('utf-8')
     return file_content
 
 # Function to read a XML file
+@traced()
 def read_xml(file):
     """Read the XML file."""
     file_content = file.read().decode('utf-8')
@@ -1,7 +1,9 @@
 """ This module contains the function to generate test cases based on the generated test scenario. """
 
-from llama_index.llms.ollama import Ollama
-from requests.exceptions import ConnectionError, Timeout
+import llm_client
+from metrics import JSON_VALIDATION_FAILURES
+from tracing import traced
+import hashlib
 import json
 
 # Function to generate a JSON structure for test scenarios
@@ -47,7 +49,76 @@ def generate_json_structure():
     # Return the JSON structure as a string
     return json_structure
 
+# Function to build the prompt for generating the test cases of a single scenario
+def build_test_case_prompt(test_case_main_prompt, scenario, selected_test_case_prompts, test_case_json_structure=None):
+    """
+    Builds the combined test case prompt for a scenario.
+
+    Args:
+        test_case_main_prompt (str): Main test case prompt of the test type.
+        scenario (dict): Test scenario from the model output.
+        selected_test_case_prompts (dict): Selected test case types and their prompts.
+        test_case_json_structure (str): JSON structure for the output, generate_json_structure() by default.
+
+    Returns:
+        str: The combined prompt.
+    """
+    if test_case_json_structure is None:
+        test_case_json_structure = generate_json_structure()
+
+    # Merge all the details into a single string
+    scenario_details = "\n".join(f"{key}: {value}" for key, value in scenario.items())
+
+    # Combine the selected test case prompts
+    combined_prompts = [
+        f"Test Case Type: {test_case_type}\n{specific_prompt}"
+        for test_case_type, specific_prompt in selected_test_case_prompts.items()
+    ]
+
+    scenario_details_text = f"Scenario Details:\n{scenario_details}"
+    combined_prompts_text = "Combined Test Case Prompts:\n" + "\n\n".join(combined_prompts)
+    test_case_structure_text = str(test_case_json_structure)
+
+    # Merge all prompts into a single combined prompt
+    return (
+        f"{test_case_main_prompt}\n\n"
+        f"{scenario_details_text}\n\n"
+        f"{combined_prompts_text}\n\n"
+        f"{test_case_structure_text}\n\n"
+    )
+
+# Function to hash the inputs of the test case generation of a scenario
+def test_case_input_hash(scenario, test_case_main_prompt, selected_test_case_prompts, model):
+    """
+    Returns a SHA-256 hash of everything the test cases of a scenario are generated from:
+    the scenario fields, the main test case prompt, the selected test case types with their prompts and the model.
+    The key order of the scenario and the prompts does not change the hash.
+    """
+    inputs = {
+        "scenario": scenario,
+        "test_case_main_prompt": test_case_main_prompt,
+        "selected_test_case_prompts": selected_test_case_prompts,
+        "model": model,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+# Function to find the stored test cases which can be reused
+def reusable_test_cases(test_case_groups):
+    """
+    Returns the stored TestCases entries by their input_hash.
+    Only finished entries are returned: pending, failed and entries stored before the input hash was added are regenerated.
+    """
+    return {
+        group["input_hash"]: group
+        for group in test_case_groups or []
+        if group.get("input_hash")
+        and group.get("status", "done") == "done"
+        and isinstance(group.get("test_case"), (dict, list))
+        and not (isinstance(group["test_case"], dict) and "error" in group["test_case"])
+    }
+
 # Function to generate test cases based on the generated test scenario
+@traced()
 def generate_test_case(model, combined_prompt, max_retries=3):
     """
     Generates test cases based on the generated test scenario.
@@ -69,14 +140,13 @@ def generate_test_case(model, combined_prompt, max_retries=3):
     while attempts < max_retries:
         # Attempt to connect to the LLM model and generate test cases
         try:
-            # Initialize the LLM model
-            llm = Ollama(model=model, request_timeout=300.0, json_mode=True)
-            resp = llm.complete(combined_prompt) # Generate test cases
+            resp = llm_client.complete(model, combined_prompt, json_mode=True, site="generate_test_case", attempt=attempts + 1) # Generate test cases
             
             # Parse the JSON text into a Python dictionary
             try:
                 test_case_llm_output_json = json.loads(resp.text)  # JSON string to dict
             except json.JSONDecodeError as decode_error:
+                JSON_VALIDATION_FAILURES.inc(site="generate_test_case", reason="invalid_json")
                 raise ValueError(f"Failed to parse JSON from LLM response: {decode_error}")
             # Return the validated JSON output
             return test_case_llm_output_json
@@ -86,7 +156,7 @@ def generate_test_case(model, combined_prompt, max_retries=3):
             attempts += 1
             if attempts >= max_retries:
                 raise ValueError(f"Error: All attempts failed. Last error: {e}")
-        except (ConnectionError, Timeout) as e:
+        except llm_client.transport_errors() as e:
             # Connection or timeout error
             attempts += 1
             if attempts >= max_retries:
@@ -0,0 +1,160 @@
+"""
+This module provisions the MongoDB indexes used by the generation and selection apps and checks the query plans of every query shape they use.
+Run it as a script to create the indexes, or with --explain to print the query plans and flag collection scans.
+"""
+
+import argparse
+import logging
+import sys
+from pymongo import ASCENDING, DESCENDING
+
+# Indexes per collection as (name, keys, options)
+# The compound index also serves the process_title uniqueness check because process_title is its prefix.
+INDEXES = {
+    "sessions": [
+        ("session_id_1", [("session_id", ASCENDING)], {}),
+        (
+            "process_title_1_selected_category_1_selected_test_type_1",
+            [("process_title", ASCENDING), ("selected_category", ASCENDING), ("selected_test_type", ASCENDING)],
+            {},
+        ),
+    ],
+    "smart_selection_logs": [
+        ("RunID_1_Step_1", [("RunID", ASCENDING), ("Step", ASCENDING)], {}),
+    ],
+    "test_case_index": [
+        ("bands_1", [("bands", ASCENDING)], {}),
+        (
+            "session_id_1_scenario_id_1_test_case_id_1",
+            [("session_id", ASCENDING), ("scenario_id", ASCENDING), ("test_case_id", ASCENDING)],
+            {"unique": True},
+        ),
+    ],
+    # The lease query filters on type and status and sorts by priority and age
+    "task_queue": [
+        (
+            "type_1_status_1_priority_-1_created_at_1",
+            [("type", ASCENDING), ("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)],
+            {},
+        ),
+    ],
+    # Spans are listed per session and per trace, they expire after 7 days
+    "traces": [
+        ("session_id_1_parent_id_1_start_-1", [("session_id", ASCENDING), ("parent_id", ASCENDING), ("start", DESCENDING)], {}),
+        ("trace_id_1", [("trace_id", ASCENDING)], {}),
+        ("start_1", [("start", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600}),
+    ],
+    # Cached judge verdicts are looked up by _id, they expire after 30 days
+    "judge_verdicts": [
+        ("created_at_1", [("created_at", ASCENDING)], {"expireAfterSeconds": 30 * 24 * 3600}),
+    ],
+    # Rerun profiles are only written when profiling is enabled, they expire after 7 days
+    "rerun_profiles": [
+        ("created_at_1", [("created_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600}),
+    ],
+}
+
+# Query shapes used by the apps as (description, collection, filter, projection, collection scan expected)
+QUERY_SHAPES = [
+    ("session by session_id", "sessions", {"session_id": "20250101000000"}, None, False),
+    ("original prompt by session_id and test_name", "sessions",
+     {"session_id": "20250101000000", "original_prompts.test_name": "Functional Testing"}, None, False),
+    ("process title uniqueness check", "sessions", {"process_title": "Process"}, None, False),
+    ("details by combination", "sessions",
+     {"process_title": "Process", "selected_category": "Functional", "selected_test_type": "Functional Testing"},
+     {"process_title": 1, "selected_category": 1, "selected_test_type": 1, "model_output.TestCases": 1}, False),
+    ("valid combinations", "sessions",
+     {"process_title": {"$ne": None}, "selected_category": {"$ne": None}, "selected_test_type": {"$ne": None}},
+     {"_id": 0, "process_title": 1, "selected_category": 1, "selected_test_type": 1}, False),
+    ("comparison logs by run", "smart_selection_logs", {"RunID": "run"}, {"_id": 0}, False),
+    ("similar test cases by band", "test_case_index",
+     {"bands": {"$in": ["0:0000000000000000", "1:0000000000000000"]}, "session_id": {"$ne": "20250101000000"}}, None, False),
+    ("next task to lease", "task_queue",
+     {"type": {"$in": ["generate_test_cases"]}, "$or": [{"status": "queued"}, {"status": "leased"}]}, None, False),
+    ("traces of a session", "traces", {"session_id": "20250101000000", "parent_id": None}, {"_id": 0}, False),
+    ("spans of a trace", "traces", {"trace_id": "trace"}, {"_id": 0}, False),
+    # The default prompts collection only holds one document per test type
+    ("default prompts", "default_prompts", {}, None, True),
+]
+
+
+# Create the missing indexes
+def ensure_indexes(db):
+    """
+    Creates the indexes in INDEXES if they do not exist yet.
+    Indexes that already exist with the same keys are left untouched, so it is safe to call on every startup.
+    Returns the names of the created indexes.
+    """
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing_keys = [
+            [tuple(key) for key in info["key"]] for info in collection.index_information().values()
+        ]
+        for name, keys, options in indexes:
+            if keys in existing_keys:
+                continue
+            collection.create_index(keys, name=name, **options)
+            created.append(name)
+    return created
+
+
+# Collect the stage names of a query plan
+def _plan_stages(plan):
+    """ Returns all stage names of a (nested) query plan. """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key in ("inputStage", "queryPlan"):
+            if key in plan:
+                stages.extend(_plan_stages(plan[key]))
+        for child in plan.get("inputStages", []):
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+# Run explain() on every query shape
+def explain_query_shapes(db):
+    """
+    Runs explain() on every query shape in QUERY_SHAPES.
+    Returns a list of dictionaries with the description, the stages of the winning plan and whether it is flagged.
+    """
+    report = []
+    for description, collection_name, query, projection, collscan_expected in QUERY_SHAPES:
+        plan = db[collection_name].find(query, projection).explain()
+        stages = _plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({
+            "query": description,
+            "collection": collection_name,
+            "stages": stages,
+            "flagged": "COLLSCAN" in stages and not collscan_expected,
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision MongoDB indexes and check query plans.")
+    parser.add_argument("--explain", action="store_true", help="Run explain() on every query shape and flag collection scans.")
+    args = parser.parse_args()
+
+    # Imported here so the module can be used without opening a connection
+    from database import get_db
+    db = get_db()
+
+    created = ensure_indexes(db)
+    print(f"Created indexes: {', '.join(created) if created else 'none'}")
+
+    if args.explain:
+        flagged = 0
+        for entry in explain_query_shapes(db):
+            status = "COLLSCAN" if entry["flagged"] else "ok"
+            print(f"[{status}] {entry['collection']}: {entry['query']} -> {' > '.join(entry['stages'])}")
+            flagged += entry["flagged"]
+        if flagged:
+            logging.error(f"{flagged} query shape(s) use a collection scan.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+This module is the single entry point for every LLM call of the generation and selection apps.
+Calls are admitted through the process-wide fair-share scheduler (llm_scheduler.py), routed to one of the Ollama
+servers by llm_router.py, recorded by llm_telemetry.py and traced by tracing.py. The owner and priority of the calls
+are taken from the current context, set once per Streamlit rerun, batch document or worker task with llm_context.
+A worker task also passes the event of its lease, the calls of a task whose lease was lost are cancelled.
+"""
+
+import contextvars
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from llm_scheduler import get_scheduler, INTERACTIVE
+from llm_router import get_router, connection_errors
+from llm_telemetry import get_recorder, make_record
+from tracing import span
+
+# Maximum seconds a call waits for a slot, no limit if not set
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT")) if os.getenv("LLM_QUEUE_TIMEOUT") else None
+
+# Owner and priority of the calls made in the current context
+_owner = contextvars.ContextVar("llm_owner", default="default")
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+# Event which cancels the calls made in the current context once it is set
+_cancelled = contextvars.ContextVar("llm_cancelled", default=None)
+
+
+class LLMCallCancelled(RuntimeError):
+    """ Raised instead of making a call whose context was cancelled, e.g. a worker task which lost its lease. """
+
+
+# Set the owner and priority of the following calls
+def set_llm_context(owner, priority=INTERACTIVE):
+    """ Sets the owner and priority for the rest of the current context, e.g. a Streamlit rerun. """
+    _owner.set(str(owner))
+    _priority.set(priority)
+
+
+# Set the owner and priority of the calls in a block
+@contextmanager
+def llm_context(owner=None, priority=None, cancelled=None):
+    """ Sets the owner and/or priority of the calls made inside the block, the calls are cancelled once cancelled is set. """
+    owner_token = _owner.set(str(owner)) if owner is not None else None
+    priority_token = _priority.set(priority) if priority is not None else None
+    cancelled_token = _cancelled.set(cancelled) if cancelled is not None else None
+    try:
+        yield
+    finally:
+        if cancelled_token is not None:
+            _cancelled.reset(cancelled_token)
+        if priority_token is not None:
+            _priority.reset(priority_token)
+        if owner_token is not None:
+            _owner.reset(owner_token)
+
+
+# ollama clients per server
+_clients = {}
+
+
+def _client(base_url):
+    if base_url not in _clients:
+        import ollama
+        _clients[base_url] = ollama.Client(host=base_url)
+    return _clients[base_url]
+
+
+# Raise if the calls of the current context were cancelled
+def _check_cancelled():
+    cancelled = _cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise LLMCallCancelled("The LLM call was cancelled by its caller.")
+
+
+# Run a call through the scheduler and the router and record its telemetry
+def _call(model, site, attempt, run, raw_of):
+    owner, priority = _owner.get(), _priority.get()
+    endpoint = {"base_url": None}
+    _check_cancelled()
+
+    def routed(base_url):
+        endpoint["base_url"] = base_url
+        return run(base_url)
+
+    with span(f"llm {site}", kind="llm", model=model, attempt=attempt, priority=priority) as llm_span:
+        with get_scheduler().slot(owner, priority, timeout=QUEUE_TIMEOUT) as queue_wait:
+            # The lease may have been lost while the call waited for its slot
+            _check_cancelled()
+            started = time.perf_counter()
+            try:
+                response = get_router().call(model, routed)
+            except Exception as e:
+                get_recorder().record(make_record(
+                    site, model, endpoint["base_url"], attempt, owner, priority, time.perf_counter() - started, queue_wait, error=e
+                ))
+                raise
+        record = make_record(
+            site, model, endpoint["base_url"], attempt, owner, priority, time.perf_counter() - started, queue_wait, raw=raw_of(response)
+        )
+        get_recorder().record(record)
+        llm_span.set(
+            endpoint=endpoint["base_url"], queue_wait_seconds=record["queue_wait_seconds"],
+            prompt_tokens=record["prompt_eval_count"], output_tokens=record["eval_count"]
+        )
+    return response
+
+
+# Errors of an unreachable or slow server, for the retry loops of the callers
+@functools.lru_cache(maxsize=None)
+def transport_errors():
+    """ Returns the connection errors of the router and the timeouts of requests and httpx, imported at the first lookup. """
+    import httpx
+    import requests
+    return connection_errors() + (requests.exceptions.Timeout, httpx.TimeoutException)
+
+
+# Text completion through llama_index
+def complete(model, prompt, json_mode=False, request_timeout=300.0, site=None, attempt=1):
+    """
+    Runs a completion and returns the llama_index response, its text is in resp.text.
+    site names the calling function and attempt the retry attempt (1 for the first try) in the telemetry.
+    """
+    # llama_index is imported at the first completion, it is the slowest import of the apps
+    from llama_index.llms.ollama import Ollama
+
+    def run(base_url):
+        llm = Ollama(model=model, base_url=base_url, request_timeout=request_timeout, json_mode=json_mode)
+        return llm.complete(prompt)
+    return _call(model, site, attempt, run, lambda response: getattr(response, "raw", None))
+
+
+# Chat through the ollama client
+def chat(model, messages, site=None, attempt=1, **kwargs):
+    """ Runs ollama.chat and returns its response. """
+    return _call(
+        model, site, attempt,
+        lambda base_url: _client(base_url).chat(model=model, messages=messages, **kwargs),
+        lambda response: response
+    )
+
+
+# Embeddings through the ollama client
+def embed(model, input, site=None, attempt=1):
+    """ Runs ollama.embed and returns its response. """
+    return _call(
+        model, site, attempt,
+        lambda base_url: _client(base_url).embed(model=model, input=input),
+        lambda response: response
+    )
+
+
+# Queue statistics for the UI
+def scheduler_stats():
+    """ Returns the statistics of the process-wide scheduler, see FairScheduler.stats. """
+    return get_scheduler().stats()
+
+
+# Server states for the UI
+def endpoint_stats():
+    """ Returns the state of every Ollama server, see EndpointRouter.stats. """
+    return get_router().stats()
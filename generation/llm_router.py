@@ -0,0 +1,224 @@
+"""
+This module routes the LLM calls over several Ollama servers.
+The servers are read from OLLAMA_HOSTS (comma separated base URLs). For every server the router tracks its health,
+its in-flight calls and the models it has loaded. A call goes to the least loaded healthy server, servers which already
+have the model loaded are preferred, and on a connection error the call fails over to the next server.
+Outdated servers are checked in a background thread, a call never waits for a health check; only one check per
+server runs at a time however many calls find it outdated.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+
+
+# Base URLs of the Ollama servers
+DEFAULT_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_HOSTS = [host.strip().rstrip("/") for host in os.getenv("OLLAMA_HOSTS", DEFAULT_HOST).split(",") if host.strip()]
+
+# Seconds between the health checks of a server
+HEALTH_CHECK_INTERVAL = 30.0
+# Seconds before an unhealthy server is checked again
+UNHEALTHY_COOLDOWN = 10.0
+# Timeout of a health check
+HEALTH_CHECK_TIMEOUT = 2.0
+# A server with the model loaded is preferred while it has at most this many more in-flight calls than the least loaded one
+AFFINITY_SLACK = 1
+
+# Errors which mean the server could not be reached, the call is retried on another server.
+# requests and httpx are imported at the first lookup so importing the router does not slow down the app start.
+@functools.lru_cache(maxsize=None)
+def connection_errors():
+    """ Returns the exception classes of an unreachable server. """
+    import httpx
+    import requests
+    return (
+        ConnectionError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        httpx.ConnectError,
+        httpx.ConnectTimeout,
+        httpx.RemoteProtocolError,
+    )
+
+
+class NoHealthyEndpoint(ConnectionError):
+    """ Raised when no Ollama server could take the call. """
+
+
+class Endpoint:
+    """ State of a single Ollama server. """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.healthy = True
+        self.in_flight = 0
+        self.loaded_models = set()
+        self.checked_at = 0.0
+        # True while a health check of the server is running
+        self.checking = False
+        self.failures = 0
+        self.calls = 0
+
+    def summary(self):
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "loaded_models": sorted(self.loaded_models),
+            "failures": self.failures,
+            "calls": self.calls,
+        }
+
+
+# Model name without the default tag
+def _model_name(model):
+    return model[:-len(":latest")] if model.endswith(":latest") else model
+
+
+class EndpointRouter:
+    """ Picks a server per call and keeps the state of all servers. """
+
+    def __init__(self, base_urls):
+        self.endpoints = [Endpoint(base_url) for base_url in base_urls]
+        self._lock = threading.Lock()
+
+    def check(self, endpoint):
+        """ Checks the health of a server and refreshes its loaded models with /api/ps. """
+        import requests
+        try:
+            response = requests.get(f"{endpoint.base_url}/api/ps", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            models = {_model_name(model.get("name", "")) for model in response.json().get("models", [])}
+            healthy = True
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.warning(f"Ollama server {endpoint.base_url} failed the health check: {e}")
+            models, healthy = set(), False
+        with self._lock:
+            endpoint.healthy = healthy
+            endpoint.loaded_models = models
+            endpoint.checked_at = time.monotonic()
+        return healthy
+
+    # Check the given servers one after another
+    def _check_all(self, endpoints):
+        for endpoint in endpoints:
+            try:
+                self.check(endpoint)
+            except Exception as e:
+                logging.error(f"Health check of {endpoint.base_url} failed: {e}")
+            finally:
+                with self._lock:
+                    endpoint.checking = False
+
+    # Check the servers whose state is outdated in the background
+    def _refresh(self):
+        """
+        Marks the outdated servers as checking and checks them in a daemon thread, which is returned (None if every
+        server is up to date or already being checked). The calls keep using the last known state meanwhile.
+        """
+        now = time.monotonic()
+        with self._lock:
+            outdated = [
+                endpoint for endpoint in self.endpoints
+                if not endpoint.checking
+                and now - endpoint.checked_at >= (HEALTH_CHECK_INTERVAL if endpoint.healthy else UNHEALTHY_COOLDOWN)
+            ]
+            for endpoint in outdated:
+                endpoint.checking = True
+        if not outdated:
+            return None
+        thread = threading.Thread(target=self._check_all, args=(outdated,), name="ollama-health-check", daemon=True)
+        thread.start()
+        return thread
+
+    def acquire(self, model, exclude=()):
+        """
+        Picks the server for a call of the model and counts the call as in flight.
+        Only if no server is usable the call waits for the health checks it started, a recovered server can take it then.
+        Raises NoHealthyEndpoint if every server is unhealthy or excluded.
+        """
+        # With a single server there is nothing to choose, its errors are reported by the call itself
+        refresh = self._refresh() if len(self.endpoints) > 1 else None
+        model = _model_name(model)
+        endpoint = self._pick(model, exclude)
+        if endpoint is None and refresh is not None:
+            refresh.join()
+            endpoint = self._pick(model, exclude)
+        if endpoint is None:
+            raise NoHealthyEndpoint(f"No healthy Ollama server for {model}.")
+        return endpoint
+
+    # Pick the server for a call and count the call
+    def _pick(self, model, exclude):
+        with self._lock:
+            candidates = [
+                endpoint for endpoint in self.endpoints
+                if endpoint not in exclude and (endpoint.healthy or len(self.endpoints) == 1)
+            ]
+            if not candidates:
+                return None
+            least_loaded = min(endpoint.in_flight for endpoint in candidates)
+            warm = [
+                endpoint for endpoint in candidates
+                if model in endpoint.loaded_models and endpoint.in_flight <= least_loaded + AFFINITY_SLACK
+            ]
+            endpoint = min(warm or candidates, key=lambda endpoint: endpoint.in_flight)
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+            return endpoint
+
+    def release(self, endpoint, model, error=None):
+        """ Ends a call, a connection error marks the server unhealthy until its next health check. """
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.loaded_models.add(_model_name(model))
+            else:
+                endpoint.healthy = False
+                endpoint.failures += 1
+                endpoint.checked_at = time.monotonic()
+
+    def call(self, model, function):
+        """
+        Runs function(base_url) on the picked server and fails over to the other servers on connection errors.
+        Other errors are raised immediately, they would fail on every server.
+        """
+        tried = []
+        while True:
+            try:
+                endpoint = self.acquire(model, exclude=tried)
+            except NoHealthyEndpoint:
+                if tried:
+                    raise NoHealthyEndpoint(f"All Ollama servers failed for {model}: {', '.join(e.base_url for e in tried)}")
+                raise
+            try:
+                result = function(endpoint.base_url)
+            except connection_errors() as e:
+                self.release(endpoint, model, error=e)
+                logging.warning(f"Ollama server {endpoint.base_url} failed, failing over: {e}")
+                tried.append(endpoint)
+                if len(tried) == len(self.endpoints):
+                    raise
+                continue
+            except Exception:
+                self.release(endpoint, model)
+                raise
+            self.release(endpoint, model)
+            return result
+
+    def stats(self):
+        """ Returns the state of every server. """
+        with self._lock:
+            return [endpoint.summary() for endpoint in self.endpoints]
+
+
+# The process-wide router
+_router = EndpointRouter(OLLAMA_HOSTS)
+
+
+def get_router():
+    """ Returns the process-wide router. """
+    return _router
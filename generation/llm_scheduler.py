@@ -0,0 +1,170 @@
+"""
+This module implements the fair-share admission control in front of the Ollama server.
+Every LLM call waits for a slot of a process-wide scheduler with a global concurrency cap. Waiting calls are served by
+priority (interactive > batch > speculative) and round-robin between the owners (Streamlit sessions, batch documents,
+worker tasks) of the same priority, so one owner's long run cannot monopolise the server.
+
+The cap is per process: the Streamlit server shares one scheduler between all sessions, every worker process has its own.
+Set LLM_MAX_CONCURRENCY per process so that the sum matches the parallelism of the Ollama server (OLLAMA_NUM_PARALLEL).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Priorities, served in this order
+INTERACTIVE = "interactive"
+BATCH = "batch"
+SPECULATIVE = "speculative"
+PRIORITIES = (INTERACTIVE, BATCH, SPECULATIVE)
+
+# Global number of concurrent LLM calls
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+# Number of recent wait times kept per priority for the statistics
+WAIT_SAMPLES = 200
+
+
+class SchedulerTimeout(TimeoutError):
+    """ Raised when a call waits longer than its queue timeout for a slot. """
+
+
+class _Ticket:
+    __slots__ = ("owner", "priority", "enqueued_at", "granted")
+
+    def __init__(self, owner, priority):
+        self.owner = owner
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+
+
+class FairScheduler:
+    """ Grants at most max_concurrency slots, by priority and round-robin between owners. """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self._condition = threading.Condition()
+        # priority -> owner -> waiting tickets, the first owner is served next
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._in_flight = 0
+        self._in_flight_by_owner = {}
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self._granted = {priority: 0 for priority in PRIORITIES}
+
+    # Take the next ticket, the lock must be held
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            owners = self._queues[priority]
+            if owners:
+                owner, tickets = next(iter(owners.items()))
+                ticket = tickets.popleft()
+                # The owner goes to the end of the round
+                if tickets:
+                    owners.move_to_end(owner)
+                else:
+                    del owners[owner]
+                return ticket
+        return None
+
+    # Grant the free slots, the lock must be held
+    def _dispatch(self):
+        granted = False
+        while self._in_flight < self.max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._in_flight += 1
+            self._in_flight_by_owner[ticket.owner] = self._in_flight_by_owner.get(ticket.owner, 0) + 1
+            self._waits[ticket.priority].append(time.perf_counter() - ticket.enqueued_at)
+            self._granted[ticket.priority] += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    # Remove a waiting ticket after a timeout, the lock must be held
+    def _withdraw(self, ticket):
+        tickets = self._queues[ticket.priority].get(ticket.owner)
+        if tickets is not None:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.priority][ticket.owner]
+
+    def acquire(self, owner, priority=INTERACTIVE, timeout=None):
+        """
+        Blocks until a slot is granted and returns the wait time in seconds.
+        Raises SchedulerTimeout if no slot was granted within timeout seconds.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        ticket = _Ticket(owner, priority)
+        with self._condition:
+            self._queues[priority].setdefault(owner, deque()).append(ticket)
+            self._dispatch()
+            deadline = None if timeout is None else time.perf_counter() + timeout
+            while not ticket.granted:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    self._withdraw(ticket)
+                    raise SchedulerTimeout(f"No LLM slot was granted to {owner} within {timeout}s.")
+                self._condition.wait(remaining)
+        return time.perf_counter() - ticket.enqueued_at
+
+    def release(self, owner):
+        """ Frees the slot of the owner and grants it to the next waiting call. """
+        with self._condition:
+            self._in_flight -= 1
+            count = self._in_flight_by_owner.get(owner, 1) - 1
+            if count:
+                self._in_flight_by_owner[owner] = count
+            else:
+                self._in_flight_by_owner.pop(owner, None)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, owner, priority=INTERACTIVE, timeout=None):
+        """ Holds a slot for the duration of the block and yields the time spent waiting for it. """
+        wait = self.acquire(owner, priority, timeout)
+        try:
+            yield wait
+        finally:
+            self.release(owner)
+
+    def stats(self):
+        """
+        Returns the queue depth and wait times per priority, the in-flight calls and the waiting calls per owner.
+        Wait times are computed over the last WAIT_SAMPLES granted calls of each priority.
+        """
+        with self._condition:
+            priorities = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority])
+                priorities[priority] = {
+                    "queued": sum(len(tickets) for tickets in self._queues[priority].values()),
+                    "granted": self._granted[priority],
+                    "avg_wait": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95_wait": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+                }
+            waiting = {}
+            for owners in self._queues.values():
+                for owner, tickets in owners.items():
+                    waiting[owner] = waiting.get(owner, 0) + len(tickets)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "queued": sum(entry["queued"] for entry in priorities.values()),
+                "priorities": priorities,
+                "waiting_by_owner": waiting,
+                "in_flight_by_owner": dict(self._in_flight_by_owner),
+            }
+
+
+# The process-wide scheduler
+_scheduler = FairScheduler()
+
+
+def get_scheduler():
+    """ Returns the process-wide scheduler. """
+    return _scheduler
@@ -0,0 +1,202 @@
+"""
+This module captures a telemetry record for every LLM call made through llm_client.
+Each record holds the Ollama timing breakdown (load_duration, prompt_eval_count/duration, eval_count/duration),
+the wall time, the time spent waiting for a scheduler slot, the model, the server, the call site and the retry attempt.
+Records are written in batches by a background thread into the llm_telemetry time-series collection.
+"""
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+# Collection of the telemetry records
+TELEMETRY_COLLECTION = "llm_telemetry"
+# Records are kept for 30 days
+TELEMETRY_TTL_SECONDS = 30 * 24 * 3600
+# Records are written when this many are pending or after FLUSH_INTERVAL seconds
+FLUSH_BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+# Recent records kept in memory for the current process
+RECENT_RECORDS = 1000
+
+# Ollama duration fields, reported in nanoseconds
+DURATION_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+
+
+# Read a field from a response dictionary or object
+def _field(raw, name):
+    if raw is None:
+        return None
+    if isinstance(raw, dict):
+        return raw.get(name)
+    return getattr(raw, name, None)
+
+
+# Timing fields of an Ollama response
+def timing_fields(raw):
+    """ Returns the Ollama counts and durations of a response, durations in seconds. Missing fields are None. """
+    fields = {}
+    for name in COUNT_FIELDS:
+        fields[name] = _field(raw, name)
+    for name in DURATION_FIELDS:
+        value = _field(raw, name)
+        fields[name] = value / 1e9 if value is not None else None
+    if fields["eval_count"] and fields["eval_duration"]:
+        fields["tokens_per_sec"] = round(fields["eval_count"] / fields["eval_duration"], 2)
+    else:
+        fields["tokens_per_sec"] = None
+    return fields
+
+
+class TelemetryRecorder:
+    """ Buffers the telemetry records of the process and writes them in batches. """
+
+    def __init__(self):
+        self.collection = None
+        self.recent = deque(maxlen=RECENT_RECORDS)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._listeners = []
+        self._thread = None
+
+    def configure(self, db):
+        """ Starts writing the records to the database, the first configured database is used. """
+        with self._lock:
+            if self.collection is not None:
+                return
+            self.collection = ensure_telemetry_collection(db)
+            self._thread = threading.Thread(target=self._run, name="llm-telemetry", daemon=True)
+            self._thread.start()
+
+    def add_listener(self, listener):
+        """ Calls listener(record) for every new record, e.g. to update metrics. """
+        self._listeners.append(listener)
+
+    def record(self, entry):
+        """ Adds a record, it is written by the background thread. """
+        self.recent.append(entry)
+        for listener in self._listeners:
+            try:
+                listener(entry)
+            except Exception as e:
+                logging.warning(f"Telemetry listener failed: {e}")
+        with self._lock:
+            if self.collection is None:
+                return
+            self._pending.append(entry)
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._wakeup.set()
+
+    def flush(self):
+        """ Writes the pending records. """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending and self.collection is not None:
+            try:
+                self.collection.insert_many(pending, ordered=False)
+            except PyMongoError as e:
+                logging.warning(f"Writing {len(pending)} LLM telemetry records failed: {e}")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+
+# Create the time-series collection
+def ensure_telemetry_collection(db):
+    """
+    Creates llm_telemetry as a time-series collection with timeField timestamp and metaField meta.
+    MongoDB versions without time-series collections get a regular collection with a TTL index.
+    """
+    try:
+        db.create_collection(
+            TELEMETRY_COLLECTION,
+            timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "seconds"},
+            expireAfterSeconds=TELEMETRY_TTL_SECONDS,
+        )
+    except CollectionInvalid:
+        # The collection already exists
+        pass
+    except PyMongoError as e:
+        logging.warning(f"Time-series collection could not be created, using a regular collection: {e}")
+        try:
+            db[TELEMETRY_COLLECTION].create_index("timestamp", expireAfterSeconds=TELEMETRY_TTL_SECONDS)
+        except PyMongoError as e:
+            logging.warning(f"Telemetry index could not be created: {e}")
+    return db[TELEMETRY_COLLECTION]
+
+
+# Build a telemetry record
+def make_record(site, model, endpoint, attempt, owner, priority, wall_seconds, queue_wait_seconds, raw=None, error=None):
+    """ Returns the record of one LLM call. """
+    return {
+        "timestamp": datetime.now(timezone.utc),
+        "meta": {"site": site, "model": model, "endpoint": endpoint, "priority": priority},
+        "owner": owner,
+        "attempt": attempt,
+        "success": error is None,
+        "error": str(error) if error is not None else None,
+        "wall_seconds": round(wall_seconds, 4),
+        "queue_wait_seconds": round(queue_wait_seconds, 4),
+        **timing_fields(raw),
+    }
+
+
+# Aggregate the records per call site and model
+def aggregate(db, since):
+    """
+    Returns one row per (site, model) with the call count, errors and the average time breakdown since the given time.
+    overhead_seconds is the wall time not explained by model load, prompt processing and decoding (network, queueing in Ollama).
+    """
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id": {"site": "$meta.site", "model": "$meta.model"},
+            "calls": {"$sum": 1},
+            "errors": {"$sum": {"$cond": ["$success", 0, 1]}},
+            "retries": {"$sum": {"$cond": [{"$gt": ["$attempt", 1]}, 1, 0]}},
+            "wall_seconds": {"$avg": "$wall_seconds"},
+            "queue_wait_seconds": {"$avg": "$queue_wait_seconds"},
+            "load_seconds": {"$avg": "$load_duration"},
+            "prompt_eval_seconds": {"$avg": "$prompt_eval_duration"},
+            "eval_seconds": {"$avg": "$eval_duration"},
+            "prompt_tokens": {"$sum": "$prompt_eval_count"},
+            "output_tokens": {"$sum": "$eval_count"},
+            "tokens_per_sec": {"$avg": "$tokens_per_sec"},
+        }},
+        {"$sort": {"calls": -1}},
+    ]
+    rows = []
+    for entry in db[TELEMETRY_COLLECTION].aggregate(pipeline):
+        row = {"site": entry["_id"]["site"], "model": entry["_id"]["model"]}
+        for key, value in entry.items():
+            if key != "_id":
+                row[key] = round(value, 3) if isinstance(value, float) else value
+        explained = sum(row.get(key) or 0.0 for key in ("load_seconds", "prompt_eval_seconds", "eval_seconds"))
+        row["overhead_seconds"] = round(max(0.0, (row["wall_seconds"] or 0.0) - explained), 3)
+        rows.append(row)
+    return rows
+
+
+# The process-wide recorder
+_recorder = TelemetryRecorder()
+
+
+def get_recorder():
+    """ Returns the process-wide recorder. """
+    return _recorder
+
+
+def configure_telemetry(db):
+    """ Writes the telemetry records of this process to the database. """
+    try:
+        _recorder.configure(db)
+    except PyMongoError as e:
+        logging.warning(f"LLM telemetry could not be configured: {e}")
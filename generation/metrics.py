@@ -0,0 +1,424 @@
+"""
+This module exposes the live metrics of the process in the Prometheus text format.
+It holds the counters and histograms of the LLM calls (fed by the llm_telemetry records), the JSON validation failures,
+the MongoDB command latencies and connection pool, the Smart Selection comparisons and the cache hits, and serves them
+on /metrics from a sidecar thread started once per process with start_metrics_server.
+"""
+
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pymongo import monitoring
+
+from llm_scheduler import get_scheduler
+from llm_telemetry import get_recorder
+
+# Address of the metrics endpoint, a port of 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+DEFAULT_METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# Histogram buckets in seconds
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# Escape a label value of the text format
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Format the labels of a sample
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Format a sample value
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """ Base class of the metrics, the samples are keyed by their label values. """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        """ Returns the metric in the text format. """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """ A monotonically increasing value per label set. """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """ Increases the counter of the label set. """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """ Observations counted into cumulative buckets per label set, with their sum and count. """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LLM_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        """ Adds an observation to the label set. """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """ A value read when the metrics are scraped, collect returns {label values tuple: value}. """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _samples(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            logging.warning(f"Collecting {self.name} failed: {e}")
+            return []
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class Registry:
+    """ The metrics of the process in registration order. """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """ Adds a metric and returns it. """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ Returns all metrics in the Prometheus text format. """
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+# The process-wide registry
+REGISTRY = Registry()
+
+# LLM calls, fed by the telemetry records of llm_client
+LLM_CALLS = REGISTRY.register(Counter(
+    "selekt_llm_calls_total", "LLM calls by call site, model and outcome.", ("site", "model", "outcome")
+))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "selekt_llm_retries_total", "LLM calls which were a retry of a failed attempt.", ("site", "model")
+))
+LLM_DURATION = REGISTRY.register(Histogram(
+    "selekt_llm_call_duration_seconds", "Wall time of the LLM calls.", ("site", "model"), LLM_BUCKETS
+))
+LLM_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "selekt_llm_queue_wait_seconds", "Time the LLM calls waited for a scheduler slot.", ("priority",), LLM_BUCKETS
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "selekt_llm_tokens_total", "Prompt and output tokens reported by Ollama.", ("site", "model", "kind")
+))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "selekt_llm_in_flight", "LLM calls holding a scheduler slot.",
+    collect=lambda: {(): get_scheduler().stats()["in_flight"]}
+))
+LLM_QUEUED = REGISTRY.register(Gauge(
+    "selekt_llm_queued", "LLM calls waiting for a scheduler slot by priority.", ("priority",),
+    collect=lambda: {(priority,): entry["queued"] for priority, entry in get_scheduler().stats()["priorities"].items()}
+))
+
+# Responses rejected by validate_json_structure or the JSON parser
+JSON_VALIDATION_FAILURES = REGISTRY.register(Counter(
+    "selekt_json_validation_failures_total", "Model responses which failed the JSON validation.", ("site", "reason")
+))
+
+# MongoDB commands, fed by MongoMetricsListener
+MONGO_DURATION = REGISTRY.register(Histogram(
+    "selekt_mongo_command_duration_seconds", "Latency of the MongoDB commands.", ("command", "collection"), MONGO_BUCKETS
+))
+MONGO_FAILURES = REGISTRY.register(Counter(
+    "selekt_mongo_command_failures_total", "Failed MongoDB commands.", ("command", "collection")
+))
+
+# MongoDB connection pool, fed by MONGO_POOL
+MONGO_POOL_WAIT = REGISTRY.register(Histogram(
+    "selekt_mongo_pool_wait_seconds", "Time the operations waited for a pooled connection.", ("address",), MONGO_BUCKETS
+))
+MONGO_POOL_CHECKOUT_FAILURES = REGISTRY.register(Counter(
+    "selekt_mongo_pool_checkout_failures_total", "Connection checkouts which failed, e.g. on the wait queue timeout.", ("address", "reason")
+))
+MONGO_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "selekt_mongo_pool_connections", "Open and checked out connections of the pool per server.", ("address", "state"),
+    collect=lambda: {
+        (entry["address"], state): entry[state] for entry in MONGO_POOL.stats() for state in ("open", "in_use", "waiting")
+    }
+))
+MONGO_POOL_MAX_SIZE = REGISTRY.register(Gauge(
+    "selekt_mongo_pool_max_size", "Maximum number of connections of the pool per server.", ("address",),
+    collect=lambda: {(entry["address"],): entry["max_pool_size"] for entry in MONGO_POOL.stats() if entry["max_pool_size"]}
+))
+
+# Smart Selection
+SELECTION_PAIRS = REGISTRY.register(Counter(
+    "selekt_smart_selection_pairs_compared_total", "Test case pairs compared by Smart Selection.", ("source",)
+))
+SELECTION_DUPLICATES = REGISTRY.register(Counter(
+    "selekt_smart_selection_duplicates_total", "Duplicate test cases found by Smart Selection.", ("mode",)
+))
+
+# Caches
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "selekt_cache_requests_total", "Cache lookups by cache and result (hit or miss).", ("cache", "result")
+))
+
+
+# Update the LLM metrics from a telemetry record
+def observe_llm_call(record):
+    """ Telemetry listener which updates the LLM metrics from a record of llm_telemetry. """
+    site = record["meta"]["site"] or "unknown"
+    model = record["meta"]["model"]
+    LLM_CALLS.inc(site=site, model=model, outcome="success" if record["success"] else "error")
+    if record["attempt"] > 1:
+        LLM_RETRIES.inc(site=site, model=model)
+    LLM_DURATION.observe(record["wall_seconds"], site=site, model=model)
+    LLM_QUEUE_WAIT.observe(record["queue_wait_seconds"], priority=record["meta"]["priority"])
+    if record.get("prompt_eval_count"):
+        LLM_TOKENS.inc(record["prompt_eval_count"], site=site, model=model, kind="prompt")
+    if record.get("eval_count"):
+        LLM_TOKENS.inc(record["eval_count"], site=site, model=model, kind="output")
+
+
+get_recorder().add_listener(observe_llm_call)
+
+
+# Count cache lookups
+def record_cache(cache, hit, count=1):
+    """ Counts count hits or misses of the named cache, e.g. the entries of one batched lookup. """
+    CACHE_REQUESTS.inc(count, cache=cache, result="hit" if hit else "miss")
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """ Records the latency of every MongoDB command of the client it is registered on. """
+
+    def __init__(self):
+        # request_id -> collection name of the running commands
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _collection(self, event):
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        MONGO_DURATION.observe(event.duration_micros / 1e6, command=event.command_name, collection=self._collection(event))
+
+    def failed(self, event):
+        collection = self._collection(event)
+        MONGO_DURATION.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+        MONGO_FAILURES.inc(command=event.command_name, collection=collection)
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """ Tracks the connections and the checkout wait time of the connection pools of the client it is registered on. """
+
+    def __init__(self):
+        # address -> state of the pool of the server
+        self._pools = {}
+        self._lock = threading.Lock()
+        # Checkout start times of the current thread, a checkout runs in the thread of the operation
+        self._checkouts = threading.local()
+
+    def _pool(self, event):
+        address = ":".join(str(part) for part in event.address)
+        return address, self._pools.setdefault(address, {
+            "max_pool_size": None, "open": 0, "in_use": 0, "waiting": 0,
+            "checkouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "failures": 0,
+        })
+
+    def _wait(self, event):
+        started = getattr(self._checkouts, "started", {}).pop(event.address, None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event)[1]["max_pool_size"] = event.options.get("maxPoolSize")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(self._pool(event)[0], None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event)[1]["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event)[1]
+            pool["open"] = max(0, pool["open"] - 1)
+
+    def connection_check_out_started(self, event):
+        if not hasattr(self._checkouts, "started"):
+            self._checkouts.started = {}
+        self._checkouts.started[event.address] = time.perf_counter()
+        with self._lock:
+            self._pool(event)[1]["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        self._wait(event)
+        with self._lock:
+            address, pool = self._pool(event)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            pool["failures"] += 1
+        MONGO_POOL_CHECKOUT_FAILURES.inc(address=address, reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        wait = self._wait(event)
+        with self._lock:
+            address, pool = self._pool(event)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            pool["in_use"] += 1
+            pool["checkouts"] += 1
+            pool["wait_seconds"] += wait
+            pool["max_wait_seconds"] = max(pool["max_wait_seconds"], wait)
+        MONGO_POOL_WAIT.observe(wait, address=address)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event)[1]
+            pool["in_use"] = max(0, pool["in_use"] - 1)
+
+    def stats(self):
+        """ Returns the state of every pool: open, in use and waiting connections, utilisation and checkout wait. """
+        with self._lock:
+            pools = [(address, dict(pool)) for address, pool in self._pools.items()]
+        return [
+            {
+                "address": address,
+                **pool,
+                "utilisation": pool["in_use"] / pool["max_pool_size"] if pool["max_pool_size"] else None,
+                "avg_wait_seconds": pool["wait_seconds"] / pool["checkouts"] if pool["checkouts"] else 0.0,
+            }
+            for address, pool in pools
+        ]
+
+
+# The pool listener of the process-wide MongoDB client (mongo_client.py)
+MONGO_POOL = MongoPoolListener()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not logged
+        pass
+
+
+# The sidecar server of this process, it is started at most once
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+# Start the metrics endpoint
+def start_metrics_server(port=None, host=None):
+    """
+    Serves /metrics from a daemon thread, once per process; later calls return the running server.
+    Returns None if the endpoint is disabled (port 0) or the port is already in use.
+    """
+    global _server, _server_started
+    port = DEFAULT_METRICS_PORT if port is None else port
+    with _server_lock:
+        if _server_started or port <= 0:
+            return _server
+        _server_started = True
+        try:
+            _server = ThreadingHTTPServer((host or METRICS_HOST, port), _MetricsHandler)
+        except OSError as e:
+            logging.warning(f"Metrics endpoint could not be started on port {port}: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        logging.info(f"Metrics are served on http://{host or METRICS_HOST}:{port}/metrics")
+        return _server
@@ -0,0 +1,128 @@
+"""
+This module creates the MongoDB client which every module of a process shares: the generation app, the selection app,
+the batch runs and the background workers. MongoClient is thread-safe and pools its connections, so one client per
+process serves all Streamlit sessions; a client per module only multiplies the connections, monitoring threads and handshakes.
+The pool size, the timeouts, the wire compression and the read preference are read from the environment, the keyword
+options take precedence over the options of MONGO_URI. The pool utilisation and the checkout wait time are exported by metrics.py.
+"""
+
+import importlib.util
+import logging
+import os
+import threading
+
+from pymongo import MongoClient
+
+from metrics import MongoMetricsListener, MONGO_POOL
+from tracing import TracingCommandListener
+
+# MongoDB URI from environment variable
+MONGO_URI = os.getenv("MONGO_URI")
+# Database of the apps
+DATABASE_NAME = "modular_test_scenario_gen"
+
+# Connections per server, each Streamlit session, worker thread and background flush thread borrows one per operation
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+# Connections kept open while idle, so the first rerun after a quiet period does not pay the handshake
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+# Idle connections are closed after this many milliseconds
+MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# An operation fails instead of waiting longer than this for a free connection of an exhausted pool
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# Timeouts of opening a connection, of finding a server and of a socket read (0 waits as long as the operation takes)
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+# Wire compressors in order of preference, the first one the server also supports is used
+COMPRESSORS = [name.strip() for name in os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib").split(",") if name.strip()]
+# The sessions read their own writes, so secondaries should only be used for reporting deployments
+READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Name of the process in the server logs and currentOp
+APP_NAME = os.getenv("MONGO_APP_NAME", "selekt")
+
+# Python packages of the compressors, zlib is in the standard library
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+# Compressors whose Python package is installed
+def available_compressors(names=COMPRESSORS):
+    """ Returns the given compressors without the ones whose package (zstandard, python-snappy) is not installed. """
+    available = [
+        name for name in names
+        if name in _COMPRESSOR_MODULES and importlib.util.find_spec(_COMPRESSOR_MODULES[name]) is not None
+    ]
+    skipped = [name for name in names if name not in available]
+    if skipped:
+        logging.info(f"MongoDB wire compressors not available: {', '.join(skipped)}")
+    return available
+
+
+# Options of the shared client
+def client_options():
+    """ Returns the keyword options of the shared client built from the environment. """
+    options = {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "minPoolSize": MIN_POOL_SIZE,
+        "maxIdleTimeMS": MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": SOCKET_TIMEOUT_MS or None,
+        "readPreference": READ_PREFERENCE,
+        "appname": APP_NAME,
+    }
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+# Create a client with the shared options and listeners
+def create_client(uri=MONGO_URI, **overrides):
+    """
+    Returns a new client with the options of client_options, overridden by the given keyword options.
+    The command latencies are exported as metrics and recorded as trace spans, the pool state is tracked by MONGO_POOL.
+    """
+    return MongoClient(
+        uri,
+        event_listeners=[MongoMetricsListener(), TracingCommandListener(), MONGO_POOL],
+        **{**client_options(), **overrides}
+    )
+
+
+# The client of this process
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+# Get the shared client
+def get_client():
+    """
+    Returns the client of this process, it is created on the first call.
+    A forked child process creates its own client, a MongoClient must not be used across a fork.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = create_client()
+            _client_pid = os.getpid()
+        return _client
+
+
+# Pool state for the UI
+def pool_stats():
+    """ Returns the state of the connection pool per server, see MongoPoolListener.stats. """
+    return MONGO_POOL.stats()
+
+
+# Summary of the pool state for the sidebars
+def format_pool_stats(stats):
+    """ Returns a one-line summary of the pools: connections in use of the maximum, waiting operations and checkout wait. """
+    if not stats:
+        return "MongoDB pool: no connections yet"
+    return "MongoDB pool: " + ", ".join(
+        f"{entry['address']} {entry['in_use']}/{entry['max_pool_size'] or '?'} in use, {entry['waiting']} waiting, "
+        f"wait {entry['avg_wait_seconds'] * 1000:.1f}ms avg / {entry['max_wait_seconds'] * 1000:.1f}ms max"
+        for entry in stats
+    )
@@ -0,0 +1,60 @@
+""" This page shows the aggregated LLM call telemetry: calls, errors, retries and the time breakdown per call site and model. """
+
+from datetime import datetime, timedelta, timezone
+
+import streamlit as st
+
+from database import get_db
+from llm_telemetry import aggregate, get_recorder
+
+# Time windows of the aggregation
+TIME_WINDOWS = {
+    "Last hour": timedelta(hours=1),
+    "Last 24 hours": timedelta(days=1),
+    "Last 7 days": timedelta(days=7),
+    "Last 30 days": timedelta(days=30),
+}
+
+st.title("LLM Telemetry")
+st.write("Every LLM call of the generation and selection apps is recorded with the timing breakdown reported by Ollama.")
+
+window = st.selectbox("Time window", list(TIME_WINDOWS), index=1)
+
+# Write the records of this process before aggregating
+get_recorder().flush()
+rows = aggregate(get_db(), datetime.now(timezone.utc) - TIME_WINDOWS[window])
+
+if not rows:
+    st.info("No LLM calls were recorded in this time window.")
+else:
+    total_calls = sum(row["calls"] for row in rows)
+    total_errors = sum(row["errors"] for row in rows)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("LLM calls", total_calls)
+    col2.metric("Errors", total_errors)
+    col3.metric("Retried calls", sum(row["retries"] for row in rows))
+
+    st.write("### Per Call Site and Model")
+    st.dataframe(rows, use_container_width=True)
+
+    # Where the wall time of an average call goes
+    st.write("### Average Time Breakdown (seconds)")
+    st.bar_chart(
+        {
+            "Model load": {f"{row['site']} / {row['model']}": row["load_seconds"] or 0.0 for row in rows},
+            "Prompt processing": {f"{row['site']} / {row['model']}": row["prompt_eval_seconds"] or 0.0 for row in rows},
+            "Decoding": {f"{row['site']} / {row['model']}": row["eval_seconds"] or 0.0 for row in rows},
+            "Overhead": {f"{row['site']} / {row['model']}": row["overhead_seconds"] for row in rows},
+            "Queue wait": {f"{row['site']} / {row['model']}": row["queue_wait_seconds"] or 0.0 for row in rows},
+        }
+    )
+
+# Recent calls of this server process
+with st.expander("Recent calls of this process", expanded=False):
+    st.dataframe(
+        [
+            {"timestamp": record["timestamp"], **record["meta"], **{key: value for key, value in record.items() if key not in ("timestamp", "meta")}}
+            for record in reversed(list(get_recorder().recent))
+        ],
+        use_container_width=True,
+    )
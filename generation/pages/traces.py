@@ -0,0 +1,88 @@
+""" This page shows the traces of a session as a waterfall of the nested rerun, stage, LLM call and database spans. """
+
+import altair as alt
+import streamlit as st
+
+from database import get_db
+from tracing import fetch_spans, fetch_traces, get_exporter
+
+# Colors of the span kinds
+KIND_COLORS = {"rerun": "#9e9e9e", "batch": "#9e9e9e", "task": "#8d6e63", "stage": "#42a5f5", "llm": "#ef6c00", "db": "#66bb6a"}
+
+
+# Build the waterfall rows of a trace
+def waterfall_rows(spans):
+    """ Returns one row per span with its depth, offset from the trace start, duration and self time (not spent in child spans). """
+    by_id = {entry["span_id"]: entry for entry in spans}
+    children_seconds = {}
+    for entry in spans:
+        if entry["parent_id"] in by_id:
+            children_seconds[entry["parent_id"]] = children_seconds.get(entry["parent_id"], 0.0) + entry["duration_seconds"]
+
+    # Spans whose parent is in another process (e.g. a task of a worker) are placed below the root
+    def depth(entry):
+        level = 0
+        while entry["parent_id"] in by_id:
+            entry = by_id[entry["parent_id"]]
+            level += 1
+        return level
+
+    trace_start = min(entry["start"] for entry in spans)
+    rows = []
+    for position, entry in enumerate(spans):
+        offset = (entry["start"] - trace_start).total_seconds()
+        rows.append({
+            "span": f"{position:03d} " + "· " * depth(entry) + entry["name"],
+            "kind": entry["kind"],
+            "start": round(offset, 4),
+            "end": round(offset + entry["duration_seconds"], 4),
+            "duration_seconds": entry["duration_seconds"],
+            "self_seconds": round(max(0.0, entry["duration_seconds"] - children_seconds.get(entry["span_id"], 0.0)), 4),
+            "error": entry.get("error"),
+            **{key: value for key, value in (entry.get("attributes") or {}).items() if not isinstance(value, (dict, list))},
+        })
+    return rows
+
+
+st.title("Traces")
+st.write("Every rerun of the apps is traced with its pipeline stages, LLM calls and database operations.")
+
+session_id = st.text_input("Session ID", value=st.session_state.get("session_id", ""))
+
+# Write the spans of this process before reading them
+get_exporter().flush()
+traces = fetch_traces(get_db(), session_id) if session_id else []
+
+if not traces:
+    st.info("No traces were recorded for this session.")
+else:
+    labels = {
+        f"{entry['start']:%Y-%m-%d %H:%M:%S} {entry['name']} ({entry['duration_seconds']:.2f}s)": entry["trace_id"]
+        for entry in traces
+    }
+    selected = st.selectbox("Trace", list(labels))
+    rows = waterfall_rows(fetch_spans(get_db(), labels[selected]))
+
+    chart = (
+        alt.Chart(alt.Data(values=rows))
+        .mark_bar()
+        .encode(
+            x=alt.X("start:Q", title="Seconds since the start of the trace"),
+            x2="end:Q",
+            y=alt.Y("span:N", sort=None, title=None),
+            color=alt.Color("kind:N", scale=alt.Scale(domain=list(KIND_COLORS), range=list(KIND_COLORS.values()))),
+            tooltip=["span:N", "kind:N", "duration_seconds:Q", "self_seconds:Q", "error:N"],
+        )
+        .properties(height=max(200, 22 * len(rows)))
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+    # Where the time of the trace went per span kind
+    st.write("### Self Time per Kind (seconds)")
+    self_time = {}
+    for row in rows:
+        self_time[row["kind"]] = round(self_time.get(row["kind"], 0.0) + row["self_seconds"], 4)
+    st.bar_chart(self_time)
+
+    with st.expander("Spans", expanded=False):
+        st.dataframe(rows, use_container_width=True)
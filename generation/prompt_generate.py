@@ -1,5 +1,8 @@
 """ This module contains functions to generate prompts based on selected test elements like instructions and scoring elements. """
 
+from tracing import traced
+
+@traced()
 def generate_prompt(process_title, document_type, test_prompt, document_content, selected_test_name, selected_instruction_elements, test_instruction_elements, selected_scoring_elements, test_scoring_elements):
     """
     Generate a comprehensive prompt based on the selected test name, instruction elements, and scoring elements.
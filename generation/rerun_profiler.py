@@ -0,0 +1,258 @@
+"""
+This module contains an opt-in profiler for the reruns of the Streamlit apps.
+Each logical section of a script (upload parsing, prompt element rendering, test case listing, result rendering) is
+measured with its wall time, the tracemalloc allocation delta and peak, and the top allocation sites. Every section
+also records the size of the data it handled, so sections whose cost grows with the data size can be flagged.
+
+tracemalloc traces the whole process while it runs, allocations of other sessions running at the same time are counted as well.
+It is started by the first profiled rerun and stopped when no profiled rerun is running any more.
+Profiling is enabled per session with the "Profile reruns" checkbox in the sidebar, or for every session with RERUN_PROFILING=1.
+The allocation sites need two snapshots of the traced heap per section, they are only collected with the
+"Allocation sites" checkbox or RERUN_PROFILING_SITES=1.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from datetime import datetime
+
+import streamlit as st
+from pymongo.errors import PyMongoError
+
+# Collection of the stored rerun profiles, the TTL index is provisioned by indexes.py
+PROFILES_COLLECTION = "rerun_profiles"
+# Profiling is on by default for every session if set
+PROFILING_DEFAULT = os.getenv("RERUN_PROFILING", "0") == "1"
+# Allocation sites are collected by default for every profiled session if set
+SITES_DEFAULT = os.getenv("RERUN_PROFILING_SITES", "0") == "1"
+# Frames kept per allocation by tracemalloc, 1 is enough to group by source line
+TRACEMALLOC_FRAMES = int(os.getenv("RERUN_PROFILING_FRAMES", "1"))
+# Allocation sites kept per section
+TOP_SITES = 5
+# Profiled reruns kept per session
+PROFILE_HISTORY = 50
+# A section is flagged when its cost grows at least with size ** GROWTH_EXPONENT over MIN_GROWTH_SIZES different sizes
+GROWTH_EXPONENT = 0.5
+MIN_GROWTH_SIZES = 3
+# Sections below these costs are too cheap to be flagged, their measurements are mostly noise
+MIN_GROWTH_WALL_SECONDS = 0.005
+MIN_GROWTH_PEAK_BYTES = 64 * 1024
+
+# Allocations of the profiler and the import machinery are not reported
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# Profilers whose rerun is being profiled, tracemalloc runs while there is one
+# A rerun stopped by an exception stays until the next rerun of its session or until its profiler is collected
+_tracing_profilers = weakref.WeakSet()
+_tracing_lock = threading.Lock()
+
+
+# Start tracing for a profiled rerun
+def _acquire_tracing(profiler):
+    with _tracing_lock:
+        _tracing_profilers.add(profiler)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+# Stop tracing once no profiled rerun is left
+def _release_tracing(profiler):
+    with _tracing_lock:
+        _tracing_profilers.discard(profiler)
+        if not _tracing_profilers and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# Estimate how the cost of a section grows with its data size
+def growth_exponent(points):
+    """
+    Returns the slope of log(cost) over log(size) by least squares, about 1 for a linear and 2 for a quadratic section.
+    Returns None if there are fewer than MIN_GROWTH_SIZES different positive sizes.
+    """
+    points = [(size, cost) for size, cost in points if size and size > 0 and cost and cost > 0]
+    if len({size for size, _ in points}) < MIN_GROWTH_SIZES:
+        return None
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(cost) for _, cost in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+class RerunProfiler:
+    """ Measures the sections of the reruns of one session and keeps the recent profiles. """
+
+    def __init__(self, app, session_id):
+        self.app = app
+        self.session_id = session_id
+        self.enabled = PROFILING_DEFAULT
+        self.sites = SITES_DEFAULT
+        self.history = deque(maxlen=PROFILE_HISTORY)
+        self._rerun = None
+        self._open = {}
+
+    def start_rerun(self):
+        """ Starts profiling a rerun if profiling is enabled. """
+        self._rerun = None
+        self._open = {}
+        if not self.enabled:
+            _release_tracing(self)
+            return
+        _acquire_tracing(self)
+        self._rerun = {"started_at": datetime.now(), "started": time.perf_counter(), "sections": []}
+
+    def begin(self, name, size=None):
+        """ Starts measuring a section, the size of its data can be given here or at end(). """
+        if self._rerun is None:
+            return
+        # The snapshot is taken first so its own allocations are not part of the section's peak
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS) if self.sites else None
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        self._open[name] = {"size": size, "started": time.perf_counter(), "memory": current, "snapshot": snapshot}
+
+    def end(self, name, size=None):
+        """ Ends measuring a section, sections which were not started in this rerun are ignored. """
+        started = self._open.pop(name, None)
+        if started is None or self._rerun is None:
+            return
+        wall = time.perf_counter() - started["started"]
+        current, peak = tracemalloc.get_traced_memory()
+        top_sites = []
+        if started["snapshot"] is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            top_sites = [
+                {
+                    "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in snapshot.compare_to(started["snapshot"], "lineno")[:TOP_SITES]
+            ]
+        self._rerun["sections"].append({
+            "section": name,
+            "size": size if size is not None else started["size"],
+            "wall_seconds": round(wall, 4),
+            "alloc_bytes": current - started["memory"],
+            "peak_bytes": max(0, peak - started["memory"]),
+            "top_sites": top_sites,
+        })
+
+    def finish_rerun(self, db=None):
+        """ Ends the open sections and stores the profile of the rerun, also in the database if one is given. """
+        if self._rerun is None:
+            return None
+        for name in list(self._open):
+            self.end(name)
+        rerun = self._rerun
+        self._rerun = None
+        _release_tracing(self)
+        profile = {
+            "app": self.app,
+            "session_id": self.session_id,
+            "created_at": rerun["started_at"],
+            "wall_seconds": round(time.perf_counter() - rerun["started"], 4),
+            "sections": rerun["sections"],
+        }
+        self.history.append(profile)
+        if db is not None:
+            try:
+                db[PROFILES_COLLECTION].insert_one(dict(profile))
+            except PyMongoError as e:
+                logging.warning(f"Rerun profile could not be saved: {e}")
+        return profile
+
+    def growth(self):
+        """ Returns the growth exponent of the wall time and the allocations per section over the kept profiles. """
+        points = {}
+        for profile in self.history:
+            for section in profile["sections"]:
+                points.setdefault(section["section"], []).append(section)
+        rows = []
+        for name, sections in points.items():
+            wall_exponent = alloc_exponent = None
+            if max(s["wall_seconds"] for s in sections) >= MIN_GROWTH_WALL_SECONDS:
+                wall_exponent = growth_exponent([(s["size"], s["wall_seconds"]) for s in sections])
+            if max(s["peak_bytes"] for s in sections) >= MIN_GROWTH_PEAK_BYTES:
+                alloc_exponent = growth_exponent([(s["size"], s["peak_bytes"]) for s in sections])
+            exponents = [e for e in (wall_exponent, alloc_exponent) if e is not None]
+            rows.append({
+                "section": name,
+                "samples": len(sections),
+                "sizes": f"{min(s['size'] or 0 for s in sections)}-{max(s['size'] or 0 for s in sections)}",
+                "wall_exponent": round(wall_exponent, 2) if wall_exponent is not None else None,
+                "alloc_exponent": round(alloc_exponent, 2) if alloc_exponent is not None else None,
+                "grows_with_size": bool(exponents) and max(exponents) >= GROWTH_EXPONENT,
+            })
+        return rows
+
+
+# Get the profiler of the current Streamlit session
+def get_rerun_profiler(app, session_id):
+    """ Returns the profiler of the session, it is kept in the session state so the history survives reruns. """
+    profiler = st.session_state.get("rerun_profiler")
+    if profiler is None or profiler.session_id != session_id:
+        profiler = RerunProfiler(app, session_id)
+        st.session_state["rerun_profiler"] = profiler
+    profiler.enabled = st.sidebar.checkbox("Profile reruns", value=profiler.enabled, key="profile_reruns")
+    if profiler.enabled:
+        profiler.sites = st.sidebar.checkbox("Allocation sites", value=profiler.sites, key="profile_allocation_sites")
+    return profiler
+
+
+# Show the profiles in the sidebar
+def render_profile(profiler):
+    """ Shows the sections of the last rerun, the per-rerun breakdown and the sections which grow with the data size. """
+    if not profiler.history:
+        return
+    last = profiler.history[-1]
+    with st.sidebar.expander("Rerun Profile", expanded=False):
+        st.write(f"Last rerun: {last['wall_seconds']:.2f}s")
+        st.dataframe(
+            [
+                {
+                    "section": s["section"], "size": s["size"], "wall_ms": round(s["wall_seconds"] * 1000, 1),
+                    "alloc_kib": round(s["alloc_bytes"] / 1024, 1), "peak_kib": round(s["peak_bytes"] / 1024, 1),
+                }
+                for s in last["sections"]
+            ],
+            use_container_width=True,
+        )
+
+        st.write("Per rerun (wall ms)")
+        st.dataframe(
+            [
+                {
+                    "rerun": f"{profile['created_at']:%H:%M:%S}",
+                    "total_ms": round(profile["wall_seconds"] * 1000, 1),
+                    **{s["section"]: round(s["wall_seconds"] * 1000, 1) for s in profile["sections"]},
+                }
+                for profile in reversed(profiler.history)
+            ],
+            use_container_width=True,
+        )
+
+        growth = profiler.growth()
+        flagged = [row["section"] for row in growth if row["grows_with_size"]]
+        if flagged:
+            st.warning(f"Cost grows with the data size: {', '.join(flagged)}")
+        st.write("Growth with data size (exponent, 1 = linear)")
+        st.dataframe(growth, use_container_width=True)
+
+        sites = [
+            {"section": s["section"], "site": site["site"], "kib": round(site["size_diff"] / 1024, 1), "blocks": site["count_diff"]}
+            for s in last["sections"] for site in s["top_sites"]
+        ]
+        if sites:
+            st.write("Top allocation sites of the last rerun")
+            st.dataframe(sites, use_container_width=True)
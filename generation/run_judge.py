@@ -1,11 +1,23 @@
-""" This module is used to run the judge on the prompt and uploaded file. """
+"""
+This module is used to run the judge on the prompt and uploaded file.
+run_judge_by_requirement evaluates every judge element on every scenario as a separate, concurrent LLM call instead of
+a single call for the whole document, and reuses the cached verdicts of the evaluations whose inputs did not change.
+"""
 
-from llama_index.llms.ollama import Ollama
-from requests.exceptions import ConnectionError, Timeout
+import contextvars
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pymongo import UpdateOne
+import llm_client
+from metrics import record_cache
+from tracing import traced
 import json
 import logging
 
 # Run the judge on the prompt and uploaded file
+@traced()
 def run_judge_on_prompt(judge_combined_prompt, uploaded_file):
     # Create the prompt
     prompt = f"""
@@ -35,8 +47,7 @@ def run_judge_on_prompt(judge_combined_prompt, uploaded_file):
     # print(50*"-")
 
     # Run the judge with the prompt and uploaded file content to get the control data using llama3.2 model
-    llm = Ollama(model="llama3.2", request_timeout=300.0, json_mode=True)
-    resp = llm.complete(prompt)
+    resp = llm_client.complete("llama3.2", prompt, json_mode=True, site="run_judge_on_prompt")
     control_data = json.loads(resp.text)
 
     # Return the control data
@@ -46,3 +57,190 @@ def run_judge_on_prompt(judge_combined_prompt, uploaded_file):
         return control_data
     else:
         return "Error: No valid response received."
+
+
+# Judge calls running at the same time, more would only wait for a slot of the LLM scheduler
+JUDGE_MAX_WORKERS = int(os.getenv("JUDGE_MAX_WORKERS", os.getenv("LLM_MAX_CONCURRENCY", "2")))
+# Timeout of a single requirement evaluation, much shorter than the timeout of the combined judge call
+JUDGE_REQUEST_TIMEOUT = float(os.getenv("JUDGE_REQUEST_TIMEOUT", "120"))
+# Collection of the cached verdicts, the TTL index is provisioned by indexes.py
+VERDICTS_COLLECTION = "judge_verdicts"
+
+
+# Stable id of the control of a judge element on a scenario
+def control_id(scenario, element_name):
+    """ Returns the ControlID of the judge element on the scenario, it does not depend on the order of the evaluations. """
+    return f"{scenario.get('ScenarioID', 'Unknown')}/{element_name}"
+
+
+# Build the prompt which evaluates one judge element on one scenario
+def build_requirement_prompt(element_name, element_prompt, scenario, document_content):
+    """ Returns the prompt of a single requirement evaluation. """
+    return f"""
+    Evaluate whether the test scenario below meets the requirement of the judge element. Use the document content as the reference.
+
+    Judge Element: {element_name}
+    {element_prompt}
+
+    Test Scenario:
+    {json.dumps(scenario, indent=2, ensure_ascii=False)}
+
+    Document Content:
+    {document_content}
+
+    Return your response only in valid JSON with the following format:
+
+    {{
+        "Title": "<Give a title for the control according to the evaluation>",
+        "Evaluation": <true if the test scenario meets the requirement, false otherwise>,
+        "Comments": "<Any inconsistency or additional notes>"
+    }}
+    """
+
+
+# Evaluate one judge element on one scenario
+def evaluate_requirement(model, element_name, element_prompt, scenario, document_content, max_retries=2):
+    """
+    Runs a single requirement evaluation and returns its control without the ControlID.
+    Raises the last error if all attempts fail.
+    """
+    prompt = build_requirement_prompt(element_name, element_prompt, scenario, document_content)
+    last_error = None
+    for attempt in range(1, max_retries + 1):
+        try:
+            resp = llm_client.complete(
+                model, prompt, json_mode=True, request_timeout=JUDGE_REQUEST_TIMEOUT, site="evaluate_requirement", attempt=attempt
+            )
+            verdict = json.loads(resp.text)
+            evaluation = verdict["Evaluation"]
+            if isinstance(evaluation, str):
+                evaluation = evaluation.strip().lower() == "true"
+            return {
+                "ScenarioID": scenario.get("ScenarioID", "Unknown"),
+                "JudgeElement": element_name,
+                "Title": verdict.get("Title", element_name),
+                "Evaluation": bool(evaluation),
+                "Comments": verdict.get("Comments", ""),
+            }
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            last_error = ValueError(f"Invalid judge response: {e}")
+        except Exception as e:
+            # Connection errors, timeouts and errors of the LLM server
+            last_error = e
+        logging.warning(f"Judge {element_name} on {scenario.get('ScenarioID')} failed (attempt {attempt}): {last_error}")
+    raise last_error
+
+
+# Hash of a JSON serialisable value
+def _hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# Cache key of a requirement evaluation
+def verdict_key(scenario, element_name, element_prompt, document_hash, model):
+    """
+    Returns (key, scenario hash, judge element hash) of the evaluation of the judge element on the scenario.
+    The key also covers the document and the model, a verdict is reused only if none of its inputs changed.
+    """
+    scenario_hash = _hash(scenario)
+    element_hash = _hash([element_name, element_prompt])
+    return _hash([scenario_hash, element_hash, document_hash, model]), scenario_hash, element_hash
+
+
+# Read the cached verdicts
+def fetch_cached_verdicts(db, keys):
+    """ Returns {key: verdict} of the cached evaluations among the keys. """
+    return {
+        entry["_id"]: entry["verdict"]
+        for entry in db[VERDICTS_COLLECTION].find({"_id": {"$in": list(keys)}}, {"verdict": 1})
+    }
+
+
+# Store the fresh verdicts
+def save_verdicts(db, entries):
+    """ Stores the verdicts of the fresh evaluations, entries are (key, scenario hash, judge element hash, model, verdict). """
+    operations = [
+        UpdateOne(
+            {"_id": key},
+            {"$set": {
+                "scenario_hash": scenario_hash,
+                "judge_element_hash": element_hash,
+                "model": model,
+                "verdict": verdict,
+                "created_at": datetime.now(),
+            }},
+            upsert=True
+        )
+        for key, scenario_hash, element_hash, model, verdict in entries
+    ]
+    if operations:
+        db[VERDICTS_COLLECTION].bulk_write(operations, ordered=False)
+
+
+# Run the judge per judge element and scenario
+@traced()
+def run_judge_by_requirement(judge_elements, scenarios, document_content, model="llama3.2", max_workers=JUDGE_MAX_WORKERS, max_retries=2, db=None):
+    """
+    Evaluates every judge element on every scenario as a separate LLM call and runs the calls concurrently.
+    judge_elements maps the judge element names to their prompts, scenarios are the TestScenarios of the model output.
+    With a database the verdicts are cached per (scenario hash, judge element hash, document hash, model) and only the
+    evaluations whose inputs changed are run again.
+
+    Returns {"Controls": [...], "Errors": [...], "Summary": {...}}. The controls are ordered by judge element and scenario
+    and have the stable ControlID "<ScenarioID>/<judge element>", failed evaluations are listed in Errors, they do not
+    affect the others and are not cached. Summary counts the evaluations, the evaluated, skipped (cached) and failed ones.
+    """
+    document_hash = _hash(document_content)
+    pieces = [
+        (element_name, element_prompt, scenario, *verdict_key(scenario, element_name, element_prompt, document_hash, model))
+        for element_name, element_prompt in judge_elements.items()
+        for scenario in scenarios
+    ]
+    cached = fetch_cached_verdicts(db, {piece[3] for piece in pieces}) if db is not None else {}
+    results = [cached.get(piece[3]) for piece in pieces]
+
+    pending = [index for index, result in enumerate(results) if result is None]
+    if db is not None:
+        record_cache("judge_verdicts", hit=True, count=len(pieces) - len(pending))
+        record_cache("judge_verdicts", hit=False, count=len(pending))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # Every call runs in a copy of the caller's context so it keeps the LLM owner, priority and trace
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                evaluate_requirement, model, pieces[index][0], pieces[index][1], pieces[index][2], document_content, max_retries
+            ): index
+            for index in pending
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = e
+
+    if db is not None:
+        save_verdicts(db, [
+            (pieces[index][3], pieces[index][4], pieces[index][5], model, results[index])
+            for index in pending
+            if not isinstance(results[index], Exception)
+        ])
+
+    controls, errors = [], []
+    for (element_name, _, scenario, *_), result in zip(pieces, results):
+        if isinstance(result, Exception):
+            errors.append({
+                "ControlID": control_id(scenario, element_name),
+                "ScenarioID": scenario.get("ScenarioID", "Unknown"),
+                "JudgeElement": element_name,
+                "Error": str(result),
+            })
+        else:
+            controls.append({"ControlID": control_id(scenario, element_name), **result})
+    summary = {
+        "evaluations": len(pieces),
+        "evaluated": len(pending),
+        "skipped": len(pieces) - len(pending),
+        "failed": len(errors),
+    }
+    return {"Controls": controls, "Errors": errors, "Summary": summary}
@@ -1,7 +1,8 @@
 """ This script is used to run the model on the prompt and save the output to the database. """
 
-from llama_index.llms.ollama import Ollama
-from requests.exceptions import ConnectionError, Timeout
+import llm_client
+from metrics import JSON_VALIDATION_FAILURES
+from tracing import traced
 import json
 import logging
 
@@ -20,6 +21,7 @@ def validate_json_structure(data):
     return False
 
 # Run the model on the prompt and return the test scenarios. If it does not be successful, retry up to 3 times.
+@traced()
 def run_model_on_prompt(model, prompt, max_retries=3):
     # Initialize retry count
     attempts = 0
@@ -28,8 +30,7 @@ def run_model_on_prompt(model, prompt, max_retries=3):
     while attempts < max_retries:
         try:
             # Run the model on the prompt to generate test scenarios
-            llm = Ollama(model=model, request_timeout=300.0, json_mode=True)
-            resp = llm.complete(prompt)
+            resp = llm_client.complete(model, prompt, json_mode=True, site="run_model_on_prompt", attempt=attempts + 1)
 
             # Log the raw response for debugging purposes
             logging.info(f"Attempt {attempts + 1}: Raw response received: {resp.text}")
@@ -43,7 +44,7 @@ def run_model_on_prompt(model, prompt, max_retries=3):
             else:
                 logging.warning("Parsed JSON does not match the expected structure. Retrying...")
 
-        except (ConnectionError, Timeout) as e:
+        except llm_client.transport_errors() as e:
             logging.error(f"Connection error or timeout occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
@@ -75,9 +76,11 @@ def parse_json_response(json_text):
             return parsed_data
         else:
             logging.warning("Parsed JSON does not match the expected structure.")
+            JSON_VALIDATION_FAILURES.inc(site="run_model_on_prompt", reason="structure")
             return None
     except json.JSONDecodeError as e:
         logging.error(f"JSON decoding failed: {e}")
+        JSON_VALIDATION_FAILURES.inc(site="run_model_on_prompt", reason="invalid_json")
         return None
 
 # Save the model output to the database using the session ID
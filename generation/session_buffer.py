@@ -0,0 +1,226 @@
+""" This module contains a write buffer for the session document. It tracks dirty fields, skips writes that do not change anything and merges the remaining changes into a single $set with dotted paths. """
+
+import copy
+import streamlit as st
+from database import get_sessions_collection
+
+# Sentinel for values that have never been written by this buffer
+_MISSING = object()
+
+
+# Check if a dictionary key can be used as a part of a dotted MongoDB path
+def _is_path_safe(key):
+    """ Keys with dots or a leading $ cannot be addressed with a dotted path. """
+    return isinstance(key, str) and key != "" and "." not in key and not key.startswith("$")
+
+
+# Flatten a value into (dotted path, leaf value) pairs
+def flatten_paths(prefix, value):
+    """
+    Flattens nested dictionaries into dotted paths so that only the changed leaves are written.
+    Dictionaries with keys that cannot be addressed with a dotted path are kept as a single value.
+    """
+    if isinstance(value, dict) and value and all(_is_path_safe(key) for key in value):
+        paths = {}
+        for key, item in value.items():
+            paths.update(flatten_paths(f"{prefix}.{key}", item))
+        return paths
+    return {prefix: value}
+
+
+# Read the value at a dotted path of a document
+def _resolve(document, path):
+    """ Returns the value at the dotted path, or _MISSING if the path does not exist. """
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+class SessionWriteBuffer:
+    """
+    Collects the field changes of one session document and writes them with a single update_one.
+
+    Fields at the root of the session document are addressed with their dotted path (e.g. "selected_category").
+    Fields of an entry in original_prompts are addressed with the test name and their dotted path inside the entry,
+    they are written with arrayFilters so several test names can be merged into the same update.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        # Last values known to be in the database, keyed by (test_name or None, path)
+        self._persisted = {}
+        # Values waiting for the next flush, keyed by (test_name or None, path)
+        self._pending = {}
+        # Counters for the writes which were issued and avoided
+        self.writes_issued = 0
+        self.writes_avoided = 0
+
+    # Queue a single field change
+    def _queue(self, test_name, path, value):
+        key = (test_name, path)
+        current = self._pending.get(key, self._persisted.get(key, _MISSING))
+        if current is not _MISSING and current == value:
+            # The value is already in the database or already queued
+            self.writes_avoided += 1
+            return False
+
+        # A pending parent value is updated in place, MongoDB rejects a parent and a child path in the same $set
+        for (pending_test_name, pending_path), pending_value in self._pending.items():
+            if pending_test_name == test_name and path.startswith(pending_path + ".") and isinstance(pending_value, dict):
+                target = pending_value
+                parts = path[len(pending_path) + 1:].split(".")
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = copy.deepcopy(value)
+                return True
+
+        # Pending child values are replaced by the new parent value
+        for pending_key in [k for k in self._pending if k[0] == test_name and k[1].startswith(path + ".")]:
+            del self._pending[pending_key]
+        # Copy containers so later changes of the caller do not leak into the buffer
+        self._pending[key] = copy.deepcopy(value)
+        return True
+
+    # Queue the new value of a field
+    def _queue_field(self, test_name, field, value):
+        """
+        The value replaces the whole field. Its leaves are queued one by one, unless a path the buffer knows under the
+        field is no longer written by them (e.g. a removed dictionary key), then the field is queued as a single value.
+        """
+        paths = flatten_paths(field, value)
+        known = [path for t, path in [*self._persisted, *self._pending] if t == test_name]
+        for path in known:
+            if path != field and not path.startswith(field + "."):
+                continue
+            if path not in paths and not any(path.startswith(leaf_path + ".") for leaf_path in paths):
+                return self._queue(test_name, field, value)
+
+        changed = False
+        for path, leaf in paths.items():
+            changed = self._queue(test_name, path, leaf) or changed
+        return changed
+
+    # Set one or more fields at the root of the session document
+    def set(self, fields):
+        """ Queues the root level fields and returns True if any of them changed. """
+        changed = False
+        for field, value in fields.items():
+            changed = self._queue_field(None, field, value) or changed
+        return changed
+
+    # Set one or more fields of an original_prompts entry
+    def set_scenario_fields(self, test_name, fields):
+        """ Queues the fields of the original prompt for the test name and returns True if any of them changed. """
+        changed = False
+        for field, value in fields.items():
+            changed = self._queue_field(test_name, field, value) or changed
+        return changed
+
+    # Mark values as already stored in the database
+    def mark_persisted(self, fields, test_name=None):
+        """ Seeds the buffer with values read from the database so that the first rerun does not rewrite them. """
+        for field, value in fields.items():
+            for path, leaf in flatten_paths(field, value).items():
+                self._persisted[(test_name, path)] = copy.deepcopy(leaf)
+
+    # Forget the values which were changed by another writer
+    def sync(self, document):
+        """
+        Compares the values known to be in the database with the session document read from the database.
+        Values which the worker, a test case run or a batch run changed since they were written are forgotten,
+        so setting them again is written instead of being skipped.
+        """
+        document = document or {}
+        entries = {prompt.get("test_name"): prompt for prompt in document.get("original_prompts", []) if isinstance(prompt, dict)}
+        for key in list(self._persisted):
+            test_name, path = key
+            source = document if test_name is None else entries.get(test_name, {})
+            if _resolve(source, path) != self._persisted[key]:
+                del self._persisted[key]
+
+    # Projection of the fields known to be in the database
+    def projection(self):
+        """ Returns the projection which reads the fields needed by sync. """
+        fields = {"_id": 0}
+        for test_name, path in self._persisted:
+            if test_name is None:
+                fields[path.split(".")[0]] = 1
+            else:
+                fields["original_prompts.test_name"] = 1
+                fields[f"original_prompts.{path.split('.')[0]}"] = 1
+        return fields
+
+    @property
+    def dirty(self):
+        """ Returns True if there are pending changes. """
+        return bool(self._pending)
+
+    # Build the update document for the pending changes
+    def _build_update(self):
+        set_fields = {}
+        array_filters = []
+        identifiers = {}
+        for (test_name, path), value in self._pending.items():
+            if test_name is None:
+                set_fields[path] = value
+                continue
+            if test_name not in identifiers:
+                identifiers[test_name] = f"p{len(identifiers)}"
+                array_filters.append({f"{identifiers[test_name]}.test_name": test_name})
+            set_fields[f"original_prompts.$[{identifiers[test_name]}].{path}"] = value
+        return set_fields, array_filters
+
+    # Write the pending changes to the database
+    def flush(self):
+        """
+        Writes all pending changes with a single update_one.
+        Returns True if a write was issued, False if there was nothing to write.
+        """
+        if not self._pending:
+            return False
+
+        set_fields, array_filters = self._build_update()
+        collection = get_sessions_collection()
+        if array_filters:
+            # Upsert can not be combined with a filtered positional operator
+            collection.update_one(
+                {"session_id": self.session_id},
+                {"$set": set_fields},
+                array_filters=array_filters
+            )
+        else:
+            collection.update_one(
+                {"session_id": self.session_id},
+                {"$set": set_fields},
+                upsert=True
+            )
+
+        # Cached values at and below the written paths are no longer reliable
+        for test_name, path in self._pending:
+            for persisted_key in [k for k in self._persisted if k[0] == test_name and (k[1] == path or k[1].startswith(path + "."))]:
+                del self._persisted[persisted_key]
+        # Written dictionaries are known by their leaves, so later changes of a single key are written on their own
+        for (test_name, path), value in self._pending.items():
+            for leaf_path, leaf in flatten_paths(path, value).items():
+                self._persisted[(test_name, leaf_path)] = leaf
+        self._pending = {}
+        self.writes_issued += 1
+        return True
+
+
+# Get the write buffer for the current Streamlit session
+def get_session_buffer(session_id):
+    """
+    Returns the write buffer of the session, it is kept in the session state so it survives reruns.
+    The values it knows are checked against the database once per rerun, other writers may have changed them in between.
+    """
+    buffer = st.session_state.get("session_write_buffer")
+    if buffer is None or buffer.session_id != session_id:
+        buffer = SessionWriteBuffer(session_id)
+        st.session_state["session_write_buffer"] = buffer
+    elif buffer._persisted:
+        buffer.sync(get_sessions_collection().find_one({"session_id": session_id}, buffer.projection()))
+    return buffer
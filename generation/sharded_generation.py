@@ -0,0 +1,150 @@
+"""
+This module generates the test scenarios of large documents in shards.
+The document is split into sections, the scenarios of every section are generated concurrently with the same prompt
+elements, near-duplicate scenarios of different sections are merged and the ScenarioIDs are renumbered in document order.
+The prompt elements are the inputs the combined prompt of the session was generated from, not the current widget values.
+"""
+
+import contextvars
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from duplicate_index import case_text, minhash_signature, band_keys, estimate_similarity, DEFAULT_THRESHOLD
+from prompt_generate import generate_prompt
+from run_model import run_model_on_prompt
+from tracing import traced
+
+# Maximum characters of a section, documents up to this size are generated in a single call
+SHARD_MAX_CHARS = int(os.getenv("SHARD_MAX_CHARS", "6000"))
+# Sections generated at the same time, more would only wait for a slot of the LLM scheduler
+SHARD_MAX_WORKERS = int(os.getenv("SHARD_MAX_WORKERS", os.getenv("LLM_MAX_CONCURRENCY", "2")))
+
+# Lines which start a new section: markdown headings, numbered headings (1., 2.3 Title) and short upper case lines
+_HEADING = re.compile(r"^\s*(#{1,6}\s+\S|\d+(\.\d+)*\.?\s+[A-Z]|[A-Z][A-Z0-9 \-:]{3,60}$)")
+
+
+# Split a text which is longer than max_chars at line and word boundaries
+def _split_long(text, max_chars):
+    parts = []
+    while len(text) > max_chars:
+        cut = text.rfind("\n", 0, max_chars)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+# Split a document into sections
+def split_document(document_content, max_chars=SHARD_MAX_CHARS):
+    """
+    Splits the document into sections of at most max_chars characters at paragraph boundaries.
+    A heading starts a new section once the current section is at least half full, so sections follow the document structure.
+    """
+    blocks = []
+    for paragraph in re.split(r"\n\s*\n", document_content or ""):
+        paragraph = paragraph.strip()
+        if paragraph:
+            blocks.extend(_split_long(paragraph, max_chars))
+
+    sections, current = [], ""
+    for block in blocks:
+        starts_section = bool(_HEADING.match(block.splitlines()[0])) and len(current) >= max_chars // 2
+        if current and (len(current) + len(block) + 2 > max_chars or starts_section):
+            sections.append(current)
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+    if current:
+        sections.append(current)
+    return sections
+
+
+# Merge the near-duplicate scenarios of different sections
+def merge_near_duplicates(shards, threshold=DEFAULT_THRESHOLD):
+    """
+    Takes the scenarios per section in document order and drops the scenarios whose Title, Description and Objective have an
+    estimated similarity of at least threshold with a kept scenario of an earlier section. Scenarios of the same section are
+    all kept, the model generated them as distinct scenarios. Candidates are found with the LSH bands of duplicate_index.
+    Returns (kept scenarios, merged count).
+    """
+    kept, signatures, kept_shards, buckets = [], [], [], {}
+    merged = 0
+    for shard, scenarios in enumerate(shards):
+        for scenario in scenarios:
+            signature = minhash_signature(case_text(scenario))
+            keys = band_keys(signature)
+            candidates = {index for key in keys for index in buckets.get(key, []) if kept_shards[index] != shard}
+            if any(estimate_similarity(signature, signatures[index]) >= threshold for index in candidates):
+                merged += 1
+                continue
+            for key in keys:
+                buckets.setdefault(key, []).append(len(kept))
+            kept.append(scenario)
+            signatures.append(signature)
+            kept_shards.append(shard)
+    return kept, merged
+
+
+# Renumber the ScenarioIDs
+def renumber_scenarios(scenarios, process_title):
+    """ Sets the ScenarioIDs to {process_title}_Test_Scenario_n in the order of the scenarios, starting at 1. """
+    return [
+        {**scenario, "ScenarioID": f"{process_title}_Test_Scenario_{number}"}
+        for number, scenario in enumerate(scenarios, start=1)
+    ]
+
+
+# Generate the scenarios of a document in shards
+@traced()
+def generate_sharded_scenarios(
+    model, process_title, document_type, test_prompt, document_content, selected_test_name,
+    selected_instruction_elements, test_instruction_elements, selected_scoring_elements, test_scoring_elements,
+    max_chars=SHARD_MAX_CHARS, max_workers=SHARD_MAX_WORKERS, threshold=DEFAULT_THRESHOLD
+):
+    """
+    Generates the scenarios of every section of the document concurrently and merges them.
+    Sections whose generation fails are skipped, their numbers are reported in the summary.
+    Returns ({"TestScenarios": [...]}, summary) ready for save_model_output_to_db.
+    """
+    sections = split_document(document_content, max_chars)
+
+    def generate(index, section):
+        prompt = generate_prompt(
+            process_title, document_type, test_prompt,
+            f"(Section {index + 1} of {len(sections)} of the document, generate the scenarios of this section only)\n{section}",
+            selected_test_name, selected_instruction_elements, test_instruction_elements,
+            selected_scoring_elements, test_scoring_elements
+        )
+        return run_model_on_prompt(model, prompt)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # Every section runs in a copy of the caller's context so it keeps the LLM owner, priority and trace
+        futures = [
+            executor.submit(contextvars.copy_context().run, generate, index, section)
+            for index, section in enumerate(sections)
+        ]
+        outputs = []
+        for future in futures:
+            try:
+                outputs.append(future.result())
+            except Exception as e:
+                logging.error(f"Sharded scenario generation failed: {e}")
+                outputs.append(None)
+
+    # Scenarios per section in document order, run_model_on_prompt returns None for a failed section
+    shards = [output["TestScenarios"] for output in outputs if output]
+    kept, merged = merge_near_duplicates(shards, threshold)
+    summary = {
+        "sections": len(sections),
+        "failed_sections": [index + 1 for index, output in enumerate(outputs) if not output],
+        "generated": sum(len(scenarios) for scenarios in shards),
+        "merged": merged,
+        "scenarios": len(kept),
+    }
+    return {"TestScenarios": renumber_scenarios(kept, process_title)}, summary
@@ -0,0 +1,267 @@
+"""
+This module implements a small durable task queue on a MongoDB collection.
+Tasks are leased atomically with find_one_and_update, a lease expires after a visibility timeout so a crashed worker's
+task becomes available again, failed tasks are retried with a delay and dead-lettered after max_attempts.
+Any number of worker processes on any node can drain the queue with run_worker. A heartbeat extends the lease of a
+running task; if the lease is lost anyway the handler is stopped at its next LLM call (see worker.as_batch).
+The timestamps are in UTC, so nodes in different time zones agree on when a task is available or its lease expires.
+"""
+
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from tracing import span, trace_context
+
+# Collection of the queue
+QUEUE_COLLECTION = "task_queue"
+
+# Task statuses
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+# Default visibility timeout in seconds, a leased task is handed to another worker when it expires
+DEFAULT_VISIBILITY_TIMEOUT = 600
+# Default delay before a failed task is retried, multiplied by the attempt number
+DEFAULT_RETRY_DELAY = 30
+# Lease extensions per visibility timeout, a single failed extension does not lose the lease
+HEARTBEATS_PER_TIMEOUT = 3
+
+# Set when the lease of the task of the current context was lost, None outside of a task
+_lease_lost = contextvars.ContextVar("task_lease_lost", default=None)
+
+
+# Create a worker id which is unique across nodes and processes
+def make_worker_id():
+    """ Returns an id in the form host:pid:random. """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# Add a task to the queue
+def enqueue(db, task_type, payload, priority=0, max_attempts=3, delay=0):
+    """
+    Adds a task to the queue and returns its id.
+    Tasks with a higher priority are leased first, tasks with the same priority in insertion order.
+    The trace context of the caller is stored with the task so the worker continues the same trace.
+    """
+    now = datetime.now(timezone.utc)
+    task_id = str(uuid.uuid4())
+    db[QUEUE_COLLECTION].insert_one({
+        "_id": task_id,
+        "type": task_type,
+        "payload": payload,
+        "status": QUEUED,
+        "priority": priority,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "available_at": now + timedelta(seconds=delay),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "created_at": now,
+        "updated_at": now,
+        "last_error": None,
+        "trace": trace_context(),
+    })
+    return task_id
+
+
+# Lease the next available task
+def lease(db, worker_id, task_types, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """
+    Atomically leases the next available task of the given types and returns it, or None if there is none.
+    Queued tasks whose delay has passed and leased tasks whose lease has expired are available.
+    Tasks which have used up their attempts are dead-lettered instead of being handed out again.
+    """
+    collection = db[QUEUE_COLLECTION]
+    while True:
+        now = datetime.now(timezone.utc)
+        task = collection.find_one_and_update(
+            {
+                "type": {"$in": list(task_types)},
+                "$or": [
+                    {"status": QUEUED, "available_at": {"$lte": now}},
+                    {"status": LEASED, "lease_expires_at": {"$lte": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": LEASED,
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=visibility_timeout),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if task is None:
+            return None
+        if task["attempts"] > task["max_attempts"]:
+            # The previous owner's lease expired on the last attempt
+            collection.update_one(
+                {"_id": task["_id"], "lease_owner": worker_id},
+                {"$set": {"status": DEAD, "lease_owner": None, "updated_at": now,
+                          "last_error": task.get("last_error") or "Lease expired on the last attempt."}}
+            )
+            continue
+        return task
+
+
+# Extend the lease of a long running task
+def extend_lease(db, task_id, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """ Extends the lease, returns False if the lease was lost to another worker. """
+    now = datetime.now(timezone.utc)
+    result = db[QUEUE_COLLECTION].update_one(
+        {"_id": task_id, "status": LEASED, "lease_owner": worker_id},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=visibility_timeout), "updated_at": now}}
+    )
+    # A renewal within the millisecond of the lease changes nothing, so the match decides
+    return result.matched_count == 1
+
+
+class LeaseHeartbeat:
+    """
+    Extends the lease of a running task every visibility_timeout / HEARTBEATS_PER_TIMEOUT seconds in a daemon thread.
+    lost is set when an extension finds the task leased by another worker, it is also the lease_lost_event of the
+    context the heartbeat is entered in.
+    """
+
+    def __init__(self, db, task_id, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self.db = db
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self.interval = max(visibility_timeout / HEARTBEATS_PER_TIMEOUT, 0.01)
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-heartbeat-{task_id}", daemon=True)
+        self._token = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                extended = extend_lease(self.db, self.task_id, self.worker_id, self.visibility_timeout)
+            except PyMongoError as e:
+                # The next heartbeat tries again, the lease only expires after HEARTBEATS_PER_TIMEOUT misses
+                logging.warning(f"{self.worker_id}: lease of {self.task_id} could not be extended: {e}")
+                continue
+            if not extended:
+                logging.warning(f"{self.worker_id}: lease of {self.task_id} was lost, stopping the task.")
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._token = _lease_lost.set(self.lost)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        _lease_lost.reset(self._token)
+        return False
+
+
+# Lease state of the running task
+def lease_lost_event():
+    """ Returns the event which is set when the lease of the task of the current context is lost, None outside of a task. """
+    return _lease_lost.get()
+
+
+# Mark a task as done
+def complete(db, task_id, worker_id, result=None):
+    """ Marks the task as done, returns False if the lease was lost to another worker. """
+    update = db[QUEUE_COLLECTION].update_one(
+        {"_id": task_id, "status": LEASED, "lease_owner": worker_id},
+        {"$set": {"status": DONE, "result": result, "lease_owner": None, "updated_at": datetime.now(timezone.utc)}}
+    )
+    return update.modified_count == 1
+
+
+# Mark a task as failed
+def fail(db, task, worker_id, error, retry_delay=DEFAULT_RETRY_DELAY):
+    """
+    Requeues the task with a delay, or dead-letters it if it has used up its attempts.
+    Returns the new status of the task.
+    """
+    now = datetime.now(timezone.utc)
+    if task["attempts"] >= task["max_attempts"]:
+        status, fields = DEAD, {}
+    else:
+        status, fields = QUEUED, {"available_at": now + timedelta(seconds=retry_delay * task["attempts"])}
+    db[QUEUE_COLLECTION].update_one(
+        {"_id": task["_id"], "lease_owner": worker_id},
+        {"$set": {"status": status, "lease_owner": None, "lease_expires_at": None,
+                  "last_error": str(error), "updated_at": now, **fields}}
+    )
+    return status
+
+
+# Requeue dead-lettered tasks
+def requeue_dead(db, task_type=None):
+    """ Moves dead-lettered tasks back to the queue with a fresh attempt count. Returns the number of tasks. """
+    query = {"status": DEAD}
+    if task_type:
+        query["type"] = task_type
+    now = datetime.now(timezone.utc)
+    result = db[QUEUE_COLLECTION].update_many(
+        query,
+        {"$set": {"status": QUEUED, "attempts": 0, "available_at": now, "updated_at": now}}
+    )
+    return result.modified_count
+
+
+# Count the tasks per type and status
+def queue_stats(db):
+    """ Returns {(type, status): count}. """
+    pipeline = [{"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}]
+    return {
+        (entry["_id"]["type"], entry["_id"]["status"]): entry["count"]
+        for entry in db[QUEUE_COLLECTION].aggregate(pipeline)
+    }
+
+
+# Drain the queue with the given handlers
+def run_worker(db, handlers, worker_id=None, poll_interval=2.0, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_tasks=None):
+    """
+    Leases and runs tasks until max_tasks tasks were processed (forever if None).
+    handlers maps a task type to a function(db, payload) whose return value is stored as the task result.
+    The lease is extended while the handler runs. A task whose lease was lost is neither completed nor failed by this
+    worker, it belongs to the worker which leased it next.
+    """
+    worker_id = worker_id or make_worker_id()
+    processed = 0
+    while max_tasks is None or processed < max_tasks:
+        task = lease(db, worker_id, handlers.keys(), visibility_timeout=visibility_timeout)
+        if task is None:
+            time.sleep(poll_interval)
+            continue
+
+        logging.info(f"{worker_id}: running {task['type']} {task['_id']} (attempt {task['attempts']})")
+        with LeaseHeartbeat(db, task["_id"], worker_id, visibility_timeout) as heartbeat:
+            try:
+                with span(
+                    f"task {task['type']}", kind="task", parent=task.get("trace"),
+                    session_id=task["payload"].get("session_id"), task_id=task["_id"], attempt=task["attempts"], worker_id=worker_id
+                ):
+                    result = handlers[task["type"]](db, task["payload"])
+            except Exception as e:
+                if heartbeat.lost.is_set():
+                    logging.warning(f"{worker_id}: {task['type']} {task['_id']} stopped after its lease was lost: {e}")
+                else:
+                    status = fail(db, task, worker_id, e)
+                    logging.error(f"{worker_id}: {task['type']} {task['_id']} failed ({status}): {e}")
+            else:
+                if not complete(db, task["_id"], worker_id, result):
+                    logging.warning(f"{worker_id}: lease of {task['_id']} was lost before completion.")
+        processed += 1
+    return processed
@@ -0,0 +1,219 @@
+"""
+This module checkpoints the test case generation of a session ("Create Test Case") per scenario.
+A run gets a run id and every scenario a TestCases entry with a status (pending, done or failed). Each entry is written
+into the session document as soon as its scenario finishes, so the finished work survives a hung LLM call or a closed browser.
+An interrupted run is resumed with the inputs it was started with; only the pending and failed scenarios are generated again.
+A run in the app holds a lease which every checkpoint renews, so only one tab or rerun generates its scenarios; a resumed
+run gets a new run id, so the checkpoints of the previous holder and of its queued tasks are dropped.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from generate_test_case import build_test_case_prompt, generate_test_case, test_case_input_hash, reusable_test_cases
+from metrics import record_cache
+
+# Statuses of a TestCases entry
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# Statuses of a run, a run stays running if it was interrupted
+RUNNING = "running"
+FINISHED = "finished"
+INCOMPLETE = "incomplete"
+
+# Seconds a run in the app stays leased after its last checkpoint, longer than the generation of one scenario
+LEASE_SECONDS = 900
+
+
+class TestCaseRunReplaced(RuntimeError):
+    """ Raised when the run was replaced by a newer or resumed run of the session. """
+
+
+# Start a test case run
+def start_test_case_run(db, session_id, test_scenarios, model, test_case_main_prompt, selected_test_case_prompts, background=False):
+    """
+    Saves the scenarios with one TestCases entry per scenario and the inputs of the run under test_case_run.
+    Stored test cases whose input hash did not change are kept as done, the other scenarios start as pending.
+    A run generated in the app is leased to it, a background run is finished by its tasks (see worker.py).
+    Returns the run.
+    """
+    session = db["sessions"].find_one({"session_id": session_id}, {"model_output.TestCases": 1}) or {}
+    reusable = reusable_test_cases(session.get("model_output", {}).get("TestCases"))
+
+    test_case_groups = []
+    for scenario in test_scenarios:
+        input_hash = test_case_input_hash(scenario, test_case_main_prompt, selected_test_case_prompts, model)
+        test_case_groups.append(reusable.get(input_hash) or {
+            "scenario_id": scenario.get("ScenarioID", "Unknown"),
+            "status": PENDING,
+            "test_case": None,
+            "input_hash": input_hash,
+        })
+
+    reused = sum(1 for group in test_case_groups if group.get("status", DONE) == DONE)
+    record_cache("test_case_reuse", hit=True, count=reused)
+    record_cache("test_case_reuse", hit=False, count=len(test_case_groups) - reused)
+
+    run = {
+        "run_id": uuid.uuid4().hex,
+        "status": RUNNING,
+        "started_at": datetime.now(),
+        "model": model,
+        "test_case_main_prompt": test_case_main_prompt,
+        "selected_test_case_prompts": selected_test_case_prompts,
+        "scenario_count": len(test_scenarios),
+        "background": background,
+        "reused": reused,
+        "lease_until": None if background else datetime.now() + timedelta(seconds=LEASE_SECONDS),
+    }
+    db["sessions"].update_one(
+        {"session_id": session_id},
+        {"$set": {"model_output": {"TestScenarios": test_scenarios, "TestCases": test_case_groups}, "test_case_run": run}},
+        upsert=True
+    )
+    return run
+
+
+# Fetch the last run of a session
+def fetch_test_case_run(db, session_id):
+    """ Returns (run, test scenarios, TestCases entries) of the last run of the session, or None if it has no run. """
+    session = db["sessions"].find_one({"session_id": session_id}, {"test_case_run": 1, "model_output": 1})
+    if not session or not session.get("test_case_run"):
+        return None
+    model_output = session.get("model_output") or {}
+    return session["test_case_run"], model_output.get("TestScenarios", []), model_output.get("TestCases", [])
+
+
+# Indexes of the scenarios which still have to be generated
+def open_scenarios(test_case_groups):
+    """ Returns the indexes of the pending and failed TestCases entries. """
+    return [index for index, group in enumerate(test_case_groups) if group.get("status", DONE) != DONE]
+
+
+# Generate the test cases of one scenario
+def generate_scenario_test_cases(scenario, run):
+    """
+    Returns the TestCases entry of the scenario: done with the generated test cases, or failed with the error.
+    run needs the model, test_case_main_prompt and selected_test_case_prompts of the run.
+    """
+    combined_prompt = build_test_case_prompt(run["test_case_main_prompt"], scenario, run["selected_test_case_prompts"])
+    entry = {
+        "scenario_id": scenario.get("ScenarioID", "Unknown"),
+        "combined_prompt": combined_prompt,
+        "input_hash": test_case_input_hash(
+            scenario, run["test_case_main_prompt"], run["selected_test_case_prompts"], run["model"]
+        ),
+    }
+    try:
+        test_case = generate_test_case(run["model"], combined_prompt, max_retries=3)
+    except Exception as e:
+        logging.error(f"Test case generation failed for {entry['scenario_id']}: {e}")
+        return {**entry, "status": FAILED, "test_case": {"error": "Failed to generate test case"}, "error": str(e)}
+    return {**entry, "status": DONE, "test_case": test_case}
+
+
+# Check if a run can be resumed
+def is_resumable(run, test_case_groups):
+    """
+    A run can be resumed if it has open scenarios and is not running, or if it runs in the app and its lease has expired.
+    Runs stored before the lease was added have no lease and count as expired.
+    """
+    if not open_scenarios(test_case_groups):
+        return False
+    if run["status"] != RUNNING:
+        return True
+    return not run.get("background") and (run.get("lease_until") is None or run["lease_until"] < datetime.now())
+
+
+# Claim a run for a resume
+def claim_test_case_run(db, session_id, run_id, background=False):
+    """
+    Atomically gives the run a new run id, sets it running and leases it if it is resumed in the app.
+    Returns the claimed run, or None if it is running elsewhere or was replaced, e.g. by a resume in another tab.
+    """
+    now = datetime.now()
+    session = db["sessions"].find_one_and_update(
+        {
+            "session_id": session_id,
+            "test_case_run.run_id": run_id,
+            "$or": [
+                {"test_case_run.status": {"$ne": RUNNING}},
+                {"test_case_run.background": {"$ne": True}, "test_case_run.lease_until": {"$lt": now}},
+                {"test_case_run.background": {"$ne": True}, "test_case_run.lease_until": None},
+            ],
+        },
+        {"$set": {
+            "test_case_run.run_id": uuid.uuid4().hex,
+            "test_case_run.status": RUNNING,
+            "test_case_run.resumed_at": now,
+            "test_case_run.background": background,
+            "test_case_run.lease_until": None if background else now + timedelta(seconds=LEASE_SECONDS),
+        }},
+        projection={"test_case_run": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return session["test_case_run"] if session else None
+
+
+# Write the TestCases entry of a scenario
+def checkpoint_test_case(db, session_id, run_id, index, test_case_data, renew_lease=False):
+    """
+    Writes the TestCases entry of a scenario into the session.
+    With a run id the entry is only written while the run is the current run of the session, so a newer run is never
+    overwritten by an older one. With renew_lease the lease of the run is extended. Returns True if the entry was written.
+    """
+    query = {"session_id": session_id}
+    if run_id:
+        query["test_case_run.run_id"] = run_id
+    fields = {f"model_output.TestCases.{index}": test_case_data}
+    if renew_lease:
+        fields["test_case_run.lease_until"] = datetime.now() + timedelta(seconds=LEASE_SECONDS)
+    result = db["sessions"].update_one(query, {"$set": fields})
+    return result.matched_count > 0
+
+
+# Finish a run
+def finish_test_case_run(db, session_id, run_id):
+    """
+    Sets the run finished if every scenario is done, incomplete if scenarios failed or are pending, and releases its lease.
+    Returns the new status, or None if the run was replaced.
+    """
+    stored = fetch_test_case_run(db, session_id)
+    if stored is None or stored[0]["run_id"] != run_id:
+        return None
+    status = INCOMPLETE if open_scenarios(stored[2]) else FINISHED
+    result = db["sessions"].update_one(
+        {"session_id": session_id, "test_case_run.run_id": run_id},
+        {"$set": {"test_case_run.status": status, "test_case_run.finished_at": datetime.now(), "test_case_run.lease_until": None}}
+    )
+    return status if result.matched_count else None
+
+
+# Run or resume the open scenarios of a run
+def run_test_cases(db, session_id, run, on_result=None):
+    """
+    Generates the pending and failed scenarios of the run one after another and checkpoints each of them.
+    on_result(index, entry) is called after every scenario, e.g. to show the progress.
+    Returns the TestCases entries of the session. Raises TestCaseRunReplaced if the run was replaced by another run.
+    """
+    stored = fetch_test_case_run(db, session_id)
+    if stored is None or stored[0]["run_id"] != run["run_id"]:
+        raise TestCaseRunReplaced("The test case run was replaced by a newer run.")
+    _, test_scenarios, test_case_groups = stored
+
+    for index in open_scenarios(test_case_groups):
+        entry = generate_scenario_test_cases(test_scenarios[index], run)
+        if not checkpoint_test_case(db, session_id, run["run_id"], index, entry, renew_lease=True):
+            logging.warning(f"Test case run {run['run_id']} was replaced by a newer run, stopping.")
+            raise TestCaseRunReplaced("The test case run was replaced by a newer run while it was generated.")
+        test_case_groups[index] = entry
+        if on_result:
+            on_result(index, entry)
+
+    finish_test_case_run(db, session_id, run["run_id"])
+    return test_case_groups
@@ -0,0 +1,306 @@
+"""
+This module records lightweight traces of the apps: nested spans per Streamlit rerun, pipeline stage, LLM call and
+MongoDB command. The current span is kept in a context variable, spans are only recorded inside a trace which is
+started by a rerun, a batch document or a worker task. Queued tasks carry the trace context of the rerun which
+enqueued them, so the work of a background worker shows up in the same trace.
+
+Spans are written in batches by a background thread into the traces collection, or as JSON lines into TRACE_FILE if it is set.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import DESCENDING, monitoring
+from pymongo.errors import PyMongoError
+
+# Collection of the spans, the TTL index is provisioned by indexes.py
+TRACES_COLLECTION = "traces"
+# JSON lines file for the spans instead of the collection
+TRACE_FILE = os.getenv("TRACE_FILE")
+# Tracing is switched off with TRACING_ENABLED=0
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+# Spans are written when this many are pending or after FLUSH_INTERVAL seconds
+FLUSH_BATCH_SIZE = 200
+FLUSH_INTERVAL = 2.0
+
+# Span kinds which start a new trace
+ROOT_KINDS = ("rerun", "batch", "task")
+
+# The span of the current context
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class _NoSpan:
+    """ Stands in for a span outside of a trace, nothing is recorded. """
+
+    trace_id = span_id = session_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Span:
+    """ A timed operation of a trace, ended with end(). """
+
+    def __init__(self, name, kind, trace_id, parent_id, session_id, attributes):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.session_id = session_id
+        self.attributes = attributes
+        self.start = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        self._ended = False
+
+    def set(self, **attributes):
+        """ Adds attributes to the span. """
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        """ Ends the span, restores its parent as the current span and exports it. """
+        if self._ended:
+            return
+        self._ended = True
+        duration = time.perf_counter() - self._started
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Ended in another context, e.g. a rerun which was interrupted
+            pass
+        get_exporter().export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session_id": self.session_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration_seconds": round(duration, 6),
+            "attributes": self.attributes,
+            "error": str(error) if error is not None else None,
+        })
+
+
+# Start a span
+def start_span(name, kind="stage", session_id=None, parent=None, **attributes):
+    """
+    Starts a span as a child of the current span, or of parent (a trace context from trace_context) if given.
+    Spans of a root kind (rerun, batch, task) without a parent start a new trace, other spans outside of a trace are not recorded.
+    The span becomes the current span until end() is called.
+    """
+    if not TRACING_ENABLED:
+        return NO_SPAN
+    if parent is None and kind not in ROOT_KINDS:
+        parent = trace_context()
+    if parent is not None:
+        return Span(name, kind, parent["trace_id"], parent["span_id"], session_id or parent.get("session_id"), attributes)
+    if kind in ROOT_KINDS:
+        return Span(name, kind, uuid.uuid4().hex, None, session_id, attributes)
+    return NO_SPAN
+
+
+# Run a block in a span
+@contextmanager
+def span(name, kind="stage", session_id=None, parent=None, **attributes):
+    """ Runs the block in a span, an exception is recorded on the span and raised again. """
+    current = start_span(name, kind, session_id, parent, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    else:
+        current.end()
+
+
+# Trace a function as a pipeline stage
+def traced(name=None, kind="stage"):
+    """ Decorator which runs every call of the function in a span named after the function. """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name or function.__name__, kind):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Context of the current span for other processes
+def trace_context():
+    """ Returns the trace context of the current span as a dictionary to store in a task, or None outside of a trace. """
+    current = _current.get()
+    if current is None or current._ended:
+        return None
+    return {"trace_id": current.trace_id, "span_id": current.span_id, "session_id": current.session_id}
+
+
+class TracingCommandListener(monitoring.CommandListener):
+    """ Records a span for every MongoDB command issued inside a trace. """
+
+    def __init__(self):
+        # (connection, request id) -> (parent context, start time) of the running commands
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        parent = trace_context()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._running[(event.connection_id, event.request_id)] = (
+                parent, datetime.now(timezone.utc), collection if isinstance(collection, str) else None
+            )
+
+    def _finish(self, event, error=None):
+        with self._lock:
+            running = self._running.pop((event.connection_id, event.request_id), None)
+        if running is None:
+            return
+        parent, start, collection = running
+        get_exporter().export({
+            "trace_id": parent["trace_id"],
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"],
+            "session_id": parent["session_id"],
+            "name": f"{event.command_name} {collection}" if collection else event.command_name,
+            "kind": "db",
+            "start": start,
+            "duration_seconds": round(event.duration_micros / 1e6, 6),
+            "attributes": {"command": event.command_name, "collection": collection},
+            "error": error,
+        })
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, error=str(event.failure))
+
+
+class SpanExporter:
+    """ Buffers the finished spans of the process and writes them in batches. """
+
+    def __init__(self):
+        self.collection = None
+        self.path = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def configure(self, db=None, path=None):
+        """ Starts writing the spans to the file if a path is given, to the database otherwise. The first call wins. """
+        with self._lock:
+            if self._thread is not None:
+                return
+            if path:
+                self.path = path
+            elif db is not None:
+                self.collection = db[TRACES_COLLECTION]
+            else:
+                return
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def export(self, entry):
+        """ Adds a finished span, it is written by the background thread. """
+        with self._lock:
+            if self._thread is None:
+                return
+            self._pending.append(entry)
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._wakeup.set()
+
+    def flush(self):
+        """ Writes the pending spans. """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    for entry in pending:
+                        file.write(json.dumps(entry, default=str) + "\n")
+            else:
+                self.collection.insert_many(pending, ordered=False)
+        except (OSError, PyMongoError) as e:
+            logging.warning(f"Writing {len(pending)} trace spans failed: {e}")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+
+# The process-wide exporter
+_exporter = SpanExporter()
+
+
+def get_exporter():
+    """ Returns the process-wide span exporter. """
+    return _exporter
+
+
+def configure_tracing(db):
+    """ Writes the spans of this process to TRACE_FILE if it is set, to the traces collection otherwise. """
+    if TRACING_ENABLED:
+        _exporter.configure(db, TRACE_FILE)
+
+
+# Read the spans from the file
+def _read_trace_file(match):
+    spans = []
+    try:
+        with open(TRACE_FILE, encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                if match(entry):
+                    entry["start"] = datetime.fromisoformat(entry["start"])
+                    spans.append(entry)
+    except FileNotFoundError:
+        pass
+    return spans
+
+
+# Root spans of a session
+def fetch_traces(db, session_id, limit=50):
+    """ Returns the root spans (reruns, batch documents, tasks) of the session, the newest first. """
+    if TRACE_FILE:
+        roots = _read_trace_file(lambda entry: entry["session_id"] == session_id and entry["parent_id"] is None)
+        return sorted(roots, key=lambda entry: entry["start"], reverse=True)[:limit]
+    return list(
+        db[TRACES_COLLECTION]
+        .find({"session_id": session_id, "parent_id": None}, {"_id": 0})
+        .sort("start", DESCENDING)
+        .limit(limit)
+    )
+
+
+# All spans of a trace
+def fetch_spans(db, trace_id):
+    """ Returns the spans of the trace ordered by their start time. """
+    if TRACE_FILE:
+        spans = _read_trace_file(lambda entry: entry["trace_id"] == trace_id)
+    else:
+        spans = list(db[TRACES_COLLECTION].find({"trace_id": trace_id}, {"_id": 0}))
+    return sorted(spans, key=lambda entry: entry["start"])
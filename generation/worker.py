@@ -0,0 +1,216 @@
+"""
+This script runs a background worker which drains the durable task queue (task_queue.py).
+It handles scenario generation, per-scenario test case generation and judging, and saves the results into the
+session documents like the Streamlit app does. Start as many workers as needed on any node:
+
+    python worker.py --types generate_scenarios generate_test_cases run_judge
+
+Smart selection tasks are handled by selection/selection_worker.py.
+"""
+
+import argparse
+import logging
+
+from database import get_db, prepare_database, update_scenario_in_db, fetch_model_output_from_db
+from run_model import run_model_on_prompt, save_model_output_to_db
+from sharded_generation import generate_sharded_scenarios
+from test_case_run import (
+    start_test_case_run, fetch_test_case_run, open_scenarios, generate_scenario_test_cases, checkpoint_test_case,
+    claim_test_case_run, finish_test_case_run, FAILED
+)
+from run_judge import run_judge_on_prompt, run_judge_by_requirement
+from duplicate_index import index_test_cases
+from task_queue import enqueue, run_worker, lease_lost_event, DEFAULT_VISIBILITY_TIMEOUT, QUEUE_COLLECTION, QUEUED, LEASED
+from llm_client import llm_context
+from llm_scheduler import BATCH
+from metrics import start_metrics_server
+
+# Task types handled by this worker
+GENERATE_SCENARIOS = "generate_scenarios"
+GENERATE_TEST_CASES = "generate_test_cases"
+RUN_JUDGE = "run_judge"
+
+
+# Enqueue the test case generation of every scenario
+def enqueue_test_case_generation(db, session_id, process_title, test_scenarios, model, test_case_main_prompt, selected_test_case_prompts, priority=0):
+    """
+    Starts a test case run with a pending entry per scenario and enqueues one task per pending scenario.
+    Stored test cases whose input hash did not change are kept and not enqueued again.
+    Every task writes its own TestCases entry, so the results of the finished scenarios are visible immediately.
+    Returns the task ids.
+    """
+    start_test_case_run(
+        db, session_id, test_scenarios, model, test_case_main_prompt, selected_test_case_prompts, background=True
+    )
+    task_ids = enqueue_open_scenarios(db, session_id, process_title, priority=priority)
+    if not task_ids:
+        # Every scenario was reused, no task finishes the run
+        settle_background_run(db, session_id, fetch_test_case_run(db, session_id)[0]["run_id"])
+    return task_ids
+
+
+# Enqueue the open scenarios of the current run
+def enqueue_open_scenarios(db, session_id, process_title, priority=0):
+    """ Enqueues one task per pending or failed scenario of the current run of the session and returns the task ids. """
+    run, test_scenarios, test_case_groups = fetch_test_case_run(db, session_id)
+    return [
+        enqueue(db, GENERATE_TEST_CASES, {
+            "session_id": session_id,
+            "process_title": process_title,
+            "run_id": run["run_id"],
+            "index": index,
+            "scenario": test_scenarios[index],
+            "model": run["model"],
+            "test_case_main_prompt": run["test_case_main_prompt"],
+            "selected_test_case_prompts": run["selected_test_case_prompts"],
+        }, priority=priority)
+        for index in open_scenarios(test_case_groups)
+    ]
+
+
+# Resume a background run
+def resume_background_run(db, session_id, process_title, run_id, priority=0):
+    """
+    Claims the run and enqueues its pending and failed scenarios again, e.g. after their tasks were dead-lettered.
+    Queued retries of the previous run id are dropped by their checkpoint. Returns the task ids, or None if the run is still
+    running or was replaced.
+    """
+    if claim_test_case_run(db, session_id, run_id, background=True) is None:
+        return None
+    return enqueue_open_scenarios(db, session_id, process_title, priority=priority)
+
+
+# Finish a background run when its last task is over
+def settle_background_run(db, session_id, run_id, running_index=None):
+    """
+    Finishes the run (see finish_test_case_run) if none of its tasks is queued or leased anymore.
+    running_index is the scenario of the calling task, which is still leased. Returns the new status, or None.
+    """
+    query = {"type": GENERATE_TEST_CASES, "payload.run_id": run_id, "status": {"$in": [QUEUED, LEASED]}}
+    if running_index is not None:
+        query["payload.index"] = {"$ne": running_index}
+    if db[QUEUE_COLLECTION].count_documents(query, limit=1):
+        return None
+    return finish_test_case_run(db, session_id, run_id)
+
+
+# Generate the test scenarios of a session
+def handle_generate_scenarios(db, payload):
+    """
+    Runs the model on the generated prompt and saves the scenarios.
+    With a sharded entry the scenarios of every document section are generated concurrently and merged instead.
+    With a test_cases entry in the payload the test case generation of every scenario is enqueued afterwards.
+    """
+    if payload.get("sharded"):
+        model_output, shard_summary = generate_sharded_scenarios(payload["model"], **payload["sharded"])
+        logging.info(f"Sharded scenario generation: {shard_summary}")
+        if not model_output["TestScenarios"]:
+            model_output = None
+    else:
+        model_output = run_model_on_prompt(payload["model"], payload["prompt"])
+    if not model_output:
+        # Raising lets the queue retry the task and dead-letter it after the last attempt
+        raise RuntimeError("Model output validation failed.")
+    test_scenarios = model_output["TestScenarios"]
+
+    test_cases = payload.get("test_cases")
+    if test_cases:
+        task_ids = enqueue_test_case_generation(
+            db, payload["session_id"], payload.get("process_title"), test_scenarios, test_cases["model"],
+            test_cases["test_case_main_prompt"], test_cases["selected_test_case_prompts"]
+        )
+    else:
+        save_model_output_to_db(payload["session_id"], {"TestScenarios": test_scenarios}, db)
+        task_ids = []
+    return {"scenario_count": len(test_scenarios), "test_case_tasks": task_ids}
+
+
+# Generate the test cases of a single scenario
+def handle_generate_test_cases(db, payload):
+    """
+    Generates the test cases of one scenario and writes them into its TestCases entry.
+    A failed scenario is written as failed and raised so the queue retries it. Tasks of a run which was replaced by a
+    newer or resumed run of the session are dropped.
+    """
+    test_case_data = generate_scenario_test_cases(payload["scenario"], payload)
+    if not checkpoint_test_case(db, payload["session_id"], payload.get("run_id"), payload["index"], test_case_data):
+        return {"scenario_id": test_case_data["scenario_id"], "superseded": True}
+    if test_case_data["status"] == FAILED:
+        # Raising lets the queue retry the task and dead-letter it after the last attempt
+        raise RuntimeError(test_case_data["error"])
+    indexed = index_test_cases(db, payload["session_id"], payload.get("process_title"), [test_case_data])
+    # The last task finishes the run, a dead-lettered last task is finished when the app shows the run
+    settle_background_run(db, payload["session_id"], payload.get("run_id"), running_index=payload["index"])
+    return {"scenario_id": test_case_data["scenario_id"], "indexed": indexed}
+
+
+# Run the judge on a test type of a session
+def handle_run_judge(db, payload):
+    """
+    Runs the judge and saves its output into the test type of the session.
+    Payloads with judge_elements are evaluated per judge element and scenario, the scenarios are taken from the payload or
+    the model output of the session. Cached verdicts of unchanged scenarios and judge elements are reused.
+    Payloads with a judge_combined_prompt use the single combined judge call.
+    """
+    if "judge_elements" in payload:
+        scenarios = payload.get("scenarios")
+        if scenarios is None:
+            scenarios = (fetch_model_output_from_db(payload["session_id"]) or {}).get("TestScenarios", [])
+        judge_output = run_judge_by_requirement(
+            payload["judge_elements"], scenarios, payload["uploaded_file"], model=payload.get("model", "llama3.2"), db=db
+        )
+        if not judge_output["Controls"] and judge_output["Errors"]:
+            raise RuntimeError(f"All {len(judge_output['Errors'])} judge evaluations failed: {judge_output['Errors'][0]['Error']}")
+    else:
+        judge_output = run_judge_on_prompt(payload["judge_combined_prompt"], payload["uploaded_file"])
+        if not isinstance(judge_output, dict):
+            raise RuntimeError(str(judge_output))
+    update_scenario_in_db(payload["test_name"], {"judge_output": judge_output}, session_id=payload["session_id"])
+    return {
+        "controls": len(judge_output.get("Controls", [])),
+        "errors": len(judge_output.get("Errors", [])),
+        "skipped": judge_output.get("Summary", {}).get("skipped", 0),
+    }
+
+
+# Run a handler with batch priority
+def as_batch(handler):
+    """
+    Wraps a handler so its LLM calls are queued as batch calls of the task's session.
+    The calls are cancelled once the lease of the task is lost, so the handler stops instead of duplicating the work of
+    the worker which leased the task next.
+    """
+    def run(db, payload):
+        owner = payload.get("session_id") or payload.get("process_title") or "worker"
+        with llm_context(owner, BATCH, cancelled=lease_lost_event()):
+            return handler(db, payload)
+    return run
+
+
+# Handlers per task type
+HANDLERS = {
+    GENERATE_SCENARIOS: handle_generate_scenarios,
+    GENERATE_TEST_CASES: handle_generate_test_cases,
+    RUN_JUDGE: handle_run_judge,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a background worker for the generation task queue.")
+    parser.add_argument("--types", nargs="+", choices=sorted(HANDLERS), default=sorted(HANDLERS), help="Task types handled by this worker.")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+    parser.add_argument("--visibility-timeout", type=int, default=DEFAULT_VISIBILITY_TIMEOUT, help="Seconds before a leased task is handed to another worker.")
+    parser.add_argument("--max-tasks", type=int, help="Stop after this many tasks.")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port, disabled if 0.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start_metrics_server(args.metrics_port)
+    # The indexes of the task queue are in place before the first task is leased
+    prepare_database().join()
+    handlers = {task_type: as_batch(HANDLERS[task_type]) for task_type in args.types}
+    run_worker(get_db(), handlers, poll_interval=args.poll_interval, visibility_timeout=args.visibility_timeout, max_tasks=args.max_tasks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Smart Selection için blocking (bloklama) stratejileri.
+Her test case bir veya daha fazla bloğa atanır ve sadece aynı bloğu paylaşan
+case'ler LLM ile karşılaştırılır. İsteğe bağlı ucuz bir bloklar arası tarama,
+farklı bloklardaki birebir aynı başlık veya açıklamaya sahip case'leri de aday yapar.
+"""
+
+import math
+import re
+
+# Desteklenen stratejiler
+BLOCKING_STRATEGIES = ("none", "scenario", "category", "keyword", "embedding")
+
+# Anahtar kelime bloklamasında dikkate alınmayan kelimeler
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or",
+    "that", "the", "this", "to", "with", "test", "tests", "testing", "case", "verify", "ensure", "check",
+    "should", "when", "user", "users", "system",
+}
+
+
+def _get(case, field):
+    return case.get(field) if isinstance(case, dict) else getattr(case, field, None)
+
+
+def _normalize(text):
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def keywords(case, min_length=4):
+    """
+    Case başlığındaki anlamlı anahtar kelimeleri döndürür.
+    """
+    return {
+        word for word in re.findall(r"\w+", (_get(case, "Title") or "").lower())
+        if len(word) >= min_length and word not in STOPWORDS
+    }
+
+
+def _cosine(first, second):
+    dot = sum(a * b for a, b in zip(first, second))
+    norm = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+    return dot / norm if norm else 0.0
+
+
+def embedding_blocks(vectors, threshold=0.8):
+    """
+    Lider (leader) kümeleme: her vektör benzerliği eşiği geçen tüm liderlerin bloğuna girer,
+    hiçbirine yakın değilse yeni bir lider olur. Bloklar örtüşebilir.
+    """
+    leaders = []
+    blocks = []
+    for index, vector in enumerate(vectors):
+        matched = {f"embedding:{leader}" for leader in leaders if _cosine(vector, vectors[leader]) >= threshold}
+        if not matched:
+            leaders.append(index)
+            matched = {f"embedding:{index}"}
+        blocks.append(matched)
+    return blocks
+
+
+class Blocking:
+    """
+    Case indekslerinin blok anahtarlarını ve bloklar arası taramada bulunan aday çiftleri tutar.
+    """
+
+    def __init__(self, strategy, case_blocks, sweep_pairs=None):
+        self.strategy = strategy
+        self.case_blocks = case_blocks
+        self.sweep_pairs = sweep_pairs or set()
+
+    def blocks_of(self, index):
+        """
+        Case'in blok anahtarlarını döndürür.
+        """
+        return self.case_blocks[index]
+
+    def is_candidate(self, first, second):
+        """
+        İki case'in LLM ile karşılaştırılması gerekip gerekmediğini döndürür.
+        """
+        if self.case_blocks[first] & self.case_blocks[second]:
+            return True
+        return (min(first, second), max(first, second)) in self.sweep_pairs
+
+    def candidate_pair_count(self):
+        """
+        En az bir bloğu paylaşan veya taramada bulunan farklı çiftlerin sayısı.
+        """
+        members = {}
+        for index, blocks in enumerate(self.case_blocks):
+            for block in blocks:
+                members.setdefault(block, []).append(index)
+        if all(len(blocks) == 1 for blocks in self.case_blocks):
+            # Bloklar örtüşmüyorsa çiftleri tek tek saymaya gerek yok
+            return sum(len(indices) * (len(indices) - 1) // 2 for indices in members.values()) + len(self.sweep_pairs)
+        pairs = set(self.sweep_pairs)
+        for indices in members.values():
+            for position, first in enumerate(indices):
+                for second in indices[position + 1:]:
+                    pairs.add((first, second))
+        return len(pairs)
+
+    def summary(self):
+        """
+        Tüm ikili karşılaştırmalara göre aday çift azalmasını raporlar.
+        """
+        count = len(self.case_blocks)
+        total_pairs = count * (count - 1) // 2
+        candidate_pairs = self.candidate_pair_count()
+        return {
+            "strategy": self.strategy,
+            "total_pairs": total_pairs,
+            "candidate_pairs": candidate_pairs,
+            "sweep_pairs": len(self.sweep_pairs),
+            "reduction": round(1 - candidate_pairs / total_pairs, 4) if total_pairs else 0.0,
+        }
+
+
+def cross_block_sweep(cases, case_blocks):
+    """
+    Ucuz bloklar arası tarama: normalleştirilmiş başlığı veya açıklaması birebir aynı olan
+    ama ortak bloğu olmayan case çiftlerini döndürür (hash ile gruplama, O(n)).
+    """
+    groups = {}
+    for index, case in enumerate(cases):
+        for field in ("Title", "Description"):
+            text = _normalize(_get(case, field))
+            if text:
+                groups.setdefault((field, text), []).append(index)
+
+    pairs = set()
+    for indices in groups.values():
+        for position, first in enumerate(indices):
+            for second in indices[position + 1:]:
+                if not case_blocks[first] & case_blocks[second]:
+                    pairs.add((first, second))
+    return pairs
+
+
+def build_blocking(cases, strategy="scenario", cross_block=False, embed=None, embedding_threshold=0.8, max_keyword_share=0.5):
+    """
+    Verilen stratejiye göre Blocking nesnesi oluşturur.
+
+    - none: tüm case'ler tek blokta (tüm ikili karşılaştırmalar)
+    - scenario: aynı ScenarioID
+    - category: aynı Category
+    - keyword: başlıkta ortak anahtar kelime; case'lerin max_keyword_share oranından fazlasında geçen kelimeler yok sayılır
+    - embedding: embed(texts) -> vektörler fonksiyonu ile lider kümeleme
+    """
+    if strategy not in BLOCKING_STRATEGIES:
+        raise ValueError(f"Unknown blocking strategy: {strategy}")
+
+    if strategy == "none":
+        case_blocks = [{"all"} for _ in cases]
+    elif strategy == "scenario":
+        case_blocks = [{f"scenario:{_get(case, 'ScenarioID')}"} for case in cases]
+    elif strategy == "category":
+        case_blocks = [{f"category:{_get(case, 'Category') or 'Unknown'}"} for case in cases]
+    elif strategy == "keyword":
+        case_keywords = [keywords(case) for case in cases]
+        frequency = {}
+        for words in case_keywords:
+            for word in words:
+                frequency[word] = frequency.get(word, 0) + 1
+        limit = max(2, int(len(cases) * max_keyword_share))
+        case_blocks = [
+            {f"keyword:{word}" for word in words if frequency[word] <= limit} or {f"single:{index}"}
+            for index, words in enumerate(case_keywords)
+        ]
+    else:
+        if embed is None:
+            raise ValueError("The embedding strategy requires an embed function.")
+        texts = [
+            " ".join(filter(None, [_get(case, "Title"), _get(case, "Description"), _get(case, "Objective")]))
+            for case in cases
+        ]
+        case_blocks = embedding_blocks(embed(texts), threshold=embedding_threshold) if texts else []
+
+    sweep_pairs = cross_block_sweep(cases, case_blocks) if cross_block and strategy != "none" else set()
+    return Blocking(strategy, case_blocks, sweep_pairs)
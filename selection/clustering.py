@@ -0,0 +1,109 @@
+"""
+Kümeleme tabanlı tekilleştirme (dedup) için yardımcılar:
+union-find veri yapısı, küme temsilcisi seçim kuralları, birebir aynı içerik anahtarı ve kümelerin
+LLM'e sorulma sırasını belirleyen ucuz kelime benzerliği.
+"""
+
+import re
+
+
+class UnionFind:
+    """
+    Yol sıkıştırmalı ve boyuta göre birleştirmeli union-find.
+    Benzer bulunan test case'ler aynı kümede toplanır, böylece A≈B ve B≈C ise A, B ve C aynı kümeye düşer.
+    """
+
+    def __init__(self, count):
+        self.parent = list(range(count))
+        self.size = [1] * count
+
+    def find(self, item):
+        """
+        Elemanın küme kökünü döndürür.
+        """
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Yol sıkıştırma
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        """
+        İki elemanın kümelerini birleştirir ve yeni kökü döndürür.
+        """
+        first_root, second_root = self.find(first), self.find(second)
+        if first_root == second_root:
+            return first_root
+        if self.size[first_root] < self.size[second_root]:
+            first_root, second_root = second_root, first_root
+        self.parent[second_root] = first_root
+        self.size[first_root] += self.size[second_root]
+        return first_root
+
+    def clusters(self):
+        """
+        Kökleri ilk elemanın sırasına göre, üyeleri giriş sırasıyla döndürür: {kök: [indeksler]}.
+        """
+        groups = {}
+        for item in range(len(self.parent)):
+            groups.setdefault(self.find(item), []).append(item)
+        return groups
+
+
+def _text_length(value):
+    return len(value or "")
+
+
+def _get(case, field):
+    return case.get(field) if isinstance(case, dict) else getattr(case, field, None)
+
+
+def content_key(case):
+    """
+    Title, Description ve Objective'in büyük/küçük harf ve noktalama farkı gözetmeyen anahtarı.
+    Anahtarı aynı olan iki case LLM'e sorulmadan aynı kabul edilir.
+    """
+    return tuple(
+        " ".join(re.findall(r"\w+", (_get(case, field) or "").lower()))
+        for field in ("Title", "Description", "Objective")
+    )
+
+
+def token_set(case):
+    """
+    Title, Description ve Objective'deki kelimelerin küçük harfli kümesi.
+    """
+    return frozenset(
+        word for field in ("Title", "Description", "Objective") for word in re.findall(r"\w+", (_get(case, field) or "").lower())
+    )
+
+
+def jaccard(first, second):
+    """
+    İki kelime kümesinin Jaccard benzerliği, iki küme de boşsa 0.
+    """
+    union = len(first | second)
+    return len(first & second) / union if union else 0.0
+
+
+# Küme temsilcisi seçim kuralları: (indeks, case) -> sıralama anahtarı, en büyük anahtar temsilci olur
+REPRESENTATIVE_RULES = {
+    "first": lambda index, case: -index,
+    "longest_description": lambda index, case: (_text_length(_get(case, "Description")), -index),
+    "longest_text": lambda index, case: (
+        _text_length(_get(case, "Title")) + _text_length(_get(case, "Description")) + _text_length(_get(case, "Objective")),
+        -index,
+    ),
+}
+
+
+def pick_representative(members, cases, rule="longest_description"):
+    """
+    Küme üyeleri arasından verilen kurala göre temsilcinin indeksini döndürür.
+    """
+    if rule not in REPRESENTATIVE_RULES:
+        raise ValueError(f"Unknown representative rule: {rule}")
+    key = REPRESENTATIVE_RULES[rule]
+    return max(members, key=lambda index: key(index, cases[index]))
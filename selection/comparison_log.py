@@ -0,0 +1,81 @@
+"""
+Smart Selection karşılaştırma logları için dizi tabanlı (array-backed) kompakt saklama.
+Her karşılaştırma için sözlük oluşturmak yerine paralel diziler tutulur,
+mevcut sözlük formatı sadece dışa aktarımda (to_dicts) üretilir.
+"""
+
+import time
+from array import array
+from datetime import datetime
+
+# Kararın kaynağı, dizide indeks olarak saklanır
+DECISION_SOURCES = ("llm", "llm_error")
+
+
+def case_ref(case):
+    """
+    Test case'i log kayıtlarında gömmek yerine kimlikleriyle referans verir.
+    TestCase nesnesi veya model_dump() sözlüğü kabul eder.
+    """
+    if isinstance(case, dict):
+        return {"ScenarioID": case.get("ScenarioID"), "TestCaseID": case.get("TestCaseID")}
+    return {"ScenarioID": case.ScenarioID, "TestCaseID": case.TestCaseID}
+
+
+class ComparisonLog:
+    """
+    Karşılaştırma loglarını paralel dizilerde saklar:
+    test case indeksleri, karar (is_same), gecikme, zaman damgası ve karar kaynağı.
+    Test case'ler indeks ile referans verildiği için `cases` listesi log ile birlikte tutulur.
+    """
+
+    def __init__(self, cases):
+        self.cases = cases
+        self.case1 = array("i")
+        self.case2 = array("i")
+        self.verdicts = array("b")
+        self.latencies = array("d")
+        self.timestamps = array("d")
+        self.sources = array("B")
+
+    def __len__(self):
+        return len(self.verdicts)
+
+    def append(self, case1_index, case2_index, is_same, latency=0.0, source="llm", timestamp=None):
+        """
+        Bir karşılaştırma sonucunu loga ekler.
+        """
+        self.case1.append(case1_index)
+        self.case2.append(case2_index)
+        self.verdicts.append(1 if is_same else 0)
+        self.latencies.append(latency)
+        self.timestamps.append(time.time() if timestamp is None else timestamp)
+        self.sources.append(DECISION_SOURCES.index(source))
+
+    def to_dicts(self, start=0, end=None):
+        """
+        [start, end) aralığındaki kayıtları mevcut log sözlüğü formatına dönüştürür.
+        Step alanı 1'den başlar.
+        """
+        end = len(self) if end is None else end
+        return [
+            {
+                "Step": i + 1,
+                "Timestamp": datetime.fromtimestamp(self.timestamps[i]).isoformat(),
+                "Case1": case_ref(self.cases[self.case1[i]]),
+                "Case2": case_ref(self.cases[self.case2[i]]),
+                "is_same": bool(self.verdicts[i]),
+                "LatencyMs": round(self.latencies[i] * 1000, 3),
+                "DecisionSource": DECISION_SOURCES[self.sources[i]],
+            }
+            for i in range(start, end)
+        ]
+
+    def comparison_count(self, source=None):
+        """
+        Toplam (veya verilen kaynaktan gelen) karşılaştırma sayısını döndürür.
+        """
+        if source is None:
+            return len(self)
+        code = DECISION_SOURCES.index(source)
+        return sum(1 for s in self.sources if s == code)
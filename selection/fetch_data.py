@@ -1,11 +1,12 @@
 import streamlit as st
-from pymongo import MongoClient
-import os
 
-# MongoDB bağlantısı
-MONGO_URI = os.getenv("MONGO_URI")  # Ortam değişkeninden URI al
-client = MongoClient(MONGO_URI)
-db = client["modular_test_scenario_gen"]
+# Paylaşılan modüller generation/ klasöründedir, uygulama PYTHONPATH=../generation ile çalıştırılır (README)
+from database import prepare_database
+from mongo_client import get_client, DATABASE_NAME
+
+# MongoDB bağlantısı, süreç genelinde paylaşılan istemci (mongo_client.py)
+client = get_client()
+db = client[DATABASE_NAME]
 collection = db["sessions"]
 
 def fetch_valid_combinations():
@@ -14,8 +15,9 @@ def fetch_valid_combinations():
     Null değerleri filtreler, ancak boş string değerleri kabul eder.
     """
     data = collection.find(
-        {}, 
-        {"process_title": 1, "selected_category": 1, "selected_test_type": 1}
+        # Null filtresi sorguda yapılır, böylece bileşik indeks kullanılabilir
+        {"process_title": {"$ne": None}, "selected_category": {"$ne": None}, "selected_test_type": {"$ne": None}},
+        {"_id": 0, "process_title": 1, "selected_category": 1, "selected_test_type": 1}
     )
     combinations = [
         {
@@ -54,6 +56,9 @@ st.title("Filtered Process Titles, Categories, and Types Viewer")
 if "selected_test_cases" not in st.session_state:
     st.session_state.selected_test_cases = {}
 
+# İndeksleri oluştur, süreç başına bir kez arka planda çalışır
+prepare_database()
+
 # Veritabanındaki geçerli kombinasyonları getir
 combinations = fetch_valid_combinations()
 
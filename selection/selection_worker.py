@@ -0,0 +1,54 @@
+"""
+Smart Selection görevlerini kalıcı görev kuyruğundan (generation/task_queue.py) alıp çalıştıran arka plan worker'ı.
+Arayüzde "Run in background worker" seçildiğinde görevler kuyruğa eklenir; istenilen sayıda worker çalıştırılabilir:
+
+    python selection_worker.py
+"""
+
+import argparse
+import logging
+
+from smart_selection import (
+    db, TestCase, run_smart_selection, save_smart_selection_results, SMART_SELECTION_TASK
+)
+from database import prepare_database
+from task_queue import run_worker, DEFAULT_VISIBILITY_TIMEOUT
+from worker import as_batch
+from metrics import start_metrics_server
+
+
+def handle_smart_selection(db, payload):
+    """
+    Kuyruktaki test case'ler üzerinde Smart Selection'ı çalıştırır ve özeti session dokümanına kaydeder.
+    """
+    valid_data = [TestCase(**case) for case in payload["cases"]]
+    run_id, _, _, summary = run_smart_selection(
+        valid_data, payload.get("representative_rule"),
+        payload.get("blocking_strategy", "none"), payload.get("cross_block_sweep", False)
+    )
+    save_smart_selection_results(
+        payload["process_title"], payload["selected_category"], payload["selected_test_type"], summary
+    )
+    return {"run_id": run_id, "unique_count": summary["unique_count"], "similar_count": summary["similar_count"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Selection görev kuyruğu için arka plan worker'ı.")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Kuyruk boşken beklenecek saniye.")
+    parser.add_argument("--visibility-timeout", type=int, default=DEFAULT_VISIBILITY_TIMEOUT, help="Kiralanan görevin başka worker'a verilmesine kadar geçen saniye.")
+    parser.add_argument("--max-tasks", type=int, help="Bu kadar görevden sonra dur.")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Prometheus metriklerinin sunulacağı port, 0 ise kapalı.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start_metrics_server(args.metrics_port)
+    # Görev kuyruğunun indeksleri ilk görev alınmadan önce hazır olur
+    prepare_database().join()
+    run_worker(
+        db, {SMART_SELECTION_TASK: as_batch(handle_smart_selection)},
+        poll_interval=args.poll_interval, visibility_timeout=args.visibility_timeout, max_tasks=args.max_tasks
+    )
+
+
+if __name__ == "__main__":
+    main()
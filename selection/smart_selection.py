@@ -1,22 +1,46 @@
 import streamlit as st
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 import json
 from datetime import datetime
 import uuid
-from pymongo import MongoClient
 import os
-from ollama import chat
-import streamlit_mermaid as stmd
+import time
+from comparison_log import ComparisonLog, case_ref
+from clustering import UnionFind, pick_representative, content_key, token_set, jaccard, REPRESENTATIVE_RULES
+from blocking import build_blocking, Blocking, BLOCKING_STRATEGIES
+
+# Paylaşılan modüller generation/ klasöründedir, uygulama PYTHONPATH=../generation ile çalıştırılır (README)
+from database import prepare_database
+from duplicate_index import find_similar_many
+from task_queue import enqueue
+from llm_client import chat, embed, set_llm_context, scheduler_stats, endpoint_stats
+from llm_scheduler import INTERACTIVE
+from tracing import start_span, traced
+from rerun_profiler import get_rerun_profiler, render_profile
+from mongo_client import get_client, pool_stats, format_pool_stats, DATABASE_NAME
+from metrics import SELECTION_PAIRS, SELECTION_DUPLICATES, start_metrics_server
 
 ##############################
 # 1) MongoDB'den Veri Çekme #
 ##############################
 
-MONGO_URI = os.getenv("MONGO_URI")  # Ortam değişkeninden URI al
-client = MongoClient(MONGO_URI)
-db = client["modular_test_scenario_gen"]
+client = get_client()  # Süreç genelinde paylaşılan istemci (mongo_client.py), komut gecikmeleri metrik ve iz (span) olarak kaydedilir
+db = client[DATABASE_NAME]
 collection = db["sessions"]
+comparison_logs_collection = db["smart_selection_logs"]
+
+# Karşılaştırma loglarının MongoDB'ye kaç kayıtlık gruplar halinde yazılacağı
+COMPARISON_LOG_BATCH_SIZE = 500
+
+# Kuyruktaki Smart Selection görevlerinin tipi
+SMART_SELECTION_TASK = "smart_selection"
+
+# Selection servisinin metrik portu, generation uygulamasıyla çakışmaması için ayrı
+SELECTION_METRICS_PORT = int(os.getenv("SELECTION_METRICS_PORT", "9465"))
+
+# Embedding bloklaması için kullanılan Ollama modeli
+EMBEDDING_MODEL = os.getenv("SMART_SELECTION_EMBEDDING_MODEL", "nomic-embed-text")
 
 # Mevcut sonuçları kontrol et ve getir (varsa) - MongoDB'den
 def check_existing_results(process_title, selected_category, selected_test_type):
@@ -38,6 +62,7 @@ def check_existing_results(process_title, selected_category, selected_test_type)
 def save_smart_selection_results(process_title, selected_category, selected_test_type, results):
     """
     MongoDB'ye (process_title, selected_category, selected_test_type) ve smart_selection_results alanına sonuçları kaydeder.
+    Karşılaştırma logları session dokümanına yazılmaz, sadece özet sayılar ve run_id tutulur.
     """
     collection.update_one(
         {
@@ -53,14 +78,51 @@ def save_smart_selection_results(process_title, selected_category, selected_test
         upsert = True # Eğer yoksa yeni bir kayıt oluştur, varsa güncelle
     )
 
+def fetch_comparison_logs(run_id):
+    """
+    Bir Smart Selection çalıştırmasına ait karşılaştırma loglarını adım sırasıyla getirir.
+    """
+    return list(comparison_logs_collection.find({"RunID": run_id}, {"_id": 0}).sort("Step", 1))
+
+class ComparisonLogWriter:
+    """
+    ComparisonLog'a eklenen kayıtları insert_many ile toplu olarak
+    smart_selection_logs koleksiyonuna yazar. Sözlükler sadece yazılacak grup için üretilir.
+    """
+
+    def __init__(self, run_id, batch_size=COMPARISON_LOG_BATCH_SIZE):
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.written = 0
+
+    def _write(self, log, end):
+        entries = [{"RunID": self.run_id, **entry} for entry in log.to_dicts(self.written, end)]
+        comparison_logs_collection.insert_many(entries, ordered=False)
+        self.written = end
+
+    def sync(self, log):
+        """
+        Bekleyen kayıt sayısı grup boyutuna ulaştıysa veritabanına yazar.
+        """
+        if len(log) - self.written >= self.batch_size:
+            self._write(log, len(log))
+
+    def flush(self, log):
+        """
+        Bekleyen tüm log kayıtlarını veritabanına yazar.
+        """
+        if len(log) > self.written:
+            self._write(log, len(log))
+
 def fetch_valid_combinations():
     """
     MongoDB'den benzersiz (process_title, selected_category, selected_test_type) 
     kombinasyonlarını getirir. Null değerleri filtreler, ancak boş string değerleri kabul eder.
     """
     data = collection.find(
-        {}, 
-        {"process_title": 1, "selected_category": 1, "selected_test_type": 1}
+        # Null filtresi sorguda yapılır, böylece bileşik indeks kullanılabilir
+        {"process_title": {"$ne": None}, "selected_category": {"$ne": None}, "selected_test_type": {"$ne": None}},
+        {"_id": 0, "process_title": 1, "selected_category": 1, "selected_test_type": 1}
     )
     combinations = [
         {
@@ -143,39 +205,41 @@ class TestCase(BaseModel):
     Title: str
     Description: Optional[str] = None
     Objective: Optional[str] = None
+    Category: Optional[str] = None  # Sadece bloklama için, LLM'e gönderilmez
 
 class TestCaseList(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     test_cases: List[TestCase]
-    comparison_logs: List[dict] = []
+    comparison_log: Optional[ComparisonLog] = None  # Dizi tabanlı karşılaştırma logu
     duplicates: List[dict] = []  # Benzer test durumlarını saklamak için yeni bir liste
+    clusters: List[dict] = []  # Kümeleme modunda küme temsilcisi, üyeleri ve boyutu
+    greedy_comparisons: int = 0  # Kümeleme modunda aynı kararlarla greedy modun yapacağı LLM çağrısı sayısı
+
+    @property
+    def comparison_logs(self) -> List[dict]:
+        """
+        Karşılaştırma loglarını dışa aktarım için sözlük listesine dönüştürür.
+        """
+        return self.comparison_log.to_dicts() if self.comparison_log is not None else []
 
-    def smart_select(self):
+    def smart_select(self, log_writer: Optional[ComparisonLogWriter] = None, blocking: Optional[Blocking] = None):
         """
         Bu metot, test_cases listesindeki benzer (duplicate) test case'leri 
         LLM tabanlı karşılaştırma ile ayıklar, unique bir liste döndürür.
+        log_writer verilirse karşılaştırma logları çalışma sırasında toplu olarak MongoDB'ye yazılır.
+        blocking verilirse sadece aynı bloğu paylaşan case'ler karşılaştırılır.
         """
-        unique_cases = []
-        step = 1
+        unique_indices = []
+        comparison_log = ComparisonLog(self.test_cases)
 
-        for case in self.test_cases:
+        for case_index, case in enumerate(self.test_cases):
             is_duplicate = False
-            for unique_case in unique_cases:
-                try:
-                    comparison_result = self._query_llm_similarity(case, unique_case)
-                except ValueError as e:
-                    # LLM cevabı geçersiz ya da hata varsa false kabul ediyoruz
-                    st.warning(f"LLM comparison failed: {e}")
-                    comparison_result = False
-
-                self.comparison_logs.append({
-                    "Step": step,
-                    "ProcessName": str(uuid.uuid4()),
-                    "Timestamp": datetime.now().isoformat(),
-                    "Case1": case.model_dump(),
-                    "Case2": unique_case.model_dump(),
-                    "is_same": comparison_result,
-                })
-                step += 1
+            for unique_index in unique_indices:
+                if blocking is not None and not blocking.is_candidate(case_index, unique_index):
+                    continue
+                unique_case = self.test_cases[unique_index]
+                comparison_result = self._compare_and_log(case_index, unique_index, comparison_log, log_writer)
                 if comparison_result:
                     is_duplicate = True
                     # Benzer test durumlarını kaydet
@@ -186,14 +250,120 @@ class TestCaseList(BaseModel):
                     break
 
             if not is_duplicate:
-                unique_cases.append(case)
+                unique_indices.append(case_index)
+
+        if log_writer is not None:
+            log_writer.flush(comparison_log)
 
         return TestCaseList(
-            test_cases=unique_cases,
-            comparison_logs=self.comparison_logs,
+            test_cases=[self.test_cases[i] for i in unique_indices],
+            comparison_log=comparison_log,
             duplicates=self.duplicates
         )
 
+    def cluster_select(self, representative_rule: str = "longest_description", log_writer: Optional[ComparisonLogWriter] = None, blocking: Optional[Blocking] = None):
+        """
+        Kümeleme modu: her case her kümenin sadece temsilcisiyle karşılaştırılır, kümenin diğer üyeleriyle
+        karşılaştırma union-find ile birleştirilmiş küme üzerinden zaten belli olduğu için yapılmaz. Kümeler, case'e
+        kelime benzerliği (Jaccard) en yüksek temsilciden başlayarak sorulur ve ilk eşleşmede durulur; kopya case'ler
+        çoğunlukla ilk karşılaştırmada kümesini bulur. Eşleşen case kümeye eklenir, temsilci representative_rule'a
+        göre güncellenir. İçeriği (content_key) bir kümedeki case ile birebir aynı olan case LLM'e sorulmadan eklenir.
+        blocking verilirse bir case, greedy moddaki gibi sadece blok paylaştığı kümelerle karşılaştırılır.
+        greedy_comparisons, aynı kararlarla kümeleri oluşturulma sırasıyla soran greedy modun LLM çağrısı sayısıdır.
+        """
+        if representative_rule not in REPRESENTATIVE_RULES:
+            raise ValueError(f"Unknown representative rule: {representative_rule}")
+
+        cases = self.test_cases
+        union_find = UnionFind(len(cases))
+        comparison_log = ComparisonLog(cases)
+        representatives = {}  # küme kökü (ilk üye) -> temsilci indeksi, kümelerin oluşturulma sırasıyla
+        content_roots = {}  # content_key -> küme kökü
+        representative_tokens = {}  # küme kökü -> temsilcinin kelime kümesi
+        greedy_comparisons = 0
+
+        for case_index, case in enumerate(cases):
+            candidates = [root for root in representatives if blocking is None or blocking.is_candidate(root, case_index)]
+            key = content_key(case)
+            tokens = token_set(case)
+            matched = content_roots.get(key)
+            if matched is None or matched not in candidates:
+                matched = None
+                # En benzer temsilci önce, eşitlikte kümelerin oluşturulma sırası korunur (sorted kararlıdır)
+                ordered = sorted(candidates, key=lambda root: -jaccard(tokens, representative_tokens[root]))
+                for root in ordered:
+                    if self._compare_and_log(case_index, representatives[root], comparison_log, log_writer):
+                        matched = root
+                        break
+
+            if matched is None:
+                # Hiçbir kümeyle eşleşmedi, yeni küme
+                greedy_comparisons += len(candidates)
+                representatives[case_index] = case_index
+                representative_tokens[case_index] = tokens
+                content_roots.setdefault(key, case_index)
+                continue
+
+            greedy_comparisons += candidates.index(matched) + 1
+            # Küme büyük ya da eşit boyutta olduğu için kök (ilk üye) değişmez
+            union_find.union(matched, case_index)
+            representatives[matched] = pick_representative([representatives[matched], case_index], cases, representative_rule)
+            if representatives[matched] == case_index:
+                representative_tokens[matched] = tokens
+            content_roots.setdefault(key, matched)
+
+        if log_writer is not None:
+            log_writer.flush(comparison_log)
+
+        clusters = []
+        duplicates = []
+        representative_indices = []
+        for members in union_find.clusters().values():
+            representative = pick_representative(members, cases, representative_rule)
+            representative_indices.append(representative)
+            clusters.append({
+                "Representative": case_ref(cases[representative]),
+                "Members": [case_ref(cases[m]) for m in members],
+                "Size": len(members),
+            })
+            for member in members:
+                if member != representative:
+                    duplicates.append({
+                        "DuplicateCase": cases[member].model_dump(),
+                        "MatchedWith": cases[representative].model_dump()
+                    })
+
+        return TestCaseList(
+            test_cases=[cases[i] for i in sorted(representative_indices)],
+            comparison_log=comparison_log,
+            duplicates=duplicates,
+            clusters=sorted(clusters, key=lambda cluster: cluster["Size"], reverse=True),
+            greedy_comparisons=greedy_comparisons
+        )
+
+    def _compare_and_log(self, case_index, other_index, comparison_log, log_writer=None):
+        """
+        İki case'i LLM ile karşılaştırır, sonucu loga ekler ve döndürür.
+        """
+        source = "llm"
+        started = time.perf_counter()
+        try:
+            comparison_result = self._query_llm_similarity(self.test_cases[case_index], self.test_cases[other_index])
+        except ValueError as e:
+            # LLM cevabı geçersiz ya da hata varsa false kabul ediyoruz
+            st.warning(f"LLM comparison failed: {e}")
+            comparison_result = False
+            source = "llm_error"
+
+        comparison_log.append(
+            case_index, other_index, comparison_result,
+            latency=time.perf_counter() - started, source=source
+        )
+        SELECTION_PAIRS.inc(source=source)
+        if log_writer is not None:
+            log_writer.sync(comparison_log)
+        return comparison_result
+
     @staticmethod
     def _query_llm_similarity(case1: "TestCase", case2: "TestCase") -> bool:
         """
@@ -207,9 +377,11 @@ class TestCaseList(BaseModel):
         # Pop the ScenarioID and TestCaseID keys
         case1_json.pop("ScenarioID", None)
         case1_json.pop("TestCaseID", None)
+        case1_json.pop("Category", None)
 
         case2_json.pop("ScenarioID", None)
         case2_json.pop("TestCaseID", None)
+        case2_json.pop("Category", None)
 
         # Prompt text for Smart Selection using LLM
         prompt_text = f"""
@@ -262,6 +434,7 @@ Important:
         response = chat(
             messages=messages,
             model='llama3.2',  # Örnek model ismi
+            site="_query_llm_similarity",
             format={
                 "type": "object",
                 "properties": {
@@ -279,10 +452,59 @@ Important:
             raise ValueError(f"LLM response is not valid JSON: {content}")
 
 
+def embed_texts(texts):
+    """
+    Metinleri Ollama embedding modeliyle vektörlere dönüştürür (embedding bloklaması için).
+    """
+    response = embed(model=EMBEDDING_MODEL, input=texts, site="embed_texts")
+    return response["embeddings"]
+
+
 ###################################
 # 3) Streamlit Arayüz ve Mantık  #
 ###################################
 
+@traced()
+def run_smart_selection(valid_data, representative_rule=None, blocking_strategy="none", cross_block_sweep=False):
+    """
+    Smart Selection'ı çalıştırır, karşılaştırma loglarını yazar ve kaydedilecek özeti üretir.
+    Arayüz ve arka plan worker'ı (selection_worker.py) aynı fonksiyonu kullanır.
+    (run_id, sonuç TestCaseList'i, bloklama özeti, özet) döndürür.
+    """
+    run_id = str(uuid.uuid4())
+    log_writer = ComparisonLogWriter(run_id)
+    test_case_list = TestCaseList(test_cases=valid_data)
+    blocking = build_blocking(
+        valid_data, strategy=blocking_strategy, cross_block=cross_block_sweep,
+        embed=embed_texts if blocking_strategy == "embedding" else None
+    )
+    blocking_summary = blocking.summary()
+    if representative_rule is not None:
+        unique_test_cases = test_case_list.cluster_select(representative_rule=representative_rule, log_writer=log_writer, blocking=blocking)
+    else:
+        unique_test_cases = test_case_list.smart_select(log_writer=log_writer, blocking=blocking)
+
+    SELECTION_DUPLICATES.inc(len(unique_test_cases.duplicates), mode="clustering" if representative_rule is not None else "greedy")
+
+    summary = {
+        "run_id": run_id,
+        "created_at": datetime.now().isoformat(),
+        "total_cases": len(valid_data),
+        "unique_count": len(unique_test_cases.test_cases),
+        "similar_count": len(unique_test_cases.duplicates),
+        "comparison_count": log_writer.written,
+        "mode": "clustering" if representative_rule is not None else "greedy",
+        "cluster_sizes": [c["Size"] for c in unique_test_cases.clusters],
+        "greedy_comparison_count": unique_test_cases.greedy_comparisons if representative_rule is not None else log_writer.written,
+        "blocking": blocking_summary,
+        "unique_test_case_ids": [case_ref(case) for case in unique_test_cases.test_cases],
+        "similar_test_case_ids": [
+            {"DuplicateCase": case_ref(d["DuplicateCase"]), "MatchedWith": case_ref(d["MatchedWith"])}
+            for d in unique_test_cases.duplicates
+        ],
+    }
+    return run_id, unique_test_cases, blocking_summary, summary
+
 def main():
     st.set_page_config(
         page_title="Smart Selection",
@@ -291,6 +513,39 @@ def main():
 
     st.title("Fetch Data and Smart Selection")
 
+    # Prometheus metrikleri süreç başına bir kez başlatılan yan iş parçacığından sunulur
+    start_metrics_server(SELECTION_METRICS_PORT)
+
+    # Bu oturumun LLM çağrıları diğer oturumlarla adil sırayla, interaktif öncelikle çalışır
+    if "llm_owner" not in st.session_state:
+        st.session_state.llm_owner = f"selection_{uuid.uuid4().hex[:8]}"
+    set_llm_context(st.session_state.llm_owner, INTERACTIVE)
+
+    # Bu rerun bir iz (trace) olarak kaydedilir, aşamalar, LLM çağrıları ve veritabanı işlemleri alt span'leridir
+    rerun_span = start_span("rerun", kind="rerun", session_id=st.session_state.llm_owner, app="selection")
+
+    # İsteğe bağlı profil: bu rerun'ın bölümlerinin süresi ve bellek ayırmaları ölçülür
+    profiler = get_rerun_profiler("selection", st.session_state.llm_owner)
+    profiler.start_rerun()
+
+    # Süreç genelindeki LLM kuyruğunun durumu
+    llm_queue = scheduler_stats()
+    st.sidebar.caption(
+        f"LLM queue: {llm_queue['in_flight']}/{llm_queue['max_concurrency']} running, {llm_queue['queued']} waiting, "
+        f"interactive wait {llm_queue['priorities']['interactive']['avg_wait']:.1f}s avg / "
+        f"{llm_queue['priorities']['interactive']['p95_wait']:.1f}s p95"
+    )
+
+    # LLM çağrılarının dağıtıldığı Ollama sunucuları
+    endpoints = endpoint_stats()
+    st.sidebar.caption(
+        f"Ollama servers: {sum(endpoint['healthy'] for endpoint in endpoints)}/{len(endpoints)} healthy, "
+        + ", ".join(f"{endpoint['base_url']} ({endpoint['in_flight']} running)" for endpoint in endpoints)
+    )
+
+    # Süreç genelinde paylaşılan MongoDB bağlantı havuzu
+    st.sidebar.caption(format_pool_stats(pool_stats()))
+
     with st.expander("Workflow Steps", expanded=False):
         st.markdown("""
         ### 1. Fetch Valid Combinations
@@ -352,6 +607,7 @@ def main():
 #     U --> V["Provide Download Options for Results"]
 #     V --> W("End")
 # """
+#     import streamlit_mermaid as stmd
 #     stmd.st_mermaid(diagram)
 
     # Session state kontrolü
@@ -364,6 +620,9 @@ def main():
     if "fetched_test_cases" not in st.session_state:
         st.session_state.fetched_test_cases = []
 
+    # İndeksleri oluştur ve telemetri/iz yazımını başlat, süreç başına bir kez arka planda çalışır
+    prepare_database()
+
     # 1) Veritabanından geçerli kombinasyonları çek
     combinations = fetch_valid_combinations()
 
@@ -404,16 +663,21 @@ def main():
                 test_cases = details.get("model_output", {}).get("TestCases", [])
 
                 if test_cases:
+                    profiler.begin("test_case_listing")
                     st.write("### Test Cases")
 
+                    # Diğer süreçlerde zaten var olan test case'leri global indeksten işaretle
+                    flag_existing = st.checkbox(
+                        "Flag test cases that already exist in other processes",
+                        key="flag_existing_test_cases"
+                    )
+
                     # Seçilen test vaka anahtarlarını sıfırla
                     st.session_state.all_cases_keys = []
                     st.session_state.fetched_test_cases = []  # Seçimler için tüm test case'leri hafızaya alalım
 
+                    group_cases = []
                     for case_group in test_cases:
-                        scenario_id = case_group.get("scenario_id", "Unknown Scenario")
-                        st.write(f"#### Scenario: {scenario_id}")
-
                         # tcases = case_group.get("test_case", {}).get("TestCases", [])
 
                         test_case_data = case_group.get("test_case", [])
@@ -423,11 +687,23 @@ def main():
                             test_case_data = []
 
                         if isinstance(test_case_data, list):
-                            tcases = test_case_data
+                            group_cases.append(test_case_data)
                         elif isinstance(test_case_data, dict):
-                            tcases = test_case_data.get("TestCases", [])
+                            group_cases.append(test_case_data.get("TestCases", []))
                         else:
-                            tcases = []
+                            group_cases.append([])
+
+                    # Tüm test case'lerin benzerleri tek sorguyla aranır, sonuçlar (grup, sıra) ile tutulur
+                    similar_elsewhere = {}
+                    if flag_existing:
+                        listed = [(group_index, idx, c) for group_index, tcases in enumerate(group_cases) for idx, c in enumerate(tcases)]
+                        found = find_similar_many(db, [c for _, _, c in listed], exclude_process_title=process_title)
+                        similar_elsewhere = {(group_index, idx): matches for (group_index, idx, _), matches in zip(listed, found)}
+
+                    for group_index, case_group in enumerate(test_cases):
+                        scenario_id = case_group.get("scenario_id", "Unknown Scenario")
+                        st.write(f"#### Scenario: {scenario_id}")
+                        tcases = group_cases[group_index]
 
                         if tcases:
                             for idx, c in enumerate(tcases):
@@ -465,6 +741,14 @@ def main():
                                 st.write(f"- **Objective**: {objective}")
                                 st.write(f"- **Category**: {category}")
                                 st.write(f"- **Comments**: {comments}")
+                                if flag_existing:
+                                    matches = similar_elsewhere.get((group_index, idx))
+                                    if matches:
+                                        best = matches[0]
+                                        st.warning(
+                                            f"Already exists elsewhere: {best.get('process_title')} / "
+                                            f"{best['scenario_id']} / {best['test_case_id']} ({best['similarity']:.0%} similar)"
+                                        )
                                 st.write("---")
 
                                 # İleride Smart Selection'da kullanmak için dictionary olarak tutuyoruz
@@ -473,11 +757,13 @@ def main():
                                     "TestCaseID": case_id,
                                     "Title": title,
                                     "Description": description,
-                                    "Objective": objective
+                                    "Objective": objective,
+                                    "Category": category
                                 })
 
                         else:
                             st.write("No Test Cases Found for this Scenario.")
+                    profiler.end("test_case_listing", size=len(st.session_state.fetched_test_cases))
 
                     # Tümünü seç / Kaldır butonları
                     col1, col2 = st.columns(2)
@@ -522,6 +808,42 @@ def main():
     st.write("## Smart Selection")
     st.write("Smart selection process will compare the selected test cases using an LLM-based similarity check.")
 
+    # Tekilleştirme modu: ilk eşleşmede duran açgözlü mod veya union-find ile kümeleme
+    dedup_mode = st.radio(
+        "Deduplication Mode",
+        ["Greedy (first match)", "Clustering (transitive)"],
+        horizontal=True,
+        key="dedup_mode"
+    )
+    representative_rule = None
+    if dedup_mode == "Clustering (transitive)":
+        representative_rule = st.selectbox(
+            "Cluster Representative",
+            list(REPRESENTATIVE_RULES),
+            index=list(REPRESENTATIVE_RULES).index("longest_description"),
+            key="representative_rule"
+        )
+
+    # Bloklama: sadece aynı bloktaki case'ler LLM ile karşılaştırılır
+    col_blocking, col_sweep = st.columns(2)
+    with col_blocking:
+        blocking_strategy = st.selectbox(
+            "Blocking Strategy",
+            list(BLOCKING_STRATEGIES),
+            index=0,
+            key="blocking_strategy",
+            help="none: all pairs, scenario: same ScenarioID, category: same Category, keyword: shared title keyword, embedding: embedding clusters"
+        )
+    with col_sweep:
+        cross_block_sweep = st.checkbox(
+            "Cross-block sweep",
+            key="cross_block_sweep",
+            help="Also compare cases from different blocks which have an identical title or description."
+        )
+
+    # Uzun seçimler arka plan worker'ına (python selection_worker.py) gönderilebilir
+    background_selection = st.checkbox("Run in background worker", key="background_selection")
+
     if st.button("Run Smart Selection"):
         selected_cases = []
         for case_dict in st.session_state.fetched_test_cases:
@@ -540,17 +862,45 @@ def main():
                 except Exception as e:
                     st.warning(f"Skipping invalid test case: {item}. Error: {e}")
 
-            if valid_data:
-                test_case_list = TestCaseList(test_cases=valid_data)
-                unique_test_cases = test_case_list.smart_select()
+            if background_selection and valid_data:
+                # Worker (python selection_worker.py) sonuçları session dokümanına kaydeder
+                task_id = enqueue(db, SMART_SELECTION_TASK, {
+                    "process_title": process_title,
+                    "selected_category": selected_category,
+                    "selected_test_type": selected_test_type,
+                    "cases": [case.model_dump() for case in valid_data],
+                    "representative_rule": representative_rule,
+                    "blocking_strategy": blocking_strategy,
+                    "cross_block_sweep": cross_block_sweep,
+                })
+                st.success(f"Smart Selection was queued (task {task_id}). The results are saved to MongoDB when a worker finishes it.")
+            elif valid_data:
+                run_id, unique_test_cases, blocking_summary, summary = run_smart_selection(
+                    valid_data, representative_rule, blocking_strategy, cross_block_sweep
+                )
 
                 st.success("Smart Selection completed!")
-
-                results = {
-                    "unique_test_cases": [case.model_dump() for case in unique_test_cases.test_cases],
-                    "similar_test_cases": unique_test_cases.duplicates,
-                    "comparison_logs": unique_test_cases.comparison_logs,
-                }
+                profiler.begin("result_rendering", size=len(valid_data))
+                st.write(f"- **LLM Comparisons**: {len(unique_test_cases.comparison_log)}")
+                st.write(
+                    f"- **Candidate Pairs ({blocking_summary['strategy']})**: {blocking_summary['candidate_pairs']} of "
+                    f"{blocking_summary['total_pairs']} ({blocking_summary['reduction']:.1%} reduction)"
+                )
+
+                # Küme boyutları (sadece kümeleme modunda)
+                if unique_test_cases.clusters:
+                    st.write(
+                        f"- **Comparisons Saved vs Greedy**: "
+                        f"{unique_test_cases.greedy_comparisons - len(unique_test_cases.comparison_log)} of {unique_test_cases.greedy_comparisons}"
+                    )
+                    with st.expander("Clusters", expanded=False):
+                        st.table([
+                            {
+                                "Representative": f"{c['Representative']['ScenarioID']}_{c['Representative']['TestCaseID']}",
+                                "Size": c["Size"],
+                            }
+                            for c in unique_test_cases.clusters
+                        ])
                 
                 # Benzersiz test case'ler
                 with st.expander("Unique Test Cases", expanded=False):
@@ -562,20 +912,23 @@ def main():
                     with st.expander("Similar Test Cases", expanded=False):
                         st.json(unique_test_cases.duplicates)
 
-                # Karşılaştırma logları
+                # Karşılaştırma logları (dizi tabanlı logdan bir kez üretilir)
+                comparison_logs = unique_test_cases.comparison_logs
                 st.info("All comparison logs are here!", icon="ℹ️")
                 with st.expander("Comparison Logs", expanded=False):
-                    st.json(unique_test_cases.comparison_logs)
+                    st.json(comparison_logs)
 
                 # Download sonuçları
                 results = {
+                    "run_id": run_id,
                     "unique_test_cases": [case.model_dump() for case in unique_test_cases.test_cases],
                     "similar_test_cases": unique_test_cases.duplicates,
-                    "comparison_logs": unique_test_cases.comparison_logs
+                    "clusters": unique_test_cases.clusters,
+                    "comparison_logs": comparison_logs
                 }
 
-                # MongoDB'ye sonuçları kaydet
-                save_smart_selection_results(process_title, selected_category, selected_test_type, results)
+                # MongoDB'ye sonuçların özetini kaydet, loglar smart_selection_logs koleksiyonunda
+                save_smart_selection_results(process_title, selected_category, selected_test_type, summary)
                 st.success("Smart Selection results saved to MongoDB!")
 
 
@@ -614,9 +967,17 @@ def main():
                         mime="application/json"
                     ):
                         st.success("All test cases downloaded!")  # İsteğe bağlı bir başarı mesajı
+                profiler.end("result_rendering")
             else:
                 st.error("No valid TestCase objects to process.")
 
+    # Profil açıksa bu rerun'ın profilini kaydet ve göster
+    if profiler.finish_rerun(db):
+        render_profile(profiler)
+
+    # Rerun'ın izini bitir, alt span'lerde geçmeyen süre arayüzün çizilmesidir
+    rerun_span.end()
+
 
 if __name__ == "__main__":
     main()
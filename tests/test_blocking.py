@@ -0,0 +1,79 @@
+import pytest
+
+from blocking import Blocking, build_blocking, cross_block_sweep, embedding_blocks, keywords
+
+
+CASES = [
+    {"ScenarioID": "S1", "Category": "Auth", "Title": "Verify login with valid password", "Description": "Login works."},
+    {"ScenarioID": "S1", "Category": "Auth", "Title": "Login lockout after failures", "Description": "Account locks."},
+    {"ScenarioID": "S2", "Category": "Files", "Title": "Upload report file", "Description": "Login works."},
+    {"ScenarioID": "S2", "Category": None, "Title": "Export report", "Description": "Export works."},
+]
+
+
+def test_scenario_blocking_only_pairs_the_same_scenario():
+    blocking = build_blocking(CASES, strategy="scenario")
+
+    assert blocking.is_candidate(0, 1)
+    assert not blocking.is_candidate(0, 2)
+    assert blocking.candidate_pair_count() == 2
+    assert blocking.summary() == {
+        "strategy": "scenario", "total_pairs": 6, "candidate_pairs": 2, "sweep_pairs": 0, "reduction": round(1 - 2 / 6, 4)
+    }
+
+
+def test_none_blocking_pairs_everything():
+    blocking = build_blocking(CASES, strategy="none")
+
+    assert blocking.candidate_pair_count() == 6
+    assert blocking.summary()["reduction"] == 0.0
+
+
+def test_category_blocking_groups_missing_categories():
+    blocking = build_blocking(CASES, strategy="category")
+
+    assert blocking.blocks_of(3) == {"category:Unknown"}
+    assert blocking.is_candidate(0, 1)
+    assert not blocking.is_candidate(2, 3)
+
+
+def test_keywords_skip_stopwords_and_short_words():
+    assert keywords(CASES[0]) == {"login", "valid", "password"}
+
+
+def test_keyword_blocking_ignores_frequent_words():
+    blocking = build_blocking(CASES, strategy="keyword", max_keyword_share=0.5)
+
+    assert blocking.is_candidate(0, 1)  # login
+    assert blocking.is_candidate(2, 3)  # report
+    assert not blocking.is_candidate(0, 3)
+
+
+def test_cross_block_sweep_pairs_identical_texts_of_other_blocks():
+    case_blocks = [{"scenario:S1"}, {"scenario:S1"}, {"scenario:S2"}, {"scenario:S2"}]
+
+    assert cross_block_sweep(CASES, case_blocks) == {(0, 2)}
+    blocking = build_blocking(CASES, strategy="scenario", cross_block=True)
+    assert blocking.is_candidate(2, 0)
+    assert blocking.candidate_pair_count() == 3
+
+
+def test_embedding_blocks_use_leaders():
+    vectors = [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.7, 0.7]]
+
+    assert embedding_blocks(vectors, threshold=0.7) == [
+        {"embedding:0"}, {"embedding:0"}, {"embedding:2"}, {"embedding:0", "embedding:2"}
+    ]
+
+
+def test_overlapping_blocks_count_each_pair_once():
+    blocking = Blocking("embedding", [{"a", "b"}, {"a", "b"}, {"b"}])
+
+    assert blocking.candidate_pair_count() == 3
+
+
+def test_unknown_strategies_and_missing_embed_are_rejected():
+    with pytest.raises(ValueError):
+        build_blocking(CASES, strategy="title")
+    with pytest.raises(ValueError):
+        build_blocking(CASES, strategy="embedding")
@@ -0,0 +1,110 @@
+import pytest
+
+import smart_selection
+from blocking import build_blocking
+
+
+def _cases(groups, scenarios=None):
+    return [
+        smart_selection.TestCase(
+            ScenarioID=f"S{scenarios[index] if scenarios else 1}",
+            TestCaseID=f"TC{index}",
+            Title=f"Case {index} of group {group}",
+            Description="x" * (index + 1),
+        )
+        for index, group in enumerate(groups)
+    ]
+
+
+def _selection(groups, cases=None):
+    """ Returns a TestCaseList whose LLM judge answers from the groups and records every call. """
+    calls = []
+    cases = cases or _cases(groups)
+    group_of = {case.TestCaseID: group for case, group in zip(cases, groups)}
+
+    def judge(first, second):
+        calls.append((first.TestCaseID, second.TestCaseID))
+        return group_of[first.TestCaseID] == group_of[second.TestCaseID]
+
+    class JudgedTestCaseList(smart_selection.TestCaseList):
+        _query_llm_similarity = staticmethod(judge)
+
+    return JudgedTestCaseList(test_cases=cases), calls
+
+
+@pytest.mark.parametrize("groups", [
+    [0, 1, 0, 2, 1, 0, 3, 2],
+    [0, 0, 0, 0],
+    [0, 1, 2, 3],
+    [3, 2, 1, 0, 0, 1, 2, 3, 3],
+])
+def test_cluster_select_never_calls_more_than_greedy(groups):
+    greedy_list, greedy_calls = _selection(groups)
+    greedy_list.smart_select()
+    cluster_list, cluster_calls = _selection(groups)
+    result = cluster_list.cluster_select(representative_rule="first")
+
+    assert len(cluster_calls) <= len(greedy_calls)
+    assert result.greedy_comparisons == len(greedy_calls)
+    assert sorted(cluster["Size"] for cluster in result.clusters) == sorted(groups.count(g) for g in set(groups))
+
+
+def test_cluster_select_stops_at_the_first_match():
+    selection, calls = _selection([0, 1, 0])
+    selection.cluster_select(representative_rule="first")
+
+    # TC2 matches the first cluster and is not compared with the second one
+    assert calls == [("TC1", "TC0"), ("TC2", "TC0")]
+
+
+def test_cluster_select_asks_the_most_similar_cluster_first():
+    cases = [
+        smart_selection.TestCase(ScenarioID="S1", TestCaseID=f"TC{index}", Title=title, Description="")
+        for index, title in enumerate(["login with password", "export monthly report", "delete user account", "export the monthly report"])
+    ]
+    greedy_list, greedy_calls = _selection([0, 1, 2, 1], cases)
+    greedy_list.smart_select()
+    selection, calls = _selection([0, 1, 2, 1], cases)
+    result = selection.cluster_select(representative_rule="first")
+
+    # Greedy asks TC0 and TC1, the clustering mode starts with the report cluster
+    assert calls[-1:] == [("TC3", "TC1")] and len(calls) == 4
+    assert len(greedy_calls) == result.greedy_comparisons == 5
+
+
+def test_cluster_select_compares_with_the_current_representative():
+    selection, calls = _selection([0, 0, 0])
+    result = selection.cluster_select(representative_rule="longest_description")
+
+    # TC1 has the longer description and represents the cluster once it joined
+    assert calls == [("TC1", "TC0"), ("TC2", "TC1")]
+    assert result.clusters[0]["Representative"]["TestCaseID"] == "TC2"
+    assert [case.TestCaseID for case in result.test_cases] == ["TC2"]
+    assert len(result.duplicates) == 2
+
+
+def test_cluster_select_skips_the_llm_for_identical_content():
+    cases = _cases([0, 0])
+    cases[1] = cases[0].model_copy(update={"TestCaseID": "TC1", "Title": cases[0].Title.upper() + "!"})
+    selection, calls = _selection([0, 0], cases)
+    result = selection.cluster_select()
+
+    assert calls == []
+    assert result.greedy_comparisons == 1
+    assert result.clusters[0]["Size"] == 2
+
+
+def test_cluster_select_respects_blocking():
+    cases = _cases([0, 0, 1], scenarios=[1, 2, 1])
+    selection, calls = _selection([0, 0, 1], cases)
+    result = selection.cluster_select(blocking=build_blocking(cases, strategy="scenario"))
+
+    # TC1 is in another scenario, so it is never compared and stays its own cluster
+    assert calls == [("TC2", "TC0")]
+    assert len(result.clusters) == 3
+
+
+def test_cluster_select_rejects_unknown_rules():
+    selection, _ = _selection([0])
+    with pytest.raises(ValueError):
+        selection.cluster_select(representative_rule="shortest")
@@ -0,0 +1,60 @@
+from clustering import UnionFind, pick_representative, content_key
+
+
+def test_union_find_merges_transitively():
+    union_find = UnionFind(5)
+    union_find.union(0, 1)
+    union_find.union(1, 2)
+
+    assert union_find.find(0) == union_find.find(2)
+    assert union_find.find(3) != union_find.find(0)
+    assert union_find.clusters() == {union_find.find(0): [0, 1, 2], 3: [3], 4: [4]}
+
+
+def test_union_find_keeps_the_larger_root():
+    union_find = UnionFind(4)
+    union_find.union(0, 1)
+    root = union_find.union(2, 0)
+
+    assert root == union_find.find(0) == union_find.find(2)
+    assert union_find.size[root] == 3
+    # Equal sizes keep the first argument as the root
+    assert UnionFind(2).union(1, 0) == 1
+
+
+def test_union_find_same_cluster_is_a_no_op():
+    union_find = UnionFind(2)
+    root = union_find.union(0, 1)
+
+    assert union_find.union(1, 0) == root
+    assert union_find.size[root] == 2
+
+
+def test_pick_representative_rules():
+    cases = [
+        {"Title": "A long title", "Description": "short"},
+        {"Title": "B", "Description": "a much longer description"},
+        {"Title": "C", "Description": "a much longer description"},
+    ]
+
+    assert pick_representative([0, 1, 2], cases, "first") == 0
+    # Ties are broken by the earlier index
+    assert pick_representative([0, 1, 2], cases, "longest_description") == 1
+    assert pick_representative([2, 0], cases, "longest_text") == 2
+
+
+def test_pick_representative_rejects_unknown_rules():
+    try:
+        pick_representative([0], [{}], "shortest")
+    except ValueError as e:
+        assert "shortest" in str(e)
+    else:
+        raise AssertionError("ValueError expected")
+
+
+def test_content_key_ignores_case_and_punctuation():
+    first = {"Title": "Login fails!", "Description": "Wrong  password.", "Objective": None}
+    second = {"Title": "LOGIN FAILS", "Description": "wrong password", "Objective": ""}
+
+    assert content_key(first) == content_key(second)
+    assert content_key(first) != content_key({**second, "Objective": "lockout"})
@@ -0,0 +1,65 @@
+import hashlib
+
+import mongomock
+import pytest
+
+import duplicate_index
+from duplicate_index import INDEX_VERSION, band_keys, case_text, find_similar, find_similar_many, minhash_signature
+
+
+LOGIN = {"TestCaseID": "TC1", "Title": "Login with a valid password", "Description": "The user logs in with a valid password and sees the dashboard."}
+UPLOAD = {"TestCaseID": "TC1", "Title": "Upload a report file", "Description": "The user uploads a PDF report and it appears in the list."}
+OTHER = {"TestCaseID": "TC2", "Title": "Delete an archived invoice", "Description": "An archived invoice is removed permanently by an admin."}
+
+
+def _entry(scenario_id, case):
+    text = case_text(case)
+    signature = minhash_signature(text)
+    return {
+        "session_id": "old",
+        "process_title": "Old Process",
+        "scenario_id": scenario_id,
+        "test_case_id": case["TestCaseID"],
+        "title": case["Title"],
+        "fingerprint": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+        "signature": signature,
+        "bands": band_keys(signature),
+        "version": INDEX_VERSION,
+    }
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()["index_test"]
+    db[duplicate_index.INDEX_COLLECTION].insert_many([_entry("Old_1", LOGIN), _entry("Old_2", UPLOAD)])
+    return db
+
+
+def test_find_similar_many_keeps_the_order_of_the_cases(db):
+    # Both cases have the TestCaseID TC1, the results are matched by position
+    results = find_similar_many(db, [UPLOAD, OTHER, LOGIN], exclude_session_id="new")
+
+    assert [[match["scenario_id"] for match in matches] for matches in results] == [["Old_2"], [], ["Old_1"]]
+    assert results[0][0]["similarity"] == 1.0
+    assert set(results[0][0]) == {"session_id", "scenario_id", "test_case_id", "process_title", "title", "version", "similarity"}
+
+
+def test_find_similar_many_matches_find_similar(db):
+    cases = [LOGIN, UPLOAD, OTHER]
+
+    assert find_similar_many(db, cases) == [find_similar(db, case) for case in cases]
+    assert find_similar_many(db, cases, exclude_process_title="Old Process") == [[], [], []]
+    assert find_similar_many(db, []) == []
+
+
+def test_find_similar_many_uses_one_query_per_batch(db, monkeypatch):
+    queries = []
+    collection_class = type(db[duplicate_index.INDEX_COLLECTION])
+    original_find = collection_class.find
+    monkeypatch.setattr(collection_class, "find", lambda self, *args, **kwargs: queries.append(args) or original_find(self, *args, **kwargs))
+    monkeypatch.setattr(duplicate_index, "FIND_BATCH_SIZE", 2)
+
+    results = find_similar_many(db, [LOGIN, UPLOAD, OTHER])
+
+    assert len(queries) == 2
+    assert [len(matches) for matches in results] == [1, 1, 0]
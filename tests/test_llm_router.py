@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from llm_router import EndpointRouter, NoHealthyEndpoint, UNHEALTHY_COOLDOWN
+
+
+class StubRouter(EndpointRouter):
+    """ Router whose health check answers from healthy_urls instead of calling /api/ps. """
+
+    def __init__(self, base_urls, healthy_urls=None, delay=0.0):
+        super().__init__(base_urls)
+        self.healthy_urls = set(base_urls if healthy_urls is None else healthy_urls)
+        self.delay = delay
+        self.checks = []
+        # The servers start checked, the tests age them explicitly
+        for endpoint in self.endpoints:
+            endpoint.checked_at = time.monotonic()
+
+    def check(self, endpoint):
+        self.checks.append(endpoint.base_url)
+        time.sleep(self.delay)
+        with self._lock:
+            endpoint.healthy = endpoint.base_url in self.healthy_urls
+            endpoint.checked_at = time.monotonic()
+        return endpoint.healthy
+
+
+def test_calls_go_to_the_least_loaded_server():
+    router = StubRouter(["a", "b", "c"])
+
+    picked = [router.acquire("llama3.2").base_url for _ in range(3)]
+    assert sorted(picked) == ["a", "b", "c"]
+
+    router.release(router.endpoints[1], "llama3.2")
+    assert router.acquire("other").base_url == "b"
+
+
+def test_a_server_with_the_model_loaded_is_preferred_within_the_slack():
+    router = StubRouter(["a", "b"])
+    a, b = router.endpoints
+    b.loaded_models.add("llama3.2")
+    b.in_flight = 1
+
+    assert router.acquire("llama3.2:latest") is b
+    # b now has two calls more than a, more than AFFINITY_SLACK
+    assert router.acquire("llama3.2") is a
+
+
+def test_connection_errors_fail_over_to_the_next_server():
+    router = StubRouter(["a", "b"])
+    seen = []
+
+    def function(base_url):
+        seen.append(base_url)
+        if base_url == "a":
+            raise ConnectionError("refused")
+        return "ok"
+
+    router.endpoints[1].in_flight = 1  # a is picked first
+    assert router.call("llama3.2", function) == "ok"
+    assert seen == ["a", "b"]
+    a = router.endpoints[0]
+    assert not a.healthy and a.failures == 1 and a.in_flight == 0
+    assert "llama3.2" in router.endpoints[1].loaded_models
+
+
+def test_other_errors_are_raised_without_failover():
+    router = StubRouter(["a", "b"])
+
+    with pytest.raises(ValueError):
+        router.call("llama3.2", lambda base_url: (_ for _ in ()).throw(ValueError("bad prompt")))
+    assert all(endpoint.healthy and endpoint.in_flight == 0 for endpoint in router.endpoints)
+
+
+def test_all_servers_failing_raises():
+    router = StubRouter(["a", "b"])
+
+    def function(base_url):
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        router.call("llama3.2", function)
+    with pytest.raises(NoHealthyEndpoint):
+        router.acquire("llama3.2")
+
+
+def test_an_outdated_server_is_checked_once_in_the_background():
+    router = StubRouter(["a", "b"], healthy_urls=["a"], delay=0.2)
+    dead = router.endpoints[1]
+    dead.healthy = False
+    dead.checked_at -= UNHEALTHY_COOLDOWN
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=lambda: router.release(router.acquire("llama3.2"), "llama3.2")) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # No call waited for the slow check of the dead server, and only one check was started
+    assert time.perf_counter() - started < 0.15
+    time.sleep(0.3)
+    assert router.checks == ["b"]
+    assert not dead.checking
+
+
+def test_a_call_without_a_usable_server_waits_for_the_recovery_check():
+    router = StubRouter(["a", "b"], healthy_urls=["b"])
+    for endpoint in router.endpoints:
+        endpoint.healthy = False
+        endpoint.checked_at -= UNHEALTHY_COOLDOWN
+
+    assert router.acquire("llama3.2").base_url == "b"
+    assert sorted(router.checks) == ["a", "b"]
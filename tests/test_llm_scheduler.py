@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import BATCH, INTERACTIVE, SPECULATIVE, FairScheduler, SchedulerTimeout
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def _grant_order(scheduler, requests):
+    """
+    Holds the only slot, queues the requests one after another and returns the order in which they are granted.
+    Each request is (label, owner, priority).
+    """
+    order = []
+    scheduler.acquire("holder")
+    threads = []
+    for label, owner, priority in requests:
+        def run(label=label, owner=owner, priority=priority):
+            with scheduler.slot(owner, priority):
+                order.append(label)
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        queued = len(threads)
+        _wait_until(lambda: scheduler.stats()["queued"] == queued)
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_priorities_are_served_in_order():
+    order = _grant_order(FairScheduler(1), [
+        ("speculative", "a", SPECULATIVE),
+        ("batch", "a", BATCH),
+        ("interactive", "a", INTERACTIVE),
+    ])
+
+    assert order == ["interactive", "batch", "speculative"]
+
+
+def test_owners_of_a_priority_are_served_round_robin():
+    order = _grant_order(FairScheduler(1), [
+        ("a1", "a", BATCH),
+        ("a2", "a", BATCH),
+        ("a3", "a", BATCH),
+        ("b1", "b", BATCH),
+        ("c1", "c", BATCH),
+    ])
+
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_concurrency_cap_and_stats():
+    scheduler = FairScheduler(2)
+    scheduler.acquire("a")
+    scheduler.acquire("b", BATCH)
+
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 2
+    assert stats["in_flight_by_owner"] == {"a": 1, "b": 1}
+    assert stats["priorities"][BATCH]["granted"] == 1
+
+    scheduler.release("a")
+    scheduler.release("b")
+    assert scheduler.stats()["in_flight"] == 0
+    assert scheduler.stats()["in_flight_by_owner"] == {}
+
+
+def test_timeout_withdraws_the_waiting_call():
+    scheduler = FairScheduler(1)
+    scheduler.acquire("holder")
+
+    with pytest.raises(SchedulerTimeout):
+        scheduler.acquire("late", timeout=0.01)
+    assert scheduler.stats()["queued"] == 0
+    assert scheduler.stats()["waiting_by_owner"] == {}
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        FairScheduler(1).acquire("a", "urgent")
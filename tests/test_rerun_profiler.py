@@ -0,0 +1,62 @@
+import tracemalloc
+
+import pytest
+
+from rerun_profiler import RerunProfiler, growth_exponent
+
+
+@pytest.fixture(autouse=True)
+def stop_tracing():
+    yield
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _profiler(session_id, enabled=True, sites=False):
+    profiler = RerunProfiler("test", session_id)
+    profiler.enabled = enabled
+    profiler.sites = sites
+    return profiler
+
+
+def test_tracing_runs_while_a_profiled_rerun_runs():
+    first, second = _profiler("a"), _profiler("b")
+
+    first.start_rerun()
+    second.start_rerun()
+    assert tracemalloc.is_tracing()
+    first.finish_rerun()
+    assert tracemalloc.is_tracing()
+    second.finish_rerun()
+    assert not tracemalloc.is_tracing()
+
+
+def test_disabling_profiling_releases_an_interrupted_rerun():
+    profiler = _profiler("a")
+    profiler.start_rerun()
+    # The rerun was stopped before finish_rerun, the next one runs without profiling
+    profiler.enabled = False
+    profiler.start_rerun()
+
+    assert not tracemalloc.is_tracing()
+    assert profiler.finish_rerun() is None
+
+
+def test_allocation_sites_are_opt_in():
+    for sites in (False, True):
+        profiler = _profiler("a", sites=sites)
+        profiler.start_rerun()
+        profiler.begin("section", size=3)
+        data = [bytearray(1024) for _ in range(200)]
+        profiler.end("section")
+        section = profiler.finish_rerun()["sections"][0]
+
+        assert section["size"] == 3 and section["alloc_bytes"] > 0
+        assert bool(section["top_sites"]) == sites
+        del data
+
+
+def test_growth_exponent():
+    assert growth_exponent([(1, 1.0), (2, 2.0), (4, 4.0)]) == pytest.approx(1.0)
+    assert growth_exponent([(1, 1.0), (2, 4.0), (4, 16.0)]) == pytest.approx(2.0)
+    assert growth_exponent([(1, 1.0), (2, 2.0)]) is None
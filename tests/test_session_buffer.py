@@ -0,0 +1,120 @@
+import mongomock
+import pytest
+
+import session_buffer
+from session_buffer import SessionWriteBuffer
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """ Replaces the sessions collection and records the updates sent to it. """
+    collection = mongomock.MongoClient()["session_buffer_test"]["sessions"]
+    collection.insert_one({"session_id": "s1"})
+    updates = []
+    update_one = collection.update_one
+
+    def recording_update_one(filter, update, **kwargs):
+        updates.append((update, kwargs))
+        # mongomock does not support arrayFilters, those updates are only recorded
+        if "array_filters" not in kwargs:
+            return update_one(filter, update, **kwargs)
+
+    monkeypatch.setattr(collection, "update_one", recording_update_one)
+    monkeypatch.setattr(session_buffer, "get_sessions_collection", lambda: collection)
+    return collection, updates
+
+
+def test_unchanged_values_are_not_written(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+
+    assert buffer.set({"selected_category": "Auth"})
+    assert buffer.flush()
+    assert not buffer.set({"selected_category": "Auth"})
+    assert not buffer.flush()
+
+    assert len(updates) == 1
+    assert buffer.writes_issued == 1 and buffer.writes_avoided == 1
+
+
+def test_persisted_values_are_not_rewritten(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+    buffer.mark_persisted({"test_prompt": "Test the login"}, test_name="Login")
+
+    assert not buffer.set_scenario_fields("Login", {"test_prompt": "Test the login"})
+    assert not buffer.flush()
+    assert updates == []
+
+
+def test_changes_are_coalesced_into_one_update(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+
+    buffer.set({"selected_category": "Auth", "document_type": "Requirements"})
+    buffer.set({"selected_category": "Payments"})
+    buffer.set({"options": {"language": "en", "depth": 2}})
+    assert buffer.flush()
+
+    assert len(updates) == 1
+    update, kwargs = updates[0]
+    assert update == {"$set": {"selected_category": "Payments", "document_type": "Requirements", "options.language": "en", "options.depth": 2}}
+    assert kwargs == {"upsert": True}
+
+
+def test_scenario_fields_are_written_with_array_filters(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+
+    buffer.set_scenario_fields("Login", {"test_prompt": "Test the login", "elements": {"Steps": "List the steps"}})
+    buffer.set_scenario_fields("Logout", {"test_prompt": "Test the logout"})
+    buffer.set({"selected_test_type": "Login"})
+    assert buffer.flush()
+
+    update, kwargs = updates[0]
+    assert update == {"$set": {
+        "original_prompts.$[p0].test_prompt": "Test the login",
+        "original_prompts.$[p0].elements.Steps": "List the steps",
+        "original_prompts.$[p1].test_prompt": "Test the logout",
+        "selected_test_type": "Login",
+    }}
+    assert kwargs == {"array_filters": [{"p0.test_name": "Login"}, {"p1.test_name": "Logout"}]}
+
+
+def test_a_changed_key_is_written_on_its_own(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+    buffer.set({"options": {"A": "a", "B": "b"}})
+    buffer.flush()
+
+    buffer.set({"options": {"A": "a", "B": "c"}})
+    buffer.flush()
+
+    assert updates[1][0] == {"$set": {"options.B": "c"}}
+
+
+def test_removed_keys_are_removed_from_the_database(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+    buffer.set({"options": {"A": "a", "B": "b"}})
+    buffer.flush()
+
+    assert buffer.set({"options": {"A": "a"}})
+    buffer.flush()
+
+    assert updates[1][0] == {"$set": {"options": {"A": "a"}}}
+    assert collection.find_one({"session_id": "s1"})["options"] == {"A": "a"}
+    # The field is known by its leaves again
+    assert not buffer.set({"options": {"A": "a"}})
+
+
+def test_removed_keys_of_a_scenario_field_are_removed(sessions):
+    collection, updates = sessions
+    buffer = SessionWriteBuffer("s1")
+    buffer.mark_persisted({"test_case_create_prompts": {"TC1": "first", "TC1.1": "nested"}}, test_name="Login")
+
+    assert buffer.set_scenario_fields("Login", {"test_case_create_prompts": {"TC1": "first"}})
+    buffer.flush()
+
+    assert updates[0][0] == {"$set": {"original_prompts.$[p0].test_case_create_prompts": {"TC1": "first"}}}
+    assert not buffer.set_scenario_fields("Login", {"test_case_create_prompts": {"TC1": "first"}})
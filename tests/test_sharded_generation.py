@@ -0,0 +1,38 @@
+from sharded_generation import merge_near_duplicates, renumber_scenarios, split_document
+
+
+def _scenario(title):
+    return {
+        "Title": title,
+        "Description": f"The user opens the {title} page, fills in every field of the form and submits it to the server.",
+        "Objective": "Verify that the form is validated and stored.",
+    }
+
+
+def test_near_duplicates_of_other_sections_are_merged():
+    kept, merged = merge_near_duplicates([[_scenario("login")], [_scenario("login"), _scenario("export report")]])
+
+    assert merged == 1
+    assert [scenario["Title"] for scenario in kept] == ["login", "export report"]
+
+
+def test_near_duplicates_of_the_same_section_are_kept():
+    kept, merged = merge_near_duplicates([[_scenario("login"), _scenario("login")]])
+
+    assert merged == 0 and len(kept) == 2
+
+
+def test_split_document_keeps_sections_below_the_limit():
+    document = "\n\n".join(f"{number}. Requirement {number} " + "word " * 40 for number in range(1, 30))
+
+    sections = split_document(document, max_chars=1000)
+
+    assert len(sections) > 1
+    assert all(len(section) <= 1000 for section in sections)
+    assert "".join(sections).replace("\n", "").replace(" ", "") == document.replace("\n", "").replace(" ", "")
+
+
+def test_renumber_scenarios():
+    scenarios = renumber_scenarios([{"ScenarioID": "A_7"}, {"ScenarioID": "B_2"}], "Shop")
+
+    assert [scenario["ScenarioID"] for scenario in scenarios] == ["Shop_Test_Scenario_1", "Shop_Test_Scenario_2"]
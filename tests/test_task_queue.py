@@ -0,0 +1,143 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+import llm_client
+import task_queue
+import worker
+from task_queue import DEAD, DONE, LEASED, QUEUED, QUEUE_COLLECTION
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["queue_test"]
+
+
+def test_lease_serves_priority_then_insertion_order(db):
+    low = task_queue.enqueue(db, "work", {"n": 1})
+    high = task_queue.enqueue(db, "work", {"n": 2}, priority=5)
+    later = task_queue.enqueue(db, "work", {"n": 3})
+
+    assert [task_queue.lease(db, "w", ["work"])["_id"] for _ in range(3)] == [high, low, later]
+    assert task_queue.lease(db, "w", ["work"]) is None
+
+
+def test_lease_skips_other_types_and_delayed_tasks(db):
+    task_queue.enqueue(db, "other", {})
+    task_queue.enqueue(db, "work", {}, delay=60)
+
+    assert task_queue.lease(db, "w", ["work"]) is None
+
+
+def test_complete_requires_the_lease(db):
+    task_id = task_queue.enqueue(db, "work", {})
+    task_queue.lease(db, "w1", ["work"])
+
+    assert not task_queue.complete(db, task_id, "w2")
+    assert task_queue.complete(db, task_id, "w1", result={"ok": True})
+    assert db[QUEUE_COLLECTION].find_one({"_id": task_id})["status"] == DONE
+
+
+def test_expired_lease_is_handed_to_another_worker(db):
+    task_id = task_queue.enqueue(db, "work", {})
+    task_queue.lease(db, "w1", ["work"], visibility_timeout=-1)
+
+    task = task_queue.lease(db, "w2", ["work"])
+    assert task["_id"] == task_id and task["lease_owner"] == "w2" and task["attempts"] == 2
+    assert not task_queue.extend_lease(db, task_id, "w1")
+    assert task_queue.extend_lease(db, task_id, "w2")
+
+
+def test_fail_retries_with_a_delay_then_dead_letters(db):
+    task_id = task_queue.enqueue(db, "work", {}, max_attempts=2)
+
+    task = task_queue.lease(db, "w", ["work"])
+    assert task_queue.fail(db, task, "w", "boom", retry_delay=0) == QUEUED
+    task = task_queue.lease(db, "w", ["work"])
+    assert task_queue.fail(db, task, "w", "boom again") == DEAD
+
+    stored = db[QUEUE_COLLECTION].find_one({"_id": task_id})
+    assert stored["status"] == DEAD and stored["last_error"] == "boom again"
+    assert task_queue.requeue_dead(db, "work") == 1
+    assert task_queue.lease(db, "w", ["work"])["attempts"] == 1
+
+
+def test_expired_last_attempt_is_dead_lettered(db):
+    task_id = task_queue.enqueue(db, "work", {}, max_attempts=1)
+    task_queue.lease(db, "w1", ["work"], visibility_timeout=-1)
+
+    assert task_queue.lease(db, "w2", ["work"]) is None
+    assert db[QUEUE_COLLECTION].find_one({"_id": task_id})["status"] == DEAD
+
+
+def test_run_worker_stores_results_and_failures(db):
+    done_id = task_queue.enqueue(db, "work", {"value": 2})
+    failed_id = task_queue.enqueue(db, "work", {"value": 0}, max_attempts=1)
+
+    processed = task_queue.run_worker(db, {"work": lambda db, payload: {"inverse": 1 / payload["value"]}}, max_tasks=2)
+
+    assert processed == 2
+    assert db[QUEUE_COLLECTION].find_one({"_id": done_id})["result"] == {"inverse": 0.5}
+    assert db[QUEUE_COLLECTION].find_one({"_id": failed_id})["status"] == DEAD
+    assert task_queue.queue_stats(db) == {("work", DONE): 1, ("work", DEAD): 1}
+
+
+def test_leased_task_is_not_available_before_it_expires(db):
+    task_queue.enqueue(db, "work", {})
+    task = task_queue.lease(db, "w1", ["work"])
+
+    assert task["status"] == LEASED
+    # pymongo and mongomock return the stored UTC times without a time zone
+    assert task["lease_expires_at"] > datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=500)
+    assert task_queue.lease(db, "w2", ["work"]) is None
+
+
+def test_heartbeat_keeps_the_lease_of_a_long_task(db):
+    task_id = task_queue.enqueue(db, "work", {})
+    stolen = []
+
+    def handler(db, payload):
+        # Longer than the visibility timeout, another worker must not get the task meanwhile
+        for _ in range(4):
+            time.sleep(0.1)
+            stolen.append(task_queue.lease(db, "w2", ["work"], visibility_timeout=0.15))
+        return {"ok": True}
+
+    assert task_queue.run_worker(db, {"work": handler}, worker_id="w1", visibility_timeout=0.15, max_tasks=1) == 1
+    assert stolen == [None] * 4
+    assert db[QUEUE_COLLECTION].find_one({"_id": task_id})["status"] == DONE
+
+
+def test_lost_lease_stops_the_handler_without_failing_the_task(db):
+    task_id = task_queue.enqueue(db, "work", {"session_id": "s1"})
+    errors = []
+
+    def handler(db, payload):
+        db[QUEUE_COLLECTION].update_one({"_id": task_id}, {"$set": {"lease_owner": "w2"}})
+        assert task_queue.lease_lost_event().wait(2)
+        # The next LLM call of the task is cancelled before it is made
+        try:
+            llm_client.chat("llama3.2", [{"role": "user", "content": "Hi"}], site="test")
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    task_queue.run_worker(db, {"work": worker.as_batch(handler)}, worker_id="w1", visibility_timeout=0.15, max_tasks=1)
+
+    assert [type(error) for error in errors] == [llm_client.LLMCallCancelled]
+    stored = db[QUEUE_COLLECTION].find_one({"_id": task_id})
+    assert stored["status"] == LEASED and stored["lease_owner"] == "w2" and stored["last_error"] is None
+    assert task_queue.lease_lost_event() is None
+
+
+def test_cancelled_context_makes_no_llm_call():
+    cancelled = threading.Event()
+    cancelled.set()
+
+    with llm_client.llm_context("s1", cancelled=cancelled):
+        with pytest.raises(llm_client.LLMCallCancelled):
+            llm_client.chat("llama3.2", [], site="test")
+    assert llm_client._cancelled.get() is None
@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+import test_case_run
+import worker
+from metrics import CACHE_REQUESTS
+from task_queue import QUEUE_COLLECTION, QUEUED, lease
+from test_case_run import (
+    DONE, FAILED, FINISHED, INCOMPLETE, PENDING, RUNNING, checkpoint_test_case, claim_test_case_run, fetch_test_case_run, finish_test_case_run, is_resumable, open_scenarios, run_test_cases, start_test_case_run,
+)
+
+SCENARIOS = [{"ScenarioID": f"S{index}", "Title": f"Scenario {index}"} for index in range(3)]
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["test_case_run_test"]
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """ Replaces the LLM call, scenarios whose id is in the failing set raise. """
+    failing = set()
+    calls = []
+
+    def generate_test_case(model, combined_prompt, max_retries=3):
+        scenario_id = next(scenario["ScenarioID"] for scenario in SCENARIOS if f"ScenarioID: {scenario['ScenarioID']}\n" in combined_prompt)
+        calls.append(scenario_id)
+        if scenario_id in failing:
+            raise ValueError("invalid JSON")
+        return {"TestCases": [{"TestCaseID": "TC1", "Title": f"Case of {scenario_id}"}]}
+
+    monkeypatch.setattr(test_case_run, "generate_test_case", generate_test_case)
+    # mongomock does not support the bulk_write of the duplicate index, it is tested in test_duplicate_index.py
+    monkeypatch.setattr(worker, "index_test_cases", lambda db, session_id, process_title, groups: len(groups))
+    return failing, calls
+
+
+def _start(db, background=False, model="llama3.2"):
+    return start_test_case_run(db, "s1", SCENARIOS, model, "Main prompt", {"Positive": "Write positive cases."}, background=background)
+
+
+def test_run_checkpoints_every_scenario_and_finishes(db, generated):
+    _, calls = generated
+    run = _start(db)
+
+    groups = run_test_cases(db, "s1", run)
+
+    assert calls == ["S0", "S1", "S2"]
+    assert [group["status"] for group in groups] == [DONE] * 3
+    stored_run, _, stored_groups = fetch_test_case_run(db, "s1")
+    assert stored_run["status"] == FINISHED and stored_run["lease_until"] is None
+    assert stored_groups == groups
+
+
+def test_failed_scenarios_stay_open_and_are_resumed(db, generated):
+    failing, calls = generated
+    failing.add("S1")
+    run = _start(db)
+
+    groups = run_test_cases(db, "s1", run)
+    assert open_scenarios(groups) == [1]
+    stored_run, _, stored_groups = fetch_test_case_run(db, "s1")
+    assert stored_run["status"] == INCOMPLETE
+    assert is_resumable(stored_run, stored_groups)
+
+    failing.clear()
+    resumed = claim_test_case_run(db, "s1", run["run_id"])
+    assert resumed["run_id"] != run["run_id"] and resumed["status"] == RUNNING
+    run_test_cases(db, "s1", resumed)
+
+    assert calls == ["S0", "S1", "S2", "S1"]
+    assert fetch_test_case_run(db, "s1")[0]["status"] == FINISHED
+
+
+def test_unchanged_scenarios_are_reused_by_a_new_run(db, generated):
+    _, calls = generated
+    run_test_cases(db, "s1", _start(db))
+
+    hits = CACHE_REQUESTS._values.get(("test_case_reuse", "hit"), 0)
+    run = _start(db)
+    assert run["reused"] == 3
+    assert CACHE_REQUESTS._values[("test_case_reuse", "hit")] == hits + 3
+    assert open_scenarios(fetch_test_case_run(db, "s1")[2]) == []
+    run = _start(db, model="other")
+    assert run["reused"] == 0
+    assert calls == ["S0", "S1", "S2"]
+
+
+def test_a_leased_run_can_only_be_claimed_once(db, generated):
+    run = _start(db)
+    stored_run, _, groups = fetch_test_case_run(db, "s1")
+
+    # The run is leased to the rerun which started it
+    assert not is_resumable(stored_run, groups)
+    assert claim_test_case_run(db, "s1", run["run_id"]) is None
+
+    db["sessions"].update_one({"session_id": "s1"}, {"$set": {"test_case_run.lease_until": datetime.now() - timedelta(seconds=1)}})
+    assert is_resumable(fetch_test_case_run(db, "s1")[0], groups)
+    claimed = claim_test_case_run(db, "s1", run["run_id"])
+    assert claimed is not None
+    # A second tab still holds the old run id
+    assert claim_test_case_run(db, "s1", run["run_id"]) is None
+
+    # The previous holder can neither checkpoint nor start generating
+    assert not checkpoint_test_case(db, "s1", run["run_id"], 0, {"status": DONE})
+    with pytest.raises(test_case_run.TestCaseRunReplaced):
+        run_test_cases(db, "s1", run)
+
+
+def test_a_replaced_run_stops_generating(db, generated):
+    _, calls = generated
+    run = _start(db)
+    newer = {}
+
+    def on_result(index, entry):
+        if not newer:
+            newer.update(_start(db, model="other"))
+
+    with pytest.raises(test_case_run.TestCaseRunReplaced):
+        run_test_cases(db, "s1", run, on_result=on_result)
+    assert calls == ["S0", "S1"]
+    assert fetch_test_case_run(db, "s1")[0]["run_id"] == newer["run_id"]
+
+
+def test_finish_ignores_replaced_runs(db):
+    run = _start(db)
+    _start(db)
+
+    assert finish_test_case_run(db, "s1", run["run_id"]) is None
+
+
+def test_background_run_is_finished_by_its_last_task(db, generated):
+    task_ids = worker.enqueue_test_case_generation(db, "s1", "Process", SCENARIOS, "llama3.2", "Main prompt", {"Positive": "Write positive cases."})
+    assert len(task_ids) == 3
+
+    for _ in task_ids:
+        task = lease(db, "w", [worker.GENERATE_TEST_CASES])
+        assert fetch_test_case_run(db, "s1")[0]["status"] == RUNNING
+        worker.handle_generate_test_cases(db, task["payload"])
+        db[QUEUE_COLLECTION].update_one({"_id": task["_id"]}, {"$set": {"status": "done"}})
+
+    assert fetch_test_case_run(db, "s1")[0]["status"] == FINISHED
+
+
+def test_dead_lettered_background_run_is_settled_and_resumed(db, generated):
+    failing, calls = generated
+    failing.add("S2")
+    worker.enqueue_test_case_generation(db, "s1", "Process", SCENARIOS, "llama3.2", "Main prompt", {})
+    for _ in range(3):
+        task = lease(db, "w", [worker.GENERATE_TEST_CASES])
+        try:
+            worker.handle_generate_test_cases(db, task["payload"])
+        except RuntimeError:
+            status = "dead"
+        else:
+            status = "done"
+        db[QUEUE_COLLECTION].update_one({"_id": task["_id"]}, {"$set": {"status": status}})
+
+    run, _, groups = fetch_test_case_run(db, "s1")
+    assert run["status"] == RUNNING and groups[2]["status"] == FAILED
+    assert not is_resumable(run, groups)
+    assert worker.settle_background_run(db, "s1", run["run_id"]) == INCOMPLETE
+
+    failing.clear()
+    task_ids = worker.resume_background_run(db, "s1", "Process", run["run_id"])
+    assert len(task_ids) == 1
+    assert worker.resume_background_run(db, "s1", "Process", run["run_id"]) is None
+    task = db[QUEUE_COLLECTION].find_one({"_id": task_ids[0]})
+    assert task["status"] == QUEUED and task["payload"]["index"] == 2
+
+    # The task which is handled does not keep its own run running
+    worker.handle_generate_test_cases(db, task["payload"])
+    assert fetch_test_case_run(db, "s1")[0]["status"] == FINISHED
+    assert calls.count("S2") == 2
+
+
+def test_pending_entries_are_open():
+    assert open_scenarios([{"status": DONE}, {"status": PENDING}, {"status": FAILED}, {}]) == [1, 2]